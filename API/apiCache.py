@@ -0,0 +1,181 @@
+"""
+In-process caches shared by the API query functions.
+
+Snapshots computed from the fact table are keyed on the filter set plus the
+current data version, so an ETL load invalidates them without explicit purges.
+"""
+
+import base64
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+
+def estimate_nbytes(value) -> int:
+    """
+    Rough memory footprint of a cached value.
+    NumPy arrays report their buffer size; containers are summed recursively.
+    """
+    if isinstance(value, np.ndarray):
+        if value.dtype == object:
+            return int(value.nbytes + sum(len(str(v)) + 49 for v in value))
+        return int(value.nbytes)
+    if isinstance(value, dict):
+        return sum(estimate_nbytes(v) for v in value.values()) + 64 * len(value)
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_nbytes(v) for v in value) + 8 * len(value)
+    if isinstance(value, (str, bytes)):
+        return len(value) + 49
+    return 64
+
+
+def encode_cursor(payload: dict) -> str:
+    """Opaque, URL-safe keyset cursor for paginated snapshot views."""
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str | None) -> dict | None:
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return payload if isinstance(payload, dict) else None
+    except Exception:
+        return None
+
+
+CACHES: dict = {}
+
+
+class SnapshotCache:
+    """
+    Thread-safe LRU cache bounded by total bytes and entry age.
+
+    Entries are evicted least-recently-used first once `max_bytes` is exceeded,
+    and treated as missing once older than `ttl_seconds` (0 disables expiry).
+    Named caches are listed in CACHES so their hit ratios can be exported.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, ttl_seconds: float = 0, name: str | None = None):
+        self.max_bytes = int(max_bytes)
+        self.ttl_seconds = float(ttl_seconds)
+        self._entries: OrderedDict = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._key_locks: dict = {}
+        self.hits = 0
+        self.misses = 0
+        if name:
+            CACHES[name] = self
+
+    def get(self, key, stale_ok: bool = False):
+        """Cached value or None; `stale_ok` also returns (and keeps) expired entries."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, nbytes, created_at = entry
+            if self.ttl_seconds and time.monotonic() - created_at > self.ttl_seconds and not stale_ok:
+                del self._entries[key]
+                self._bytes -= nbytes
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, nbytes: int | None = None):
+        size = int(nbytes if nbytes is not None else estimate_nbytes(value))
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            if size > self.max_bytes:
+                return value
+            self._entries[key] = (value, size, time.monotonic())
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+        return value
+
+    def get_or_build(self, key, builder):
+        """
+        Return the cached value for `key`, building it with `builder()` on a miss.
+        Concurrent misses on the same key wait for a single build.
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            value = self.get(key)
+            if value is None:
+                value = self.put(key, builder())
+        with self._lock:
+            self._key_locks.pop(key, None)
+        return value
+
+    def invalidate(self, predicate=None):
+        with self._lock:
+            if predicate is None:
+                self._entries.clear()
+                self._bytes = 0
+                return
+            for key in [k for k in self._entries if predicate(k)]:
+                self._bytes -= self._entries.pop(key)[1]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "maxBytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+_data_version_cache = SnapshotCache(max_bytes=1024 * 1024, ttl_seconds=60, name="data_version")
+
+
+def _table_stats(client, table_name: str) -> tuple:
+    """
+    Latest date and row count of the fact table.
+    Both come from part metadata in MergeTree, so this does not scan the table.
+    Cached for a minute so hot endpoints do not issue it on every request.
+    """
+
+    def build():
+        latest_date, row_count = client.query(
+            f"SELECT max(tarih), count() FROM {table_name}"
+        ).first_row
+        return (latest_date, int(row_count or 0))
+
+    return _data_version_cache.get_or_build(table_name, build)
+
+
+def get_data_version(client, table_name: str = "demoVerileri") -> str:
+    """Cheap fingerprint of the fact table contents (latest date + row count)."""
+    latest_date, row_count = _table_stats(client, table_name)
+    return f"{latest_date}:{row_count}"
+
+
+def get_latest_date(client, table_name: str = "demoVerileri") -> date:
+    """Latest loaded `tarih`; falls back to yesterday on an empty table."""
+    latest_date = _table_stats(client, table_name)[0]
+    if isinstance(latest_date, datetime):
+        return latest_date.date()
+    if isinstance(latest_date, date) and latest_date.year > 1970:
+        return latest_date
+    return date.today() - timedelta(days=1)
@@ -0,0 +1,201 @@
+"""
+Structured, sampled, non-blocking logging for the API.
+
+Records under the "api" logger go through a bounded queue to one background
+thread, which does all formatting (JSON, one object per line) and the stdout
+write. The request thread only builds a LogRecord and enqueues it; when the
+queue is full, records are dropped and counted instead of blocking.
+
+Responses are logged as size summaries (type, key count, list lengths), not
+bodies. Per-route sampling rates and debug toggles can be changed at runtime
+(/api/_debug/logging in main.py); a route in debug mode also logs the full
+payload, serialized on the background thread.
+
+    python apiLogging.py    # benchmark: payload print/json.dumps vs summaries
+"""
+
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))
+# Largest number of list lengths reported in a payload summary.
+SUMMARY_MAX_KEYS = 20
+
+_RESERVED = set(vars(logging.makeLogRecord({})).keys()) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        fields = getattr(record, "fields", None)
+        if isinstance(fields, dict):
+            entry.update(fields)
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and key != "fields" and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str, separators=(",", ":"))
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Enqueue without formatting; drop (and count) records when the queue is full."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Formatting happens on the listener thread (see module docstring).
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogControl:
+    """Runtime sampling rate and debug flag per route (route template, e.g. /api/stores)."""
+
+    def __init__(self, default_rate: float = 1.0):
+        self.default_rate = float(default_rate)
+        self.rates: dict[str, float] = {}
+        self.debug_routes: set[str] = set()
+
+    def sampled(self, route: str | None) -> bool:
+        rate = self.rates.get(route, self.default_rate) if route else self.default_rate
+        return rate >= 1.0 or (rate > 0.0 and random.random() < rate)
+
+    def debug(self, route: str | None) -> bool:
+        return route in self.debug_routes
+
+    def update(self, route: str | None = None, rate: float | None = None, debug: bool | None = None):
+        if rate is not None:
+            rate = min(max(float(rate), 0.0), 1.0)
+            if route:
+                self.rates[route] = rate
+            else:
+                self.default_rate = rate
+        if route and debug is not None:
+            (self.debug_routes.add if debug else self.debug_routes.discard)(route)
+
+    def snapshot(self) -> dict:
+        return {
+            "defaultRate": self.default_rate,
+            "routeRates": dict(sorted(self.rates.items())),
+            "debugRoutes": sorted(self.debug_routes),
+            "droppedRecords": _handler.dropped if _handler is not None else 0,
+        }
+
+
+log_control = LogControl(LOG_SAMPLE_RATE)
+_handler: DroppingQueueHandler | None = None
+_listener: logging.handlers.QueueListener | None = None
+_setup_lock = threading.Lock()
+
+
+def setup_logging(stream=None) -> logging.Logger:
+    """Attach the queue handler to the "api" logger and start the writer thread (idempotent)."""
+    global _handler, _listener
+    with _setup_lock:
+        api_logger = logging.getLogger("api")
+        if _handler is None:
+            log_queue: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+            _handler = DroppingQueueHandler(log_queue)
+            output = logging.StreamHandler(stream or sys.stdout)
+            output.setFormatter(JsonFormatter())
+            _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=False)
+            _listener.start()
+            api_logger.addHandler(_handler)
+            api_logger.setLevel(LOG_LEVEL)
+            api_logger.propagate = False
+        return api_logger
+
+
+def shutdown_logging():
+    """Flush queued records and stop the writer thread."""
+    global _handler, _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            logging.getLogger("api").removeHandler(_handler)
+        _handler = _listener = None
+
+
+def payload_summary(payload) -> dict:
+    """Shape and size hints of a response without serializing it."""
+    if isinstance(payload, dict):
+        lists = {}
+        for key, value in payload.items():
+            if isinstance(value, (list, tuple, dict)) and len(lists) < SUMMARY_MAX_KEYS:
+                lists[str(key)] = len(value)
+        return {"type": "dict", "keys": len(payload), "lengths": lists}
+    if isinstance(payload, (list, tuple)):
+        return {"type": "list", "length": len(payload)}
+    return {"type": type(payload).__name__}
+
+
+def log_payload(logger: logging.Logger, route: str, payload, **fields):
+    """
+    Log a response summary for `route`, subject to its sampling rate.
+    Routes in debug mode also get the full payload (serialized off-thread).
+    """
+    debug = log_control.debug(route)
+    if not debug and not (logger.isEnabledFor(logging.INFO) and log_control.sampled(route)):
+        return
+    record = {"route": route, "payload": payload_summary(payload), **fields}
+    if debug:
+        record["body"] = payload
+    logger.info("response", extra={"fields": record})
+
+
+if __name__ == "__main__":
+    # Compare the old per-call payload logging with summaries on the queue.
+    import io
+
+    stores = {
+        "stores": [
+            {"value": str(i), "label": f"İstanbul - Kadıköy {i}", "region": "marmara", "sqm": 1200 + i}
+            for i in range(5000)
+        ]
+    }
+    n = 200
+    sink = io.StringIO()
+
+    legacy_logger = logging.getLogger("bench.legacy")
+    legacy_logger.addHandler(logging.StreamHandler(sink))
+    legacy_logger.setLevel(logging.INFO)
+    legacy_logger.propagate = False
+    started = time.perf_counter()
+    for _ in range(n):
+        payload = json.dumps(stores, ensure_ascii=False, default=str)
+        legacy_logger.info("DEBUG /api/stores response count=%s payload=%s", len(stores["stores"]), payload)
+        print(f"DEBUG: /api/stores response: {payload}", file=sink, flush=True)
+    legacy_ms = (time.perf_counter() - started) / n * 1000
+
+    api_logger = setup_logging(stream=io.StringIO())
+    started = time.perf_counter()
+    for _ in range(n):
+        log_payload(api_logger, "/api/stores", stores)
+    summary_ms = (time.perf_counter() - started) / n * 1000
+    shutdown_logging()
+
+    print(f"legacy json.dumps + log + print: {legacy_ms:.3f} ms/request")
+    print(f"queued payload summary:          {summary_ms:.3f} ms/request")
@@ -0,0 +1,385 @@
+"""
+Campaign feature store and in-memory nearest-neighbour index.
+
+A campaign is one contiguous run of days of a promotion code in a store
+(gaps-and-islands over daily rows). Each campaign becomes one feature row:
+
+    lift, duration, discount, promotion type flags, sell-through,
+    revenue mix over category groups, start-of-campaign seasonality.
+
+Features are z-scored and weighted; queries compute a weighted Euclidean
+distance over the active dimensions against either an existing campaign or a
+hypothetical one, so only the features the caller knows take part.
+The index is rebuilt when the table's data version changes.
+"""
+
+import threading
+from datetime import date
+
+import numpy as np
+
+from apiCache import get_data_version
+
+# Leading digit of reyonkodu: 1xx dry goods, 2xx fresh, 3xx home & leisure,
+# 4xx electronics, 6xx textile, 8xx other.
+CATEGORY_GROUPS = [1, 2, 3, 4, 6, 8]
+
+TYPE_LABELS = ["KATALOG", "LEAFLET", "GAZETE ILANI", "INTERNET_INDIRIMI", "HYBR"]
+
+FEATURE_NAMES = (
+    ["lift", "duration", "discount"]
+    + [f"type_{label}" for label in TYPE_LABELS]
+    + ["sellThrough"]
+    + [f"mix_{group}" for group in CATEGORY_GROUPS]
+    + ["season_sin", "season_cos"]
+)
+
+FEATURE_WEIGHTS = np.array(
+    [1.5, 1.0, 1.2]
+    + [0.5] * len(TYPE_LABELS)
+    + [1.0]
+    + [0.5] * len(CATEGORY_GROUPS)
+    + [0.7, 0.7],
+    dtype=np.float64,
+)
+
+_F = {name: i for i, name in enumerate(FEATURE_NAMES)}
+
+
+def _category_bits(category_names: dict) -> dict[int, int]:
+    """reyonkodu -> bit position in the per-campaign category mask (one UInt64)."""
+    # Past 64 codes bits are shared: a category filter then over-matches, never drops campaigns.
+    return {int(code): i % 64 for i, code in enumerate(sorted(category_names))}
+
+
+def _category_mask(codes, category_bits: dict[int, int]) -> int:
+    mask = 0
+    for code in codes or []:
+        try:
+            mask |= 1 << category_bits[int(code)]
+        except (KeyError, ValueError, TypeError):
+            continue
+    return mask
+
+
+class CampaignFeatureIndex:
+    def __init__(self, version: str, rows: list, product_categories: dict, category_bits: dict[int, int]):
+        self.version = version
+        self.product_categories = product_categories
+        self.category_bits = category_bits
+
+        n = len(rows)
+        columns = list(zip(*rows)) if rows else [[] for _ in range(20)]
+        (
+            store_code, promo_code, promo_name, region, start_date, end_date,
+            duration, actual_revenue, target_revenue, units, stock_units,
+            discount, flags, stock_out_days, markdown_cost, group_revenue,
+            category_mask,
+        ) = columns[:17]
+
+        self.store_code = np.asarray(store_code, dtype=np.int64)
+        self.promo_code = np.asarray([str(p) for p in promo_code], dtype=str)
+        self.promo_name = np.asarray(promo_name, dtype=object)
+        self.region = np.asarray([str(r or "") for r in region], dtype=str)
+        self.start_date = np.asarray(start_date, dtype="datetime64[D]")
+        self.end_date = np.asarray(end_date, dtype="datetime64[D]")
+        self.category_mask = np.asarray(category_mask, dtype=np.uint64)
+        self.ids = np.asarray(
+            [
+                f"SC-{s}-{p}-{str(d).replace('-', '')}"
+                for s, p, d in zip(self.store_code, self.promo_code, self.start_date)
+            ],
+            dtype=str,
+        )
+        self._row_by_id = {campaign_id: i for i, campaign_id in enumerate(self.ids)}
+
+        def floats(values):
+            return np.asarray([float(v or 0) for v in values], dtype=np.float64)
+
+        self.duration = floats(duration)
+        self.actual_revenue = floats(actual_revenue)
+        self.target_revenue = floats(target_revenue)
+        self.stock_out_days = floats(stock_out_days)
+        self.markdown_cost = floats(markdown_cost)
+        units = floats(units)
+        stock_units = floats(stock_units)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.lift = np.where(
+                self.target_revenue > 0,
+                100 * (self.actual_revenue - self.target_revenue) / self.target_revenue,
+                0.0,
+            )
+            self.sell_through = np.where(
+                stock_units + units > 0, 100 * units / (stock_units + units), 0.0
+            )
+
+        flag_matrix = (
+            np.asarray([list(f) for f in flags], dtype=np.float64)
+            if n else np.zeros((0, len(TYPE_LABELS)))
+        )
+        self.type_label = np.full(n, "DIGER", dtype=object)
+        for j in reversed(range(len(TYPE_LABELS))):
+            self.type_label[flag_matrix[:, j] > 0] = TYPE_LABELS[j]
+
+        group_matrix = (
+            np.asarray([list(g) for g in group_revenue], dtype=np.float64)
+            if n else np.zeros((0, len(CATEGORY_GROUPS)))
+        )
+        group_total = group_matrix.sum(axis=1, keepdims=True)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mix = np.where(group_total > 0, group_matrix / group_total, 0.0)
+
+        day_of_year = (
+            self.start_date - self.start_date.astype("datetime64[Y]")
+        ).astype(np.float64)
+        angle = 2 * np.pi * day_of_year / 365.25
+
+        features = np.column_stack(
+            [self.lift, self.duration, floats(discount), flag_matrix, self.sell_through, mix,
+             np.sin(angle), np.cos(angle)]
+        ) if n else np.zeros((0, len(FEATURE_NAMES)))
+
+        self.mean = features.mean(axis=0) if n else np.zeros(len(FEATURE_NAMES))
+        std = features.std(axis=0) if n else np.ones(len(FEATURE_NAMES))
+        self.std = np.where(std > 0, std, 1.0)
+        self.z = ((features - self.mean) / self.std).astype(np.float32)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def scope_mask(
+        self,
+        store_codes: list[int] | None = None,
+        regions: list[str] | None = None,
+        category_codes: list[int] | None = None,
+        product_codes: list[str] | None = None,
+        promotion_type: str | None = None,
+    ) -> np.ndarray:
+        mask = np.ones(len(self), dtype=bool)
+        if store_codes:
+            mask &= np.isin(self.store_code, np.asarray(store_codes, dtype=np.int64))
+        if regions:
+            mask &= np.isin(self.region, [str(r).lower() for r in regions])
+        category_bits = _category_mask(category_codes, self.category_bits)
+        if product_codes:
+            product_bits = 0
+            for product in product_codes:
+                product_bits |= self.product_categories.get(str(product), 0)
+            category_bits = (category_bits & product_bits) if category_bits else product_bits
+            if not category_bits:
+                return np.zeros(len(self), dtype=bool)
+        if category_bits:
+            mask &= (self.category_mask & np.uint64(category_bits)) != 0
+        if promotion_type:
+            mask &= self.type_label == promotion_type
+        return mask
+
+    def target_vector(self, campaign_id: str | None = None, hypothetical: dict | None = None,
+                      scope: np.ndarray | None = None):
+        """
+        Return (z-scored target vector, active dimension mask, excluded row).
+        With neither an id nor hypothetical features, the target is the scope
+        centroid, which mirrors the previous "closest to the average" ranking.
+        """
+        active = np.ones(len(FEATURE_NAMES), dtype=bool)
+        if campaign_id is not None:
+            row = self._row_by_id.get(campaign_id)
+            if row is None:
+                raise KeyError(campaign_id)
+            return self.z[row].astype(np.float64), active, row
+
+        if not hypothetical:
+            rows = self.z[scope] if scope is not None else self.z
+            centroid = rows.mean(axis=0) if len(rows) else np.zeros(len(FEATURE_NAMES))
+            return centroid.astype(np.float64), active, None
+
+        raw = self.mean.copy()
+        active[:] = False
+
+        def set_feature(name: str, value: float):
+            raw[_F[name]] = float(value)
+            active[_F[name]] = True
+
+        for key, name in (("lift", "lift"), ("durationDays", "duration"),
+                          ("discount", "discount"), ("sellThrough", "sellThrough")):
+            if hypothetical.get(key) is not None:
+                set_feature(name, hypothetical[key])
+
+        promotion_type = hypothetical.get("promotionType")
+        if promotion_type:
+            for label in TYPE_LABELS:
+                set_feature(f"type_{label}", 1.0 if label == promotion_type else 0.0)
+
+        category_codes = [int(c) for c in hypothetical.get("categoryCodes") or []]
+        groups = [c // 100 for c in category_codes if c // 100 in CATEGORY_GROUPS]
+        if groups:
+            for group in CATEGORY_GROUPS:
+                set_feature(f"mix_{group}", groups.count(group) / len(groups))
+
+        start = hypothetical.get("startDate")
+        if start:
+            start_day = date.fromisoformat(str(start))
+            angle = 2 * np.pi * (start_day.timetuple().tm_yday - 1) / 365.25
+            set_feature("season_sin", np.sin(angle))
+            set_feature("season_cos", np.cos(angle))
+
+        if not active.any():
+            active[:] = True
+        return (raw - self.mean) / self.std, active, None
+
+    def nearest(self, target: np.ndarray, active: np.ndarray, scope: np.ndarray,
+                k: int = 5, exclude: int | None = None):
+        """Top-k rows in `scope` by weighted distance; returns (rows, scores)."""
+        candidates = np.flatnonzero(scope)
+        if exclude is not None:
+            candidates = candidates[candidates != exclude]
+        if candidates.size == 0:
+            return candidates, np.zeros(0)
+
+        weights = FEATURE_WEIGHTS[active]
+        diff = self.z[candidates][:, active] - target[active].astype(np.float32)
+        dist2 = (diff * diff) @ weights.astype(np.float32)
+
+        k = min(int(k), candidates.size)
+        top = np.argpartition(dist2, k - 1)[:k]
+        top = top[np.argsort(dist2[top], kind="stable")]
+        scores = 100.0 * np.exp(-0.5 * dist2[top] / weights.sum())
+        return candidates[top], scores
+
+    def describe(self, row: int, score: float) -> dict:
+        start = self.start_date[row].astype(object)
+        return {
+            "id": str(self.ids[row]),
+            "name": self.promo_name[row],
+            "date": start.strftime("%b %Y"),
+            "startDate": start.isoformat(),
+            "endDate": self.end_date[row].astype(object).isoformat(),
+            "storeCode": int(self.store_code[row]),
+            "promoCode": str(self.promo_code[row]),
+            "type": self.type_label[row],
+            "lift": round(float(self.lift[row]), 0),
+            "stockOutDays": int(self.stock_out_days[row]),
+            "targetRevenue": round(float(self.target_revenue[row]), 0),
+            "actualRevenue": round(float(self.actual_revenue[row]), 0),
+            "actualStockDays": int(self.duration[row]),
+            "plannedStockDays": int(self.duration[row]),
+            "sellThrough": round(float(self.sell_through[row]), 0),
+            "markdownCost": round(float(self.markdown_cost[row]), 0),
+            "similarityScore": round(float(score), 1),
+        }
+
+
+def load_campaign_features(client, table_name: str, category_bits: dict[int, int]) -> tuple[list, dict]:
+    """One row per store x promotion code x contiguous period, plus product -> category bits."""
+
+    codes_sql = ", ".join(str(c) for c in category_bits) or "0"
+    positions_sql = ", ".join(str(b) for b in category_bits.values()) or "64"
+    group_sums_sql = ",\n            ".join(
+        f"sumIf(satismiktari * satisFiyati, intDiv(toUInt32OrZero(toString(reyonkodu)), 100) = {g}) AS rev_g{g}"
+        for g in CATEGORY_GROUPS
+    )
+    group_totals_sql = ", ".join(f"sum(rev_g{g})" for g in CATEGORY_GROUPS)
+
+    query = f"""
+    WITH daily AS (
+        SELECT
+            toInt64(magazakodu)                                AS store_code,
+            toString(aktifPromosyonKodu)                       AS promo_code,
+            toDate(tarih)                                      AS d,
+            any(aktifPromosyonAdi)                             AS promo_name,
+            any(lowerUTF8(cografi_bolge))                      AS region_value,
+            sum(satismiktari * satisFiyati)                    AS actual_rev,
+            sum(roll_mean_7 * satisFiyati)                     AS target_rev,
+            sum(satismiktari)                                  AS units_sold,
+            sum(stok)                                          AS stock_units,
+            avg(indirimYuzdesi)                                AS discount_pct,
+            max(KATALOG)                                       AS f_katalog,
+            max(LEAFLET)                                       AS f_leaflet,
+            max(`GAZETE ILANI`)                                AS f_gazete,
+            max(`Hybris % Kampanya`)                           AS f_hybris,
+            max(HYBR)                                          AS f_hybr,
+            max(if(stok_out = 1, 1, 0))                        AS stock_out_flag,
+            sum((roll_mean_7 - satismiktari) * satisFiyati)    AS markdown_val,
+            {group_sums_sql},
+            groupBitOr(
+                if(
+                    has([{codes_sql}], toUInt32OrZero(toString(reyonkodu))),
+                    toUInt64(bitShiftLeft(
+                        toUInt64(1),
+                        transform(toUInt32OrZero(toString(reyonkodu)), [{codes_sql}], [{positions_sql}], 0)
+                    )),
+                    toUInt64(0)
+                )
+            )                                                  AS cat_bits
+        FROM {table_name}
+        WHERE aktifPromosyonKodu > 0
+          AND toString(aktifPromosyonKodu) != '17'
+          AND aktifPromosyonAdi != 'Tayin edilmedi'
+        GROUP BY store_code, promo_code, d
+    ),
+    sequenced AS (
+        SELECT
+            *,
+            toInt32(toRelativeDayNum(d)) - toInt32(
+                row_number() OVER (PARTITION BY store_code, promo_code ORDER BY d)
+            ) AS period_group
+        FROM daily
+    )
+    SELECT
+        store_code,
+        promo_code,
+        any(promo_name),
+        any(region_value),
+        min(d),
+        max(d),
+        count(),
+        sum(actual_rev),
+        sum(target_rev),
+        sum(units_sold),
+        sum(stock_units),
+        avg(discount_pct),
+        [max(f_katalog), max(f_leaflet), max(f_gazete), max(f_hybris), max(f_hybr)],
+        sum(stock_out_flag),
+        sum(markdown_val),
+        [{group_totals_sql}],
+        groupBitOr(cat_bits)
+    FROM sequenced
+    GROUP BY store_code, promo_code, period_group
+    """
+
+    rows = client.query(query).result_rows
+
+    product_query = f"""
+    SELECT
+        toString(urunkodu),
+        groupUniqArray(toUInt32OrZero(toString(reyonkodu)))
+    FROM {table_name}
+    GROUP BY urunkodu
+    """
+    product_categories = {
+        str(product): _category_mask(codes, category_bits)
+        for product, codes in client.query(product_query).result_rows
+    }
+    return rows, product_categories
+
+
+_indexes: dict[str, CampaignFeatureIndex] = {}
+_build_lock = threading.Lock()
+
+
+def get_campaign_index(client, table_name: str, category_names: dict) -> CampaignFeatureIndex:
+    """Return the index for the current data version, rebuilding it once per change."""
+    version = get_data_version(client, table_name)
+    index = _indexes.get(table_name)
+    if index is not None and index.version == version:
+        return index
+
+    with _build_lock:
+        index = _indexes.get(table_name)
+        if index is None or index.version != version:
+            category_bits = _category_bits(category_names)
+            rows, product_categories = load_campaign_features(client, table_name, category_bits)
+            index = CampaignFeatureIndex(version, rows, product_categories, category_bits)
+            _indexes[table_name] = index
+    return index
@@ -0,0 +1,132 @@
+"""
+clickhouse_connect-compatible client over an embedded chdb database.
+
+Lets the API run against a local copy of the fact table, typically one built
+by syntheticData.py (`--chdb PATH`), without a ClickHouse server. main.py
+uses it when CLICKHOUSE_CHDB_PATH is set; the benchmarks use it that way.
+
+Only the surface the API uses is covered: query() with result_rows,
+result_columns, result_set, first_row, column_names and summary;
+query_df(); query_np(); command() and insert_arrow(). Results come back
+through Arrow, so Date is datetime.date, Decimal is Decimal and Nullable is
+None as with clickhouse_connect. Server-side parameter binding is not
+supported, and per-query settings (the query_log tags) are ignored.
+"""
+
+import os
+import tempfile
+import threading
+
+_sessions: dict = {}
+_sessions_lock = threading.Lock()
+
+
+def _session(path: str):
+    # One chdb session per database path for the whole process.
+    with _sessions_lock:
+        db = _sessions.get(path)
+        if db is None:
+            from chdb import session
+
+            db = _sessions[path] = session.Session(path)
+        return db
+
+
+class ChdbResult:
+    """The QueryResult attributes the API reads, over one Arrow table."""
+
+    def __init__(self, table, summary: dict):
+        self._table = table
+        self.summary = summary
+        self.column_names = tuple(table.column_names)
+        self.row_count = table.num_rows
+        self._columns = None
+        self._rows = None
+
+    @property
+    def result_columns(self) -> list:
+        if self._columns is None:
+            self._columns = [column.to_pylist() for column in self._table.columns]
+        return self._columns
+
+    @property
+    def result_rows(self) -> list:
+        if self._rows is None:
+            self._rows = [tuple(row) for row in zip(*self.result_columns)] if self.column_names else []
+        return self._rows
+
+    @property
+    def result_set(self) -> list:
+        return self.result_rows
+
+    @property
+    def first_row(self):
+        rows = self.result_rows
+        return rows[0] if rows else None
+
+    @property
+    def first_item(self):
+        row = self.first_row
+        return dict(zip(self.column_names, row)) if row is not None else None
+
+    @property
+    def named_results(self):
+        return (dict(zip(self.column_names, row)) for row in self.result_rows)
+
+
+class ChdbClient:
+    def __init__(self, path: str):
+        self.path = path
+        self._db = _session(path)
+
+    def _run(self, sql, parameters=None):
+        import pyarrow as pa
+
+        if parameters:
+            raise NotImplementedError("ChdbClient does not bind query parameters")
+        result = self._db.query(str(sql), "Arrow")
+        if result.has_error():
+            raise RuntimeError(result.error_message())
+        data = result.bytes()
+        table = pa.ipc.open_file(pa.BufferReader(data)).read_all() if data else pa.table({})
+        summary = {
+            "read_rows": str(result.storage_rows_read()),
+            "read_bytes": str(result.storage_bytes_read()),
+            "elapsed_ns": str(int(result.elapsed() * 1e9)),
+            "result_rows": str(table.num_rows),
+        }
+        return table, summary
+
+    def query(self, query=None, parameters=None, settings=None, **kwargs) -> ChdbResult:
+        return ChdbResult(*self._run(query, parameters))
+
+    def query_df(self, query=None, parameters=None, settings=None, **kwargs):
+        table, summary = self._run(query, parameters)
+        df = table.to_pandas(date_as_object=False)
+        df.attrs["summary"] = summary
+        return df
+
+    def query_np(self, query=None, parameters=None, settings=None, **kwargs):
+        import numpy as np
+
+        table, _ = self._run(query, parameters)
+        return np.array(list(zip(*(column.to_pylist() for column in table.columns))), dtype=object)
+
+    def command(self, cmd, parameters=None, settings=None, **kwargs):
+        table, _ = self._run(cmd, parameters)
+        if table.num_rows == 0 or table.num_columns == 0:
+            return None
+        row = [column[0].as_py() for column in table.columns]
+        return row[0] if len(row) == 1 else row
+
+    def insert_arrow(self, table_name: str, arrow_table, **kwargs):
+        import pyarrow.parquet as pq
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "insert.parquet")
+            pq.write_table(arrow_table, path, compression="lz4")
+            self._run(f"INSERT INTO {table_name} SELECT * FROM file('{path}', Parquet)")
+
+    def close(self):
+        # The session is shared by every client on the same path.
+        pass
@@ -0,0 +1,460 @@
+"""
+Endpoint benchmarks against the synthetic dataset, with recorded baselines.
+
+For each scale the fact table is generated once with syntheticData into an
+embedded chdb database under --data-dir (reused by later runs), and the app
+is pointed at it through CLICKHOUSE_CHDB_PATH. Every /api/* case then runs
+in-process through the full middleware stack (TestClient). The prediction
+and market search proxies talk to upstreamStub. With --url the same cases
+run against a live server and its data instead.
+
+A case is one route with one filter set (all, region, store, store and
+category, store and product). The filter values are looked up from the API
+itself. Each case runs once cold, which fills the in-process caches, and
+then --repeat times warm. Recorded per case:
+
+    coldMs            first request
+    p50Ms, p95Ms      warm requests
+    queries, rowsRead, bytesRead
+                      ClickHouse work of the cold request (Server-Timing)
+    responseBytes     body size
+
+    python endpointBenchmark.py --scale tiny --save benchmarks/baseline.json
+    python endpointBenchmark.py --scale tiny --baseline benchmarks/baseline.json --threshold 0.25
+    python endpointBenchmark.py --scale small --scale large --routes /api/inventory
+
+With --baseline the exit status is 1 when a case regresses: p50, p95 or
+cold latency, or rows read, exceeds the baseline by more than --threshold
+(relative) and --min-ms (absolute, latencies only), or the status changes
+from 2xx. A case whose 2xx body holds no rows ([] or only empty lists) is
+reported as EMPTY and fails the run, baseline or not: it would time nothing. Latencies only compare within one machine, so keep one baseline
+per machine. Rows read compare anywhere, as long as the data is equally old.
+Many routes look back from today(), so a dataset is regenerated when it no
+longer ends yesterday. Each scale records its dataEnd and dataAgeDays, and a
+scale whose baseline data age differs is refused (reported as a regression)
+rather than compared.
+
+--record DIR also writes every query result as replayClient fixtures under
+DIR/<scale>. --replay DIR then runs the cases from those fixtures with no
+database. That times the Python side of the endpoints alone, or with
+--replay-latency, a slower or faster database. Replay results are keyed
+"<scale>@replay" in the report.
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import re
+import shutil
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+from replayClient import latency_from_env, replay_stats
+
+SCALES = {
+    "tiny": {"stores": 4, "products": 300, "years": 1.0},       # ~0.4M rows, smoke runs
+    "small": {"stores": 8, "products": 5000, "years": 2.0},     # ~29M rows
+    "large": {"stores": 50, "products": 50000, "years": 3.0},   # ~2.7B rows
+}
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks", "data")
+TABLE_NAME = "demoVerileri"
+
+FILTERS = {
+    "all": {},
+    "region": {"regionIds": "{region}"},
+    "store": {"storeIds": "{store}"},
+    "category": {"storeIds": "{store}", "categoryIds": "{category}"},
+    "product": {"storeIds": "{store}", "productIds": "{product}"},
+}
+DASHBOARD = ("all", "region", "store", "category")
+PRODUCT = ("all", "store", "category", "product")
+NONE = ("all",)
+
+# (method, path, params, filter sets, JSON body); "{name}" is filled from discover().
+CASES = [
+    ("GET", "/api/dashboard/metrics", {}, DASHBOARD, None),
+    ("GET", "/api/dashboard/revenue-chart", {}, DASHBOARD, None),
+    ("GET", "/api/dashboard/promotions", {}, DASHBOARD, None),
+    ("GET", "/api/hierarchy", {}, NONE, None),
+    ("GET", "/api/hierarchy/regions", {}, NONE, None),
+    ("GET", "/api/hierarchy/regions/{region}/stores", {}, NONE, None),
+    ("GET", "/api/hierarchy/stores/{storeKey}/categories", {}, NONE, None),
+    ("GET", "/api/hierarchy/stores/{storeKey}/categories/{categoryCode}/products", {"limit": 100}, NONE, None),
+    ("GET", "/api/stores", {}, ("all", "region"), None),
+    ("GET", "/api/categories", {}, ("all", "region", "store"), None),
+    ("GET", "/api/products", {}, DASHBOARD, None),
+    ("GET", "/api/products", {"search": "{search}", "limit": 50}, NONE, None),
+    ("GET", "/api/products/search", {"q": "{search}"}, NONE, None),
+    ("GET", "/api/filters/options", {}, DASHBOARD, None),
+    ("GET", "/api/reyonlar", {}, NONE, None),
+    ("GET", "/api/chart/historical", {}, DASHBOARD, None),
+    ("GET", "/api/alerts/summary", {}, DASHBOARD, None),
+    ("GET", "/api/alerts/inventory", {}, DASHBOARD, None),
+    ("GET", "/api/demand/kpis", {}, DASHBOARD, None),
+    ("GET", "/api/demand/trend-forecast", {}, PRODUCT, None),
+    ("GET", "/api/demand/trend-forecast", {"period": "weekly", "daysPast": 180, "daysFuture": 60}, ("store",), None),
+    ("GET", "/api/demand/year-comparison", {}, PRODUCT, None),
+    ("GET", "/api/demand/monthly-bias", {}, PRODUCT, None),
+    ("GET", "/api/demand/growth-products", {}, ("all", "store", "category"), None),
+    ("GET", "/api/demand/growth-products", {"type": "low"}, ("store",), None),
+    ("GET", "/api/demand/forecast-errors", {}, ("all", "store", "category"), None),
+    ("GET", "/api/forecast/promotion-history", {}, DASHBOARD, None),
+    ("GET", "/api/forecast/promotion-history", {"sortBy": "uplift"}, ("store",), None),
+    ("GET", "/api/forecast/campaign-detail-series", {
+        "storeCode": "{store}", "productCode": "{productCode}", "promoCode": "{promoCode}",
+        "eventDate": "{eventDate}", "campaignStartDate": "{campaignStart}", "campaignEndDate": "{campaignEnd}",
+    }, NONE, None),
+    ("POST", "/api/forecast/campaign-detail-series/batch", {}, NONE, {"campaigns": "{campaigns}"}),
+    ("GET", "/api/forecast/similar-campaigns", {"promotionType": "{promoType}"}, ("all", "store", "product"), None),
+    ("GET", "/api/forecast/calendar", {"month": "{month}", "year": "{year}"}, ("all", "store"), None),
+    ("GET", "/api/forecast/calendar-range", {"fromMonth": "{fromMonth}", "toMonth": "{toMonth}"}, ("all", "store"), None),
+    ("GET", "/api/forecast/product-promotions", {"storeCode": "{store}", "productCode": "{productCode}"}, NONE, None),
+    ("POST", "/api/forecast/predict-demand", {}, NONE, "{predictBody}"),
+    ("POST", "/api/forecast/predict-sweep", {}, NONE, {"base": "{predictBody}", "discounts": [0, 10, 20, 30]}),
+    ("GET", "/api/forecast/quick-estimate", {"productCode": "{productCode}", "storeCode": "{store}", "discount": 15}, NONE, None),
+    ("POST", "/api/market/search", {}, NONE, {"query": "süt", "storeId": "1012"}),
+    ("GET", "/api/inventory/kpis", {}, DASHBOARD, None),
+    ("GET", "/api/inventory/items", {}, DASHBOARD, None),
+    ("GET", "/api/inventory/items", {"status": "Low Stock", "sortBy": "daysOfCoverage", "sortOrder": "asc"}, ("store",), None),
+    ("GET", "/api/inventory/stock-trends", {}, DASHBOARD, None),
+    ("GET", "/api/inventory/stock-trends", {"includeFuture": "true", "futureDays": 14}, ("store",), None),
+    ("GET", "/api/inventory/store-performance", {}, DASHBOARD, None),
+    ("GET", "/api/inventory/store-performance", {"breakdown": "category"}, ("region",), None),
+    ("GET", "/api/inventory/product-store-comparison", {"productId": "{productCode}"}, ("all", "region"), None),
+    ("GET", "/api/health", {}, NONE, None),
+]
+
+_CH_DESC = re.compile(r'\bch;[^,]*desc="(\d+) queries, rows_read=(\d+), bytes_read=(\d+)"')
+
+
+def _fill(template, context: dict):
+    """`template` with "{name}" strings replaced by context values (whole-string placeholders keep their type)."""
+    if isinstance(template, str):
+        whole = re.fullmatch(r"\{(\w+)\}", template)
+        if whole:
+            return context[whole.group(1)]
+        return template.format_map(context)
+    if isinstance(template, dict):
+        return {key: _fill(value, context) for key, value in template.items()}
+    if isinstance(template, list):
+        return [_fill(value, context) for value in template]
+    return template
+
+
+def cases(context: dict, routes: list[str] | None = None) -> list[dict]:
+    """Concrete requests: name, method, path, params, body."""
+    out = []
+    for method, path, params, filter_sets, body in CASES:
+        if routes and not any(r in path for r in routes):
+            continue
+        extra = ",".join(f"{k}={v}" for k, v in params.items() if not str(v).startswith("{"))
+        for filter_set in filter_sets:
+            name = f"{method} {path} [{filter_set}{';' + extra if extra else ''}]"
+            out.append({
+                "name": name,
+                "method": method,
+                "path": _fill(path, context),
+                "params": _fill({**FILTERS[filter_set], **params}, context),
+                "body": _fill(body, context),
+            })
+    return out
+
+
+def discover(http) -> dict:
+    """Filter values for the cases, taken from the API: first region, a store in it, a recent campaign."""
+
+    def get(path, **params):
+        response = http.get(path, params=params)
+        response.raise_for_status()
+        return response.json()
+
+    region = get("/api/hierarchy/regions")["regions"][0]["value"]
+    store_key = get(f"/api/hierarchy/regions/{region}/stores")["stores"][0]["value"]
+    category_code = get(f"/api/hierarchy/stores/{store_key}/categories")["categories"][0]["code"]
+    store = get("/api/stores", regionIds=region)["stores"][0]["value"]
+    # Bare category code, as the filter bar sends it (values are "store_category").
+    category = get("/api/categories", storeIds=store)["categories"][0]["value"].split("_")[-1]
+    campaign = get("/api/forecast/promotion-history", storeIds=store, limit=1)["history"][0]
+    product_label = get("/api/products", storeIds=store, limit=1)["products"][0]["label"]
+    # similar-campaigns filters on the index's type label (KATALOG, ..., DIGER), not the promo code.
+    types = [c["type"] for c in get("/api/forecast/similar-campaigns", storeIds=store, limit=50)["campaigns"]]
+    promo_type = next((t for t in types if t != "DIGER"), types[0] if types else "DIGER")
+
+    event_date = date.fromisoformat(campaign["eventDate"])
+    first_month = (event_date.replace(day=1) - timedelta(days=60)).replace(day=1)
+    predict_body = {
+        "magazaKodu": int(store),
+        "urunKodu": int(campaign["productCode"]),
+        "tarihBaslangic": campaign["campaignStartDate"],
+        "tarihBitis": campaign["campaignEndDate"],
+        "aktifPromosyonKodu": str(campaign["promoCode"]),
+        "istenenIndirim": 15,
+    }
+    return {
+        "region": region,
+        "storeKey": store_key,
+        "categoryCode": category_code,
+        "store": store,
+        "category": category,
+        "product": str(campaign["productCode"]),
+        "productCode": str(campaign["productCode"]),
+        "promoCode": str(campaign["promoCode"]),
+        "promoType": promo_type,
+        "eventDate": campaign["eventDate"],
+        "campaignStart": campaign["campaignStartDate"],
+        "campaignEnd": campaign["campaignEndDate"],
+        "campaigns": [{
+            "storeCode": int(store),
+            "productCode": int(campaign["productCode"]),
+            "promoCode": str(campaign["promoCode"]),
+            "eventDate": campaign["eventDate"],
+            "campaignStartDate": campaign["campaignStartDate"],
+            "campaignEndDate": campaign["campaignEndDate"],
+        }] * 5,
+        "month": event_date.month,
+        "year": event_date.year,
+        "fromMonth": first_month.strftime("%Y-%m"),
+        "toMonth": event_date.strftime("%Y-%m"),
+        "search": product_label.split()[0][:4].lower(),
+        "predictBody": predict_body,
+    }
+
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    # Nearest rank.
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+def _empty(body: bytes) -> bool:
+    """Whether a JSON body carries no rows: [] or an object whose lists are all empty."""
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return False
+    if isinstance(data, list):
+        return not data
+    if isinstance(data, dict):
+        lists = [v for v in data.values() if isinstance(v, list)]
+        return bool(lists) and not any(lists)
+    return False
+
+
+def run_case(http, case: dict, repeat: int) -> dict:
+    samples, statuses = [], []
+    record = {}
+    for i in range(repeat + 1):
+        started = time.perf_counter()
+        response = http.request(case["method"], case["path"], params=case["params"], json=case["body"])
+        body = response.content
+        elapsed = (time.perf_counter() - started) * 1000
+        statuses.append(response.status_code)
+        if i == 0:
+            ch = _CH_DESC.search(response.headers.get("server-timing", ""))
+            record = {
+                "status": response.status_code,
+                "coldMs": round(elapsed, 2),
+                "queries": int(ch.group(1)) if ch else 0,
+                "rowsRead": int(ch.group(2)) if ch else 0,
+                "bytesRead": int(ch.group(3)) if ch else 0,
+                "responseBytes": len(body),
+                "empty": 200 <= response.status_code < 300 and _empty(body),
+            }
+        else:
+            samples.append(elapsed)
+    record["p50Ms"] = round(percentile(samples, 0.50), 2)
+    record["p95Ms"] = round(percentile(samples, 0.95), 2)
+    record["errors"] = sum(1 for s in statuses if s >= 400)
+    return record
+
+
+def run_cases(http, repeat: int, routes: list[str] | None = None, progress=None) -> dict:
+    context = discover(http)
+    results = {}
+    for case in cases(context, routes):
+        results[case["name"]] = run_case(http, case, repeat)
+        if progress:
+            progress(case["name"], results[case["name"]])
+    return results
+
+
+def ensure_dataset(scale: str, data_dir: str = DATA_DIR, regenerate: bool = False, progress=None) -> tuple[str, int]:
+    """
+    chdb database of `scale` under data_dir, generated on first use; (path, rows).
+    The data always ends yesterday, since many queries look back from
+    today(): a copy generated on an earlier day is rebuilt, as with --regenerate.
+    """
+    from syntheticData import SyntheticDataset, load_chdb
+
+    path = os.path.join(data_dir, scale)
+    marker = os.path.join(path, "synthetic.json")
+    settings = SCALES[scale]
+    end = date.today() - timedelta(days=1)
+    if os.path.exists(marker) and not regenerate:
+        with open(marker) as f:
+            meta = json.load(f)
+        if meta.get("settings") == settings and meta.get("end") == end.isoformat():
+            return path, meta["rows"]
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.makedirs(path)
+    days = int(round(365.25 * settings["years"]))
+    start = date.today() - timedelta(days=days)
+    dataset = SyntheticDataset(settings["stores"], settings["products"], settings["years"], start)
+    rows = load_chdb(dataset, path, TABLE_NAME, progress=progress)
+    with open(marker, "w") as f:
+        json.dump({"settings": settings, "rows": rows, "start": start.isoformat(), "end": end.isoformat(),
+                   "createdAt": datetime.now().isoformat(timespec="seconds")}, f)
+    return path, rows
+
+
+def _app_client():
+    """TestClient for main.app with quiet logging and the upstream proxies on a local stub."""
+    from upstreamStub import start_stub_server
+
+    server, _ = start_stub_server(0, delay_ms=20.0)
+    base = f"http://127.0.0.1:{server.server_port}"
+    os.environ.setdefault("PREDICTION_API_URL", f"{base}/predict")
+    os.environ.setdefault("MARKET_SEARCH_API_URL", f"{base}/search")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    from fastapi.testclient import TestClient
+
+    import main
+
+    return main, TestClient(main.app, raise_server_exceptions=False)
+
+
+def run(scales: list[str], repeat: int, routes: list[str] | None = None, url: str | None = None,
+        data_dir: str = DATA_DIR, regenerate: bool = False, record_dir: str | None = None,
+        replay_dir: str | None = None, replay_latency=None, verbose: bool = True) -> dict:
+    def log(message):
+        if verbose:
+            print(message, flush=True)
+
+    def case_line(name, r):
+        log(f"  {name:<90} {r['status']} cold {r['coldMs']:>9.1f}  p50 {r['p50Ms']:>8.1f}  "
+            f"p95 {r['p95Ms']:>8.1f} ms  rows {r['rowsRead']:>11,}  {r['responseBytes']:>9,} B"
+            f"{'  EMPTY' if r.get('empty') else ''}")
+
+    report = {
+        "createdAt": datetime.now().isoformat(timespec="seconds"),
+        "machine": {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()},
+        "repeat": repeat,
+        "scales": {},
+    }
+    if url:
+        import httpx
+
+        with httpx.Client(base_url=url, timeout=600) as http:
+            log(f"{url}")
+            report["scales"]["server"] = {"url": url, "cases": run_cases(http, repeat, routes, case_line)}
+        return report
+
+    main, client = _app_client()
+    with client as http:
+        for scale in scales:
+            main.TABLE_NAME = TABLE_NAME
+            if replay_dir:
+                # Fixtures only, no database; reported under its own key so it is not compared with live runs.
+                main.CLICKHOUSE_REPLAY_DIR = os.path.join(replay_dir, scale)
+                main.CLICKHOUSE_REPLAY_LATENCY = replay_latency
+                log(f"{scale}: replaying {main.CLICKHOUSE_REPLAY_DIR}")
+                cases_result = run_cases(http, repeat, routes, case_line)
+                report["scales"][f"{scale}@replay"] = {
+                    **SCALES[scale], "latency": replay_latency, "cases": cases_result,
+                    "replay": replay_stats(main.CLICKHOUSE_REPLAY_DIR).snapshot(),
+                }
+                continue
+            started = time.perf_counter()
+            path, rows = ensure_dataset(scale, data_dir, regenerate, lambda n: log(f"  generated {n:,} rows"))
+            log(f"{scale}: {rows:,} rows ({time.perf_counter() - started:.1f}s to prepare)")
+            main.CLICKHOUSE_CHDB_PATH = path
+            main.CLICKHOUSE_RECORD_DIR = os.path.join(record_dir, scale) if record_dir else ""
+            data_end = date.today() - timedelta(days=1)
+            report["scales"][scale] = {
+                "rows": rows, **SCALES[scale], "dataEnd": data_end.isoformat(),
+                "dataAgeDays": (date.today() - data_end).days,
+                "cases": run_cases(http, repeat, routes, case_line),
+            }
+    return report
+
+
+def compare(baseline: dict, current: dict, threshold: float = 0.2, min_ms: float = 5.0) -> tuple[list, list]:
+    """(regressions, improvements) as readable lines; cases missing on either side are skipped."""
+    regressions, improvements = [], []
+    for scale, scale_result in current.get("scales", {}).items():
+        base_scale = baseline.get("scales", {}).get(scale, {})
+        if base_scale and base_scale.get("dataAgeDays") != scale_result.get("dataAgeDays"):
+            # today()-relative windows would cover different data.
+            regressions.append(f"{scale}: data age {scale_result.get('dataAgeDays')} days vs "
+                               f"{base_scale.get('dataAgeDays')} in the baseline; not compared, re-save the baseline")
+            continue
+        base_cases = base_scale.get("cases", {})
+        for name, now in scale_result["cases"].items():
+            before = base_cases.get(name)
+            if before is None:
+                continue
+            if 200 <= before["status"] < 300 and not 200 <= now["status"] < 300:
+                regressions.append(f"{scale} {name}: status {before['status']} -> {now['status']}")
+                continue
+            if now.get("empty") and not before.get("empty"):
+                regressions.append(f"{scale} {name}: response is now empty")
+                continue
+            for key, floor in (("p50Ms", min_ms), ("p95Ms", min_ms), ("coldMs", min_ms), ("rowsRead", 0)):
+                old, new = before.get(key, 0), now.get(key, 0)
+                if new > old * (1 + threshold) and new - old > floor:
+                    change = f"+{(new / old - 1) * 100:.0f}%" if old else "new"
+                    regressions.append(f"{scale} {name}: {key} {old:,} -> {new:,} ({change})")
+                elif old > new * (1 + threshold) and old - new > floor:
+                    improvements.append(f"{scale} {name}: {key} {old:,} -> {new:,} (-{(1 - new / old) * 100:.0f}%)")
+    return regressions, improvements
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the /api/* endpoints on synthetic data")
+    parser.add_argument("--scale", action="append", choices=sorted(SCALES), help="Repeatable; default tiny")
+    parser.add_argument("--repeat", type=int, default=20, help="Warm requests per case")
+    parser.add_argument("--routes", action="append", help="Only paths containing this (repeatable)")
+    parser.add_argument("--url", help="Benchmark a running server instead of the in-process app")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--regenerate", action="store_true", help="Rebuild the synthetic data (ends yesterday)")
+    parser.add_argument("--record", metavar="DIR", help="Record query results as fixtures under DIR/<scale>")
+    parser.add_argument("--replay", metavar="DIR", help="Serve queries from fixtures under DIR/<scale>, no database")
+    parser.add_argument("--replay-latency", default="", help="With --replay: 'recorded' or fixed milliseconds")
+    parser.add_argument("--save", metavar="PATH", help="Write the results as the new baseline")
+    parser.add_argument("--out", metavar="PATH", help="Write the results (without replacing the baseline)")
+    parser.add_argument("--baseline", metavar="PATH", help="Compare against this baseline; exit 1 on regression")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed relative slowdown (0.2 = 20%%)")
+    parser.add_argument("--min-ms", type=float, default=5.0, help="Ignore latency changes smaller than this")
+    args = parser.parse_args()
+
+    result = run(args.scale or ["tiny"], args.repeat, args.routes, args.url, args.data_dir, args.regenerate,
+                 args.record, args.replay, latency_from_env(args.replay_latency))
+    for path in (args.save, args.out):
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            with open(path, "w") as f:
+                json.dump(result, f, indent=1, ensure_ascii=False)
+            print(f"wrote {path}")
+
+    empty = [f"{scale} {name}" for scale, scale_result in result["scales"].items()
+             for name, r in scale_result["cases"].items() if r.get("empty")]
+    for line in empty:
+        print(f"EMPTY      {line}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions, improvements = compare(baseline, result, args.threshold, args.min_ms)
+        for line in improvements:
+            print(f"improved   {line}")
+        for line in regressions:
+            print(f"REGRESSED  {line}")
+        print(f"{len(regressions)} regressions, {len(improvements)} improvements vs {args.baseline}")
+        sys.exit(1 if regressions or empty else 0)
+    sys.exit(1 if empty else 0)
@@ -0,0 +1,201 @@
+"""
+In-memory membership index for dependent filter options.
+
+Every distinct (region, store, reyon, product) listing in the fact table is one
+row; each level is stored as dense integer codes (0..n-1) in NumPy arrays.
+For a partial selection, the valid options of a level are the codes present
+in rows that satisfy the selections of every *other* level (faceted
+semantics), counted with a single bincount.
+
+Rows are sorted by store, and a second permutation groups them by product, so
+a store/region or product selection resolves to a few contiguous slices
+(sorted-array postings) instead of a pass over every listing. Remaining
+selections are applied with boolean lookup tables indexed by code.
+
+The index is rebuilt once per data version.
+"""
+
+import threading
+
+import numpy as np
+
+from apiCache import get_data_version
+from productSearch import get_product_search_index
+
+LEVELS = ("region", "store", "category", "product")
+
+
+def _slices(starts: np.ndarray, ends: np.ndarray, selected: np.ndarray, order: np.ndarray | None = None) -> np.ndarray:
+    """Row numbers of the selected groups, given per-group [start, end) offsets."""
+    parts = [np.arange(starts[g], ends[g]) for g in np.flatnonzero(selected)]
+    rows = np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+    return rows if order is None else order[rows]
+
+
+class FilterMembershipIndex:
+    def __init__(self, version: str, listings: dict, store_labels: dict, product_names: dict, category_names: dict):
+        self.version = version
+        self.store_labels = store_labels
+        self.product_names = product_names
+        self.category_names = category_names
+
+        # values[level]: sorted distinct raw values; codes[level]: per-row index into them.
+        self.values = {}
+        self.codes = {}
+        for level in LEVELS:
+            values, codes = np.unique(np.asarray(listings[level]), return_inverse=True)
+            self.values[level] = values
+            self.codes[level] = codes.astype(np.int32)
+
+        by_store = np.lexsort((self.codes["product"], self.codes["category"], self.codes["store"]))
+        for level in LEVELS:
+            self.codes[level] = self.codes[level][by_store]
+        self.size = len(by_store)
+
+        n_stores = len(self.values["store"])
+        self.store_start = np.searchsorted(self.codes["store"], np.arange(n_stores), side="left")
+        self.store_end = np.searchsorted(self.codes["store"], np.arange(n_stores), side="right")
+        self.store_region = self.codes["region"][np.minimum(self.store_start, max(self.size - 1, 0))] \
+            if self.size else np.empty(0, dtype=np.int32)
+
+        n_products = len(self.values["product"])
+        self.product_order = np.argsort(self.codes["product"], kind="stable")
+        sorted_products = self.codes["product"][self.product_order]
+        self.product_start = np.searchsorted(sorted_products, np.arange(n_products), side="left")
+        self.product_end = np.searchsorted(sorted_products, np.arange(n_products), side="right")
+
+        self.totals = {
+            level: np.bincount(self.codes[level], minlength=len(self.values[level]))
+            for level in LEVELS
+        }
+
+    def _lookup(self, level: str, selected) -> np.ndarray | None:
+        """Boolean table over the level's codes, or None when nothing is selected."""
+        if not selected:
+            return None
+        values = self.values[level]
+        wanted = np.asarray(list(selected), dtype=values.dtype)
+        positions = np.searchsorted(values, wanted)
+        in_range = positions < len(values)
+        positions = positions[in_range]
+        positions = positions[values[positions] == wanted[in_range]]
+        lookup = np.zeros(len(values), dtype=bool)
+        lookup[positions] = True
+        return lookup
+
+    def _counts(self, level: str, lookups: dict) -> np.ndarray:
+        active = {other: lut for other, lut in lookups.items() if other != level and lut is not None}
+        if not active:
+            return self.totals[level]
+
+        # Narrow to rows via the most selective posting lists, then mask the rest.
+        if "product" in active:
+            rows = _slices(self.product_start, self.product_end, active.pop("product"), self.product_order)
+        elif "store" in active or "region" in active:
+            stores = np.ones(len(self.values["store"]), dtype=bool)
+            if "store" in active:
+                stores &= active.pop("store")
+            if "region" in active:
+                stores &= active.pop("region")[self.store_region]
+            rows = _slices(self.store_start, self.store_end, stores)
+        else:
+            rows = None
+
+        mask = None
+        for other, lut in active.items():
+            codes = self.codes[other] if rows is None else self.codes[other][rows]
+            mask = lut[codes] if mask is None else mask & lut[codes]
+
+        codes = self.codes[level] if rows is None else self.codes[level][rows]
+        if mask is not None:
+            codes = codes[mask]
+        return np.bincount(codes, minlength=len(self.values[level]))
+
+    def label(self, level: str, value) -> str:
+        if level == "region":
+            return str(value).capitalize()
+        if level == "store":
+            return self.store_labels.get(int(value), str(value))
+        if level == "category":
+            return self.category_names.get(int(value), f"Kategori {value}")
+        return self.product_names.get(int(value), str(value))
+
+    def options(self, selection: dict, product_limit: int = 500) -> dict:
+        """
+        Valid options with listing counts (store x product pairs) per level.
+        `selection` maps level -> iterable of selected raw values.
+        """
+        lookups = {level: self._lookup(level, selection.get(level)) for level in LEVELS}
+
+        result = {}
+        for level in LEVELS:
+            counts = self._counts(level, lookups)
+            present = np.flatnonzero(counts)
+
+            if level == "product" and len(present) > product_limit:
+                # Most widely listed products first when truncating.
+                present = present[np.argsort(-counts[present], kind="stable")[:product_limit]]
+
+            result[level] = {
+                "total": int(np.count_nonzero(counts)),
+                "options": [
+                    {
+                        "value": str(self.values[level][i]),
+                        "label": self.label(level, self.values[level][i]),
+                        "count": int(counts[i]),
+                    }
+                    for i in present
+                ],
+            }
+        return result
+
+
+def load_filter_listings(client, table_name: str) -> tuple[dict, dict]:
+    listing_query = f"""
+        SELECT
+            lowerUTF8(cografi_bolge) AS region,
+            toInt64(magazakodu) AS store,
+            toInt64(reyonkodu) AS category,
+            toInt64(urunkodu) AS product
+        FROM {table_name}
+        GROUP BY region, store, category, product
+    """
+    columns = client.query(listing_query).result_columns or [[], [], [], []]
+    listings = {
+        "region": np.asarray([str(v or "") for v in columns[0]], dtype=str),
+        "store": np.asarray(columns[1], dtype=np.int64),
+        "category": np.asarray(columns[2], dtype=np.int64),
+        "product": np.asarray(columns[3], dtype=np.int64),
+    }
+
+    label_query = f"""
+        SELECT
+            toInt64(magazakodu) AS store,
+            any(concat(toString(bulundugusehir), ' - ', ilce)) AS store_label
+        FROM {table_name}
+        GROUP BY store
+    """
+    store_labels = {int(store): label for store, label in client.query(label_query).result_rows}
+    return listings, store_labels
+
+
+_indexes: dict[str, FilterMembershipIndex] = {}
+_build_lock = threading.Lock()
+
+
+def get_filter_index(client, table_name: str, category_names: dict) -> FilterMembershipIndex:
+    """Return the index for the current data version, rebuilding it once per change."""
+    version = get_data_version(client, table_name)
+    index = _indexes.get(table_name)
+    if index is not None and index.version == version:
+        return index
+
+    with _build_lock:
+        index = _indexes.get(table_name)
+        if index is None or index.version != version:
+            listings, store_labels = load_filter_listings(client, table_name)
+            search_index = get_product_search_index(client, table_name)
+            product_names = dict(zip(search_index.codes.tolist(), search_index.names))
+            index = FilterMembershipIndex(version, listings, store_labels, product_names, category_names)
+            _indexes[table_name] = index
+    return index
@@ -0,0 +1,173 @@
+"""
+Versioned in-memory snapshot of the Region -> Store -> Category -> Product tree.
+
+Built from the latest loaded date (not `yesterday()`, which is empty whenever
+the ETL runs late) and rebuilt once per data version. Rows are kept sorted by
+region, store, category and product so every node is a contiguous slice;
+child-level endpoints return one level at a time with counts, and products are
+paginated.
+"""
+
+import threading
+from itertools import groupby
+
+from apiCache import get_data_version, get_latest_date
+
+
+class HierarchySnapshot:
+    def __init__(self, version: str, as_of, rows: list, category_names: dict):
+        self.version = version
+        self.as_of = as_of
+
+        # (region, store_key, store_label, category_code, product_code, product_label, stock, forecast)
+        self.rows = sorted(rows, key=lambda r: (r[0], r[1], r[3], r[4]))
+        self.category_names = category_names
+
+        self.regions = {}      # region -> (start, end)
+        self.stores = {}       # store_key -> (start, end)
+        self.categories = {}   # (store_key, category_code) -> (start, end)
+        self.region_stores = {}   # region -> [store_key, ...]
+        self.store_categories = {}  # store_key -> [category_code, ...]
+
+        def slices(start, end, key):
+            pos = start
+            for value, group in groupby(self.rows[start:end], key=key):
+                size = sum(1 for _ in group)
+                yield value, pos, pos + size
+                pos += size
+
+        for region, r_start, r_end in slices(0, len(self.rows), lambda r: r[0]):
+            self.regions[region] = (r_start, r_end)
+            self.region_stores[region] = []
+            for store_key, s_start, s_end in slices(r_start, r_end, lambda r: r[1]):
+                self.stores[store_key] = (s_start, s_end)
+                self.region_stores[region].append(store_key)
+                self.store_categories[store_key] = []
+                for category_code, c_start, c_end in slices(s_start, s_end, lambda r: r[3]):
+                    self.categories[(store_key, category_code)] = (c_start, c_end)
+                    self.store_categories[store_key].append(category_code)
+
+    def category_name(self, category_code: int) -> str:
+        return self.category_names.get(int(category_code), f"Kategori {category_code}")
+
+    def region_nodes(self) -> list:
+        return [
+            {
+                "value": region,
+                "label": region.capitalize(),
+                "storeCount": len(self.region_stores[region]),
+                "categoryCount": sum(len(self.store_categories[s]) for s in self.region_stores[region]),
+                "productCount": end - start,
+            }
+            for region, (start, end) in self.regions.items()
+        ]
+
+    def store_nodes(self, region: str) -> list:
+        if region not in self.regions:
+            raise KeyError(region)
+        nodes = []
+        for store_key in self.region_stores[region]:
+            start, end = self.stores[store_key]
+            nodes.append({
+                "value": store_key,
+                "label": self.rows[start][2],
+                "categoryCount": len(self.store_categories[store_key]),
+                "productCount": end - start,
+            })
+        return nodes
+
+    def category_nodes(self, store_key: str) -> list:
+        if store_key not in self.stores:
+            raise KeyError(store_key)
+        nodes = []
+        for category_code in self.store_categories[store_key]:
+            start, end = self.categories[(store_key, category_code)]
+            nodes.append({
+                "value": self.category_name(category_code),
+                "label": self.category_name(category_code),
+                "code": str(category_code),
+                "productCount": end - start,
+            })
+        return nodes
+
+    def product_nodes(self, store_key: str, category_code: int, offset: int = 0, limit: int = 100) -> tuple[list, int]:
+        key = (store_key, int(category_code))
+        if key not in self.categories:
+            raise KeyError(key)
+        start, end = self.categories[key]
+        page = self.rows[start + offset:min(start + offset + limit, end)]
+        return [self._product(r) for r in page], end - start
+
+    @staticmethod
+    def _product(row) -> dict:
+        return {
+            "value": str(row[4]),
+            "label": row[5],
+            "forecastDemand": int(row[7] or 0),
+            "currentStock": int(row[6] or 0),
+        }
+
+    def iter_regions(self):
+        """Region nodes of the full /api/hierarchy tree, built one at a time (for streaming)."""
+        for region in self.regions:
+            stores = []
+            for store_key in self.region_stores[region]:
+                categories = []
+                for category_code in self.store_categories[store_key]:
+                    start, end = self.categories[(store_key, category_code)]
+                    name = self.category_name(category_code)
+                    categories.append({
+                        "value": name,
+                        "label": name,
+                        "products": [self._product(r) for r in self.rows[start:end]],
+                    })
+                stores.append({
+                    "value": store_key,
+                    "label": self.rows[self.stores[store_key][0]][2],
+                    "categories": categories,
+                })
+            yield {"value": region, "label": region.capitalize(), "stores": stores}
+
+
+def load_hierarchy_rows(client, table_name: str, as_of) -> list:
+    query = f"""
+    SELECT
+        lowerUTF8(cografi_bolge) AS region,
+        concat(lowerUTF8(bulundugusehir), '_', lowerUTF8(ilce)) AS store_key,
+        concat(bulundugusehir, ' - ', ilce) AS store_label,
+        toInt64(reyonkodu) AS category,
+        urunkodu AS product_code,
+        any(urunismi) AS product_label,
+        any(stok) AS current_stock,
+        anyLast(roll_mean_14) AS forecast_demand
+    FROM {table_name}
+    WHERE tarih = toDate('{as_of.isoformat()}')
+    GROUP BY
+        region,
+        store_key,
+        store_label,
+        category,
+        product_code
+    """
+    return [tuple(r) for r in client.query(query).result_rows]
+
+
+_snapshots: dict[str, HierarchySnapshot] = {}
+_build_lock = threading.Lock()
+
+
+def get_hierarchy_snapshot(client, table_name: str, category_names: dict) -> HierarchySnapshot:
+    """Return the snapshot for the current data version, rebuilding it once per change."""
+    version = get_data_version(client, table_name)
+    snapshot = _snapshots.get(table_name)
+    if snapshot is not None and snapshot.version == version:
+        return snapshot
+
+    with _build_lock:
+        snapshot = _snapshots.get(table_name)
+        if snapshot is None or snapshot.version != version:
+            as_of = get_latest_date(client, table_name)
+            rows = load_hierarchy_rows(client, table_name, as_of)
+            snapshot = HierarchySnapshot(version, as_of, rows, category_names)
+            _snapshots[table_name] = snapshot
+    return snapshot
@@ -6,27 +6,31 @@ Exposes ClickHouse query functions from omerApi_combined.py as REST endpoints
 from fastapi import FastAPI, Query, HTTPException
 from fastapi import Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
 from typing import List, Optional
 import clickhouse_connect
 import os
 from datetime import date, timedelta
-import json
 import math
-import urllib.request
-import urllib.error
+import asyncio
 import time
+import secrets
 from dotenv import load_dotenv
-import traceback
 import logging
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 # Import all functions from omerApi_combined
 from omerApiYan import (
-    get_regions_hierarchy,
+    iter_regions_hierarchy,
+    get_hierarchy_regions,
+    get_hierarchy_stores,
+    get_hierarchy_categories,
+    get_hierarchy_products,
     get_stores,
     get_categories,
     get_products,
+    search_products,
+    get_filter_options,
     get_reyonlar,
     get_dashboard_metrics,
     get_dashboard_revenue_chart,
@@ -46,7 +50,19 @@ from omerApiYan import (
     get_inventory_items,
     get_similar_campaigns,
     get_forecast_calendar,
+    get_forecast_calendar_range,
 )
+from promotionHistory import get_promotion_history
+from upstreamProxy import UpstreamError, upstream_from_env
+from productSearch import turkish_lower
+from upliftModel import get_uplift_model
+from requestTiming import ServerTimingMiddleware, TimedClient, TimedRoute, current_route, current_timing, record_connect
+from apiMetrics import MetricsMiddleware, metrics, upstream_lines
+from queryRegistry import query_log_stats, registry as query_registry
+from apiLogging import log_control, log_payload, setup_logging, shutdown_logging
+from requestProfiler import ProfilingMiddleware, profiles, summary as profile_summary
+from resultGuard import RESULT_MAX_ROWS, RESULT_STREAM_ROWS, guard_result, result_guard, stream_json
+from replayClient import RecordingClient, ReplayClient, latency_from_env, replay_stats
 
 # Load environment variables
 # 1) API/.env (preferred for backend runtime)
@@ -61,7 +77,10 @@ app = FastAPI(
     description="REST API for inventory forecasting and planning dashboard",
     version="1.0.0",
 )
-logger = logging.getLogger("uvicorn.error")
+# Must be set before any route is declared.
+app.router.route_class = TimedRoute
+# JSON lines written by a background thread (apiLogging); responses are logged as sampled size summaries.
+logger = setup_logging()
 
 @app.get("/healthz")
 def healthz():
@@ -70,7 +89,7 @@ def healthz():
 @app.exception_handler(Exception)
 async def unhandled_exception_handler(request: Request, exc: Exception):
   # Ensure the frontend always receives a JSON error payload (useful in dev).
-  traceback.print_exc()
+  logger.exception("unhandled_exception", extra={"fields": {"path": request.url.path}})
   return JSONResponse(
     status_code=500,
     content={
@@ -113,6 +132,17 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Server-Timing header + one structured timing log line per request.
+SERVER_TIMING_LOG = os.getenv("SERVER_TIMING_LOG", "true").strip().lower() in {"1", "true", "yes", "on"}
+# Metrics sit inside the timing middleware so the matched route is known.
+app.add_middleware(MetricsMiddleware, route_of=current_route)
+# /api/_debug/* and request profiling require a matching X-Debug-Token header; without a token both are off.
+DEBUG_TOKEN = os.getenv("API_DEBUG_TOKEN", "")
+# Opt-in per-request profiler (X-Profile header); also inside the timing middleware for the SQL stats.
+if DEBUG_TOKEN and os.getenv("API_PROFILING", "true").strip().lower() in {"1", "true", "yes", "on"}:
+    app.add_middleware(ProfilingMiddleware, token=DEBUG_TOKEN, timing_of=current_timing)
+app.add_middleware(ServerTimingMiddleware, log=SERVER_TIMING_LOG, logger=logger)
+
 # ClickHouse Cloud connection settings
 CLICKHOUSE_HOST = os.getenv("CLICKHOUSE_HOST", "localhost")
 CLICKHOUSE_PORT = int(os.getenv("CLICKHOUSE_PORT", "8443"))
@@ -129,6 +159,12 @@ CLICKHOUSE_SEND_RECEIVE_TIMEOUT = int(os.getenv("CLICKHOUSE_SEND_RECEIVE_TIMEOUT
 CLICKHOUSE_QUERY_RETRIES = int(os.getenv("CLICKHOUSE_QUERY_RETRIES", "2"))
 CLICKHOUSE_CONNECT_RETRIES = int(os.getenv("CLICKHOUSE_CONNECT_RETRIES", "2"))
 TABLE_NAME = os.getenv("CLICKHOUSE_TABLE_NAME", "demoVerileri")
+# Embedded chdb database instead of the server (local runs and benchmarks, see chdbClient).
+CLICKHOUSE_CHDB_PATH = os.getenv("CLICKHOUSE_CHDB_PATH", "").strip()
+# Record query results into fixtures, or serve them from fixtures without a database (see replayClient).
+CLICKHOUSE_RECORD_DIR = os.getenv("CLICKHOUSE_RECORD_DIR", "").strip()
+CLICKHOUSE_REPLAY_DIR = os.getenv("CLICKHOUSE_REPLAY_DIR", "").strip()
+CLICKHOUSE_REPLAY_LATENCY = latency_from_env(os.getenv("CLICKHOUSE_REPLAY_LATENCY", ""))
 PREDICTION_API_URL = os.getenv("PREDICTION_API_URL", "http://13.53.171.130:8890/predict")
 MARKET_SEARCH_API_URL = os.getenv("MARKET_SEARCH_API_URL", "http://13.53.139.80:8891/search")
 
@@ -156,6 +192,29 @@ class PredictDemandRequest(BaseModel):
     istenenFiyat: Optional[float] = None
 
 
+class CampaignDetailSeriesKey(BaseModel):
+    storeCode: int
+    productCode: int
+    promoCode: str
+    eventDate: str
+    campaignStartDate: Optional[str] = None
+    campaignEndDate: Optional[str] = None
+    windowDaysBefore: int = Field(3, ge=0, le=30)
+    windowDaysAfter: int = Field(3, ge=0, le=30)
+
+
+class CampaignDetailSeriesBatchRequest(BaseModel):
+    campaigns: List[CampaignDetailSeriesKey]
+
+
+class PredictSweepRequest(BaseModel):
+    base: PredictDemandRequest
+    discounts: Optional[List[float]] = None
+    margins: Optional[List[float]] = None
+    prices: Optional[List[float]] = None
+    objective: str = "revenue"   # revenue | profit | demand
+
+
 class MarketSearchRequest(BaseModel):
     query: str
     storeId: str
@@ -164,13 +223,24 @@ class MarketSearchRequest(BaseModel):
     distance: int = 10
 
 
+def _recorded(client):
+    return TimedClient(RecordingClient(client, CLICKHOUSE_RECORD_DIR) if CLICKHOUSE_RECORD_DIR else client)
+
+
 def get_client():
     """Create and return a ClickHouse Cloud client connection"""
+    if CLICKHOUSE_REPLAY_DIR:
+        return TimedClient(ReplayClient(CLICKHOUSE_REPLAY_DIR, latency=CLICKHOUSE_REPLAY_LATENCY))
+    if CLICKHOUSE_CHDB_PATH:
+        from chdbClient import ChdbClient
+
+        return _recorded(ChdbClient(CLICKHOUSE_CHDB_PATH))
     last_error = None
     attempts = max(1, CLICKHOUSE_CONNECT_RETRIES)
 
     for attempt in range(1, attempts + 1):
         try:
+            connect_started = time.perf_counter()
             client = clickhouse_connect.get_client(
                 host=CLICKHOUSE_HOST,
                 port=CLICKHOUSE_PORT,
@@ -181,7 +251,8 @@ def get_client():
                 send_receive_timeout=CLICKHOUSE_SEND_RECEIVE_TIMEOUT,
                 query_retries=CLICKHOUSE_QUERY_RETRIES,
             )
-            return client
+            record_connect(time.perf_counter() - connect_started)
+            return _recorded(client)
         except Exception as e:
             last_error = e
             if attempt < attempts:
@@ -213,7 +284,7 @@ def api_get_dashboard_metrics(
         store_ids=storeIds,
         category_ids=categoryIds,
     )
-    print(f"DEBUG: Dashboard Metrics Response: {result}")
+    log_payload(logger, "/api/dashboard/metrics", result)
     return result
 
 
@@ -232,11 +303,10 @@ def api_get_revenue_chart(
             store_ids=storeIds,
             category_ids=categoryIds,
         )
-        print(f"DEBUG: Revenue Chart Response: {result}")
+        log_payload(logger, "/api/dashboard/revenue-chart", result)
         return result
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        logger.exception("Revenue chart failed")
         raise HTTPException(status_code=500, detail=f"Revenue Chart Error: {str(e)}")
 
 
@@ -259,11 +329,10 @@ def api_get_dashboard_promotions(
             store_ids=storeIds,
             category_ids=categoryIds,
         )
-        print(f"DEBUG: Dashboard Promotions Response: {result}")
+        log_payload(logger, "/api/dashboard/promotions", result)
         return result
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        logger.exception("Dashboard promotions failed")
         raise HTTPException(status_code=500, detail=f"Promotions Error: {str(e)}")
 
 
@@ -273,9 +342,63 @@ def api_get_dashboard_promotions(
 
 @app.get("/api/hierarchy")
 def api_get_regions_hierarchy():
-    """Get full Region -> Store -> Category -> Product hierarchy"""
+    """Get full Region -> Store -> Category -> Product hierarchy (streamed when large)"""
+    client = get_client()
+    product_rows, regions = iter_regions_hierarchy(client, TABLE_NAME)
+    if product_rows > RESULT_STREAM_ROWS:
+        return stream_json("/api/hierarchy", {}, "regions", regions, chunk_rows=1)
+    return {"regions": list(regions)}
+
+
+@app.get("/api/hierarchy/regions")
+def api_get_hierarchy_regions():
+    """Get regions with store/category/product counts"""
+    client = get_client()
+    return get_hierarchy_regions(client, TABLE_NAME)
+
+
+@app.get("/api/hierarchy/regions/{region}/stores")
+def api_get_hierarchy_stores(region: str):
+    """Get stores of a region with category/product counts"""
+    client = get_client()
+    try:
+        return get_hierarchy_stores(client, TABLE_NAME, region=region)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Region not found: {region}")
+
+
+@app.get("/api/hierarchy/stores/{storeKey}/categories")
+def api_get_hierarchy_categories(storeKey: str):
+    """Get categories of a store with product counts"""
     client = get_client()
-    return get_regions_hierarchy(client, TABLE_NAME)
+    try:
+        return get_hierarchy_categories(client, TABLE_NAME, store_key=storeKey)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Store not found: {storeKey}")
+
+
+@app.get("/api/hierarchy/stores/{storeKey}/categories/{categoryCode}/products")
+def api_get_hierarchy_products(
+    storeKey: str,
+    categoryCode: int,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+):
+    """Get a page of products of a store category"""
+    client = get_client()
+    try:
+        return get_hierarchy_products(
+            client, TABLE_NAME,
+            store_key=storeKey,
+            category_code=categoryCode,
+            offset=offset,
+            limit=limit,
+        )
+    except KeyError:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Category {categoryCode} not found in store {storeKey}",
+        )
 
 
 @app.get("/api/stores")
@@ -285,18 +408,7 @@ def api_get_stores(
     """Get flat store list with optional region filter"""
     client = get_client()
     result = get_stores(client, TABLE_NAME, region_ids=regionIds)
-    store_count = len(result.get("stores", [])) if isinstance(result, dict) else 0
-    payload = json.dumps(result, ensure_ascii=False, default=str)
-    logger.info(
-        "DEBUG /api/stores response regionIds=%s count=%s payload=%s",
-        regionIds,
-        store_count,
-        payload,
-    )
-    print(
-        f"DEBUG: /api/stores response (regionIds={regionIds}, count={store_count}): {payload}",
-        flush=True,
-    )
+    log_payload(logger, "/api/stores", result, regionIds=regionIds)
     return result
 
 
@@ -316,14 +428,53 @@ def api_get_products(
     regionIds: Optional[List[str]] = Query(None),
     storeIds: Optional[List[str]] = Query(None),
     categoryIds: Optional[List[str]] = Query(None),
+    search: Optional[str] = Query(None, description="Product name search"),
+    limit: Optional[int] = Query(None, ge=1, le=RESULT_MAX_ROWS, description="Page size; omit for the full list"),
+    cursor: Optional[str] = Query(None, description="nextCursor of the previous page"),
 ):
-    """Get flat product list with optional filters"""
+    """Get flat product list with optional filters (paginated by cursor when `limit` is given)"""
     client = get_client()
-    return get_products(
+    result = get_products(
         client, TABLE_NAME,
         region_ids=regionIds,
         store_ids=storeIds,
         category_ids=categoryIds,
+        search=search,
+        limit=limit,
+        cursor=cursor,
+    )
+    if result["nextCursor"]:
+        result_guard.inc(("/api/products", "paginate"))
+    return guard_result("/api/products", result, "products")
+
+
+@app.get("/api/products/search")
+def api_search_products(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(10, ge=1, le=100),
+):
+    """Typeahead product search (Turkish-aware, ranked)"""
+    client = get_client()
+    return search_products(client, TABLE_NAME, query=q, limit=limit)
+
+
+@app.get("/api/filters/options")
+def api_get_filter_options(
+    regionIds: Optional[List[str]] = Query(None),
+    storeIds: Optional[List[str]] = Query(None),
+    categoryIds: Optional[List[str]] = Query(None),
+    productIds: Optional[List[str]] = Query(None),
+    productLimit: int = Query(500, ge=1, le=50000),
+):
+    """Get valid options and counts for every filter level for a partial selection"""
+    client = get_client()
+    return get_filter_options(
+        client, TABLE_NAME,
+        region_ids=regionIds,
+        store_ids=storeIds,
+        category_ids=categoryIds,
+        product_ids=productIds,
+        product_limit=productLimit,
     )
 
 
@@ -353,11 +504,10 @@ def api_get_historical_chart(
             store_ids=storeIds,
             category_ids=categoryIds,
         )
-        print(f"DEBUG: Historical Chart Data Points: {len(result.get('data', []))}")
+        log_payload(logger, "/api/chart/historical", result)
         return result
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        logger.exception("Historical chart failed")
         raise HTTPException(status_code=500, detail=f"Historical Chart Error: {str(e)}")
 
 
@@ -388,7 +538,7 @@ def api_get_alerts_summary(
         # Frontend expects:
         # { summary: { lowGrowth, highGrowth, forecastErrors, inventory }, totalAlerts }
         if isinstance(raw_data, dict) and "summary" in raw_data:
-            print(f"DEBUG: Alerts Summary Response (new format): {raw_data}")
+            log_payload(logger, "/api/alerts/summary", raw_data)
             return raw_data
 
         low_growth_count = int(
@@ -441,11 +591,10 @@ def api_get_alerts_summary(
             "totalAlerts": int(raw_data.get("total_alerts", 0)),
         }
 
-        print(f"DEBUG: Alerts Summary Response (normalized): {normalized_data}")
+        log_payload(logger, "/api/alerts/summary", normalized_data)
         return normalized_data
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        logger.exception("Alerts summary failed")
         raise HTTPException(status_code=500, detail=f"Alerts Summary Error: {str(e)}")
 
 
@@ -468,7 +617,7 @@ def api_get_inventory_alerts(
             else None
         )
         
-        return get_inventory_alerts(
+        result = get_inventory_alerts(
             client,
             region_ids=regionIds,
             store_ids=s_ids,
@@ -479,9 +628,9 @@ def api_get_inventory_alerts(
             days=days,
             table_name=TABLE_NAME
         )
+        return guard_result("/api/alerts/inventory", result, "alerts")
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        logger.exception("Inventory alerts failed")
         raise HTTPException(status_code=500, detail=f"Inventory Alerts Error: {str(e)}")
 
 
@@ -618,206 +767,36 @@ def api_get_promotion_history(
     regionIds: Optional[List[str]] = Query(None),
     categoryIds: Optional[List[str]] = Query(None),
     limit: int = Query(40, ge=1, le=200),
+    sortBy: str = Query("date", description="date | uplift | accuracy"),
+    sortOrder: str = Query("desc", description="asc | desc"),
+    cursor: Optional[str] = Query(None),
 ):
     """Get promotion history rows at campaign-period granularity."""
     client = get_client()
-    where_clauses = [
-        "aktifPromosyonKodu IS NOT NULL",
-        "toString(aktifPromosyonKodu) != '17'",
-        "aktifPromosyonAdi IS NOT NULL",
-        "aktifPromosyonAdi != ''",
-        "aktifPromosyonAdi != 'Tayin edilmedi'",
-    ]
-
-    if productIds:
-        product_list = ", ".join(str(p) for p in productIds)
-        where_clauses.append(f"toInt64(urunkodu) IN ({product_list})")
-
-    if storeIds:
-        store_list = ", ".join(str(s) for s in storeIds)
-        where_clauses.append(f"toInt64(magazakodu) IN ({store_list})")
-
-    if regionIds:
-        region_list = ", ".join(
-            "'" + str(r).replace("'", "''").lower() + "'" for r in regionIds
-        )
-        where_clauses.append(f"lowerUTF8(cografi_bolge) IN ({region_list})")
-
-    if categoryIds:
-        category_list = ", ".join(
-            "'" + str(c).replace("'", "''") + "'" for c in categoryIds
-        )
-        where_clauses.append(f"toString(reyonkodu) IN ({category_list})")
-
-    where_sql = " AND ".join(where_clauses)
-
-    query = f"""
-    WITH daily AS (
-        SELECT
-            toDate(tarih) AS campaign_date,
-            toInt64(magazakodu) AS store_code,
-            toInt64(urunkodu) AS product_code,
-            any(lowerUTF8(cografi_bolge)) AS region_value,
-            any(toString(reyonkodu)) AS category_value,
-            toString(aktifPromosyonKodu) AS promo_code,
-            any(aktifPromosyonAdi) AS promo_name,
-            toString(aktifPromosyonKodu) AS promo_type,
-            round(sum((satismiktari - roll_mean_14) * satisFiyati), 2) AS uplift_val,
-            round(sum(satistutarikdvsiz) * 0.08, 2) AS profit_val,
-            round(avg(100 - abs((satismiktari - roll_mean_14) / nullIf(roll_mean_14, 0)) * 100), 2) AS forecast_accuracy,
-            round(sum(satismiktari * satisFiyati * greatest(indirimYuzdesi, 0) / 100.0), 2) AS markdown_cost,
-            round(sum(greatest(roll_mean_14 - satismiktari, 0) * satisFiyati), 2) AS lost_sales_val,
-            round(sum(roll_mean_14 * satisFiyati), 2) AS target_revenue,
-            max(if(stok_out = 1, 1, 0)) AS stock_out_flag
-        FROM {TABLE_NAME}
-        WHERE {where_sql}
-        GROUP BY campaign_date, store_code, product_code, promo_code
-    ),
-    daily_with_seq AS (
-        SELECT
-            *,
-            row_number() OVER (
-                PARTITION BY store_code, product_code, promo_code
-                ORDER BY campaign_date
-            ) AS seq_no
-        FROM daily
-    ),
-    periodized AS (
-        SELECT
-            *,
-            (toInt32(toRelativeDayNum(campaign_date)) - toInt32(seq_no)) AS period_group
-        FROM daily_with_seq
-    ),
-    period_agg AS (
-        SELECT
-            max(campaign_date) AS event_date,
-            min(campaign_date) AS campaign_start_date,
-            max(campaign_date) AS campaign_end_date,
-            store_code,
-            product_code,
-            any(region_value) AS region_value,
-            any(category_value) AS category_value,
-            promo_code,
-            any(promo_name) AS promo_name,
-            any(promo_type) AS promo_type,
-            round(sum(uplift_val), 2) AS uplift_val,
-            round(sum(profit_val), 2) AS profit_val,
-            if(max(stock_out_flag) = 1, 'OOS', 'OK') AS stock_status,
-            round(avg(forecast_accuracy), 2) AS forecast_accuracy,
-            round(sum(markdown_cost), 2) AS stock_cost_increase,
-            round(sum(lost_sales_val), 2) AS lost_sales_val,
-            round(sum(target_revenue), 2) AS target_revenue
-        FROM periodized
-        GROUP BY store_code, product_code, promo_code, period_group
+    return get_promotion_history(
+        client,
+        table_name=TABLE_NAME,
+        product_ids=productIds,
+        store_ids=storeIds,
+        region_ids=regionIds,
+        category_ids=categoryIds,
+        limit=limit,
+        sort_by=sortBy,
+        sort_order=sortOrder,
+        cursor=cursor,
     )
-    SELECT
-        event_date,
-        campaign_start_date,
-        campaign_end_date,
-        store_code,
-        product_code,
-        region_value,
-        category_value,
-        promo_code,
-        promo_name,
-        promo_type,
-        round(
-            if(target_revenue = 0, 0, (uplift_val / target_revenue) * 100),
-            2
-        ) AS uplift_pct,
-        uplift_val,
-        profit_val,
-        stock_status,
-        forecast_accuracy,
-        stock_cost_increase,
-        lost_sales_val
-    FROM period_agg
-    ORDER BY campaign_end_date DESC, store_code, product_code, promo_code
-    LIMIT {limit}
-    """
 
-    rows = client.query(query).result_set
-    def safe_number(value: Optional[float]) -> float:
-        if value is None:
-            return 0.0
-        try:
-            n = float(value)
-            return n if math.isfinite(n) else 0.0
-        except Exception:
-            return 0.0
-
-    def safe_text(value: Optional[object], fallback: str = "") -> str:
-        if value is None:
-            return fallback
-        try:
-            if isinstance(value, float) and not math.isfinite(value):
-                return fallback
-            text = str(value)
-            return text if text.strip() else fallback
-        except Exception:
-            return fallback
-
-    history = []
-    for row in rows:
-        (event_date, campaign_start_date, campaign_end_date, store_code, product_code, region_value, category_value, promo_code, promo_name, promo_type, uplift_pct, uplift_val, profit_val, stock_status,
-         forecast_accuracy, stock_cost_increase, lost_sales_val) = row
-        event_date_value = safe_text(event_date, "")
-        campaign_start_date_value = safe_text(campaign_start_date, event_date_value)
-        campaign_end_date_value = safe_text(campaign_end_date, event_date_value)
-        store_code_value = int(safe_number(store_code))
-        product_code_value = int(safe_number(product_code))
-        region_value_text = safe_text(region_value, "")
-        category_value_text = safe_text(category_value, "")
-        promo_code_value = safe_text(promo_code, "")
-        campaign_key = (
-            f"{store_code_value}_{product_code_value}_{promo_code_value}_"
-            f"{campaign_start_date_value}_{campaign_end_date_value}"
-        )
-        promo_name_text = safe_text(promo_name, "")
-        if promo_name_text:
-            type_label = f"{promo_name_text} (Kod: {promo_code_value})"
-        else:
-            type_label = f"Kod: {promo_code_value}"
-        history.append({
-            "campaignKey": campaign_key,
-            "eventDate": event_date_value,
-            "campaignStartDate": campaign_start_date_value,
-            "campaignEndDate": campaign_end_date_value,
-            "storeCode": store_code_value,
-            "productCode": product_code_value,
-            "region": region_value_text,
-            "category": category_value_text,
-            "promoCode": promo_code_value,
-            "date": event_date_value,
-            "name": promo_name_text or f"Promosyon {safe_text(promo_type, '')}",
-            "type": safe_text(promo_type, ""),
-            "typeLabel": type_label,
-            "uplift": safe_number(uplift_pct),
-            "upliftVal": safe_number(uplift_val),
-            "profit": safe_number(profit_val),
-            "stock": safe_text(stock_status, "OK"),
-            "forecast": safe_number(forecast_accuracy),
-            "stockCostIncrease": safe_number(stock_cost_increase),
-            "lostSalesVal": safe_number(lost_sales_val),
-        })
 
-    return {"history": history}
+MAX_CAMPAIGN_DETAIL_BATCH = 200
 
 
-@app.get("/api/forecast/campaign-detail-series")
-def api_get_campaign_detail_series(
-    storeCode: int = Query(...),
-    productCode: int = Query(...),
-    promoCode: str = Query(...),
-    eventDate: str = Query(..., description="YYYY-MM-DD"),
-    campaignStartDate: Optional[str] = Query(None, description="YYYY-MM-DD"),
-    campaignEndDate: Optional[str] = Query(None, description="YYYY-MM-DD"),
-    windowDaysBefore: int = Query(3, ge=0, le=30),
-    windowDaysAfter: int = Query(3, ge=0, le=30),
-):
-    """Return real daily series for popup chart and KPI summary."""
-    client = get_client()
-
+def _resolve_campaign_window(
+    eventDate: str,
+    campaignStartDate: Optional[str],
+    campaignEndDate: Optional[str],
+    windowDaysBefore: int,
+    windowDaysAfter: int,
+) -> tuple:
     def parse_iso_date(value: str, field_name: str) -> date:
         try:
             return date.fromisoformat(value)
@@ -841,127 +820,238 @@ def api_get_campaign_detail_series(
         start_date_obj = event_date_obj - timedelta(days=windowDaysBefore)
         end_date_obj = event_date_obj + timedelta(days=windowDaysAfter)
 
-    start_date = start_date_obj.isoformat()
-    end_date = end_date_obj.isoformat()
+    return start_date_obj, end_date_obj
+
+
+def _fetch_campaign_detail_series(client, campaigns: list) -> list:
+    """
+    Daily series and KPI summary for every (store, product, promo, window).
+
+    All campaigns are read in one scan: the campaign windows are expanded with
+    arrayJoin and joined to the fact rows, which are pre-filtered on the
+    (store, product, promo) key tuples and the overall date span. Summaries
+    are aggregated per campaign in the same query.
+    """
+    if not campaigns:
+        return []
+
+    def sql_str(value) -> str:
+        return "'" + str(value).replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+    campaign_tuples = ", ".join(
+        f"({idx}, {int(c['storeCode'])}, {int(c['productCode'])}, {sql_str(c['promoCode'])}, "
+        f"toDate('{c['startDate'].isoformat()}'), toDate('{c['endDate'].isoformat()}'))"
+        for idx, c in enumerate(campaigns)
+    )
+    key_tuples = ", ".join(sorted({
+        f"({int(c['storeCode'])}, {int(c['productCode'])}, {sql_str(c['promoCode'])})"
+        for c in campaigns
+    }))
+    scan_start = min(c["startDate"] for c in campaigns).isoformat()
+    scan_end = max(c["endDate"] for c in campaigns).isoformat()
 
     query = f"""
     WITH
-      toDate('{start_date}') AS start_date,
-      toDate('{end_date}') AS end_date
+    campaigns AS (
+      SELECT
+        toUInt32(tupleElement(c, 1)) AS campaign_idx,
+        toInt64(tupleElement(c, 2)) AS store_code,
+        toInt64(tupleElement(c, 3)) AS product_code,
+        toString(tupleElement(c, 4)) AS promo_code,
+        tupleElement(c, 5) AS start_date,
+        tupleElement(c, 6) AS end_date
+      FROM (SELECT arrayJoin([{campaign_tuples}]) AS c)
+    ),
+    daily AS (
+      SELECT
+        cw.campaign_idx AS campaign_idx,
+        toDate(t.tarih) AS d,
+        round(sum(t.roll_mean_14), 2) AS baseline_units,
+        round(sum(t.satismiktari), 2) AS actual_units,
+        round(avg(t.stok), 2) AS stock_units,
+        round(sum(greatest(t.roll_mean_14 - t.satismiktari, 0)), 2) AS lost_sales_units,
+        round(sum(t.satismiktari * t.satisFiyati), 2) AS revenue,
+        round(sum(t.roll_mean_14 * t.satisFiyati), 2) AS target_revenue,
+        max(if(t.stok_out = 1, 1, 0)) AS stock_out_days,
+        round(sum((t.satismiktari - t.roll_mean_14) * t.satisFiyati), 2) AS uplift_value,
+        round(sum(t.satistutarikdvsiz) * 0.08, 2) AS profit_effect,
+        round(avg(100 - abs((t.satismiktari - t.roll_mean_14) / nullIf(t.roll_mean_14, 0)) * 100), 2) AS forecast_accuracy,
+        round(
+          sum(t.satismiktari * t.satisFiyati * greatest(t.indirimYuzdesi, 0) / 100.0),
+          2
+        ) AS markdown_cost
+      FROM {TABLE_NAME} AS t
+      INNER JOIN campaigns AS cw
+        ON toInt64(t.magazakodu) = cw.store_code
+       AND toInt64(t.urunkodu) = cw.product_code
+       AND toString(t.aktifPromosyonKodu) = cw.promo_code
+      WHERE (toInt64(t.magazakodu), toInt64(t.urunkodu), toString(t.aktifPromosyonKodu)) IN ({key_tuples})
+        AND t.tarih >= toDate('{scan_start}')
+        AND t.tarih < toDate('{scan_end}') + 1
+        AND toDate(t.tarih) BETWEEN cw.start_date AND cw.end_date
+      GROUP BY campaign_idx, d
+    )
     SELECT
-      toDate(tarih) AS d,
-      round(sum(roll_mean_14), 2) AS baseline_units,
-      round(sum(satismiktari), 2) AS actual_units,
-      round(avg(stok), 2) AS stock_units,
-      round(sum(greatest(roll_mean_14 - satismiktari, 0)), 2) AS lost_sales_units,
-      round(sum(satismiktari * satisFiyati), 2) AS revenue,
-      round(sum(roll_mean_14 * satisFiyati), 2) AS target_revenue,
-      max(if(stok_out = 1, 1, 0)) AS stock_out_days,
-      round(sum((satismiktari - roll_mean_14) * satisFiyati), 2) AS uplift_value,
-      round(sum(satistutarikdvsiz) * 0.08, 2) AS profit_effect,
-      round(avg(100 - abs((satismiktari - roll_mean_14) / nullIf(roll_mean_14, 0)) * 100), 2) AS forecast_accuracy,
+      campaign_idx,
+      arraySort(
+        p -> p.1,
+        groupArray((toString(d), baseline_units, actual_units, stock_units, lost_sales_units, revenue))
+      ) AS points,
+      round(sum(target_revenue), 2) AS total_target_revenue,
+      round(sum(revenue), 2) AS total_actual_revenue,
+      round(sum(actual_units), 2) AS total_sold_units,
+      round(sum(markdown_cost), 2) AS total_markdown_cost,
       round(
-        sum(satismiktari * satisFiyati * greatest(indirimYuzdesi, 0) / 100.0),
+        if(
+          countIf(stock_units + actual_units > 0) > 0,
+          avgIf(100 * actual_units / (stock_units + actual_units), stock_units + actual_units > 0),
+          0
+        ),
         2
-      ) AS markdown_cost
-    FROM {TABLE_NAME}
-    WHERE toInt64(magazakodu) = {storeCode}
-      AND toInt64(urunkodu) = {productCode}
-      AND toString(aktifPromosyonKodu) = '{promoCode}'
-      AND toDate(tarih) BETWEEN start_date AND end_date
-    GROUP BY d
-    ORDER BY d ASC
+      ) AS avg_sell_through,
+      sum(stock_out_days) AS total_stock_out_days,
+      round(sum(uplift_value), 2) AS total_uplift_value,
+      round(sum(profit_effect), 2) AS total_profit_effect,
+      round(
+        if(
+          countIf(isFinite(ifNull(forecast_accuracy, 0))) > 0,
+          avgIf(ifNull(forecast_accuracy, 0), isFinite(ifNull(forecast_accuracy, 0))),
+          0
+        ),
+        2
+      ) AS avg_forecast_accuracy
+    FROM daily
+    GROUP BY campaign_idx
     """
 
-    rows = client.query(query).result_set
-    series = []
-    total_target_revenue = 0.0
-    total_actual_revenue = 0.0
-    total_sold_units = 0.0
-    total_markdown_cost = 0.0
-    total_stock_out_days = 0
-    total_uplift_value = 0.0
-    total_profit_effect = 0.0
-    avg_sell_through_samples = []
-    avg_forecast_accuracy_samples = []
-
-    for row in rows:
+    by_campaign = {}
+    for row in client.query(query).result_rows:
         (
-            d,
-            baseline_units,
-            actual_units,
-            stock_units,
-            lost_sales_units,
-            revenue,
-            target_revenue,
-            stock_out_days,
-            uplift_value,
-            profit_effect,
-            forecast_accuracy,
-            markdown_cost,
+            campaign_idx,
+            points,
+            total_target_revenue,
+            total_actual_revenue,
+            total_sold_units,
+            total_markdown_cost,
+            avg_sell_through,
+            total_stock_out_days,
+            total_uplift_value,
+            total_profit_effect,
+            avg_forecast_accuracy,
         ) = row
 
-        baseline_units_f = float(baseline_units or 0)
-        actual_units_f = float(actual_units or 0)
-        stock_units_f = float(stock_units or 0)
-        lost_sales_units_f = float(lost_sales_units or 0)
-        revenue_f = float(revenue or 0)
-        target_revenue_f = float(target_revenue or 0)
-        stock_out_days_i = int(stock_out_days or 0)
-        uplift_value_f = float(uplift_value or 0)
-        profit_effect_f = float(profit_effect or 0)
-        forecast_accuracy_f = float(forecast_accuracy or 0)
-        markdown_cost_f = float(markdown_cost or 0)
-
-        sell_through_den = stock_units_f + actual_units_f
-        if sell_through_den > 0:
-            avg_sell_through_samples.append((actual_units_f / sell_through_den) * 100)
-        if math.isfinite(forecast_accuracy_f):
-            avg_forecast_accuracy_samples.append(forecast_accuracy_f)
-
-        total_target_revenue += target_revenue_f
-        total_actual_revenue += revenue_f
-        total_sold_units += actual_units_f
-        total_markdown_cost += markdown_cost_f
-        total_stock_out_days += stock_out_days_i
-        total_uplift_value += uplift_value_f
-        total_profit_effect += profit_effect_f
-
-        series.append(
-            {
-                "date": str(d),
-                "baselineUnits": baseline_units_f,
-                "actualUnits": actual_units_f,
-                "stockUnits": stock_units_f,
-                "lostSalesUnits": lost_sales_units_f,
-                "revenue": revenue_f,
-            }
-        )
+        by_campaign[int(campaign_idx)] = {
+            "series": [
+                {
+                    "date": str(d),
+                    "baselineUnits": float(baseline_units or 0),
+                    "actualUnits": float(actual_units or 0),
+                    "stockUnits": float(stock_units or 0),
+                    "lostSalesUnits": float(lost_sales_units or 0),
+                    "revenue": float(revenue or 0),
+                }
+                for d, baseline_units, actual_units, stock_units, lost_sales_units, revenue in points
+            ],
+            "summary": {
+                "targetRevenue": float(total_target_revenue or 0),
+                "actualRevenue": float(total_actual_revenue or 0),
+                "soldUnits": float(total_sold_units or 0),
+                "markdownCost": float(total_markdown_cost or 0),
+                "sellThrough": float(avg_sell_through or 0),
+                "stockOutDays": int(total_stock_out_days or 0),
+                "upliftValue": float(total_uplift_value or 0),
+                "profitEffect": float(total_profit_effect or 0),
+                "forecastAccuracy": float(avg_forecast_accuracy or 0),
+            },
+        }
 
-    sell_through = (
-        float(sum(avg_sell_through_samples) / len(avg_sell_through_samples))
-        if avg_sell_through_samples
-        else 0.0
-    )
-    forecast_accuracy = (
-        float(sum(avg_forecast_accuracy_samples) / len(avg_forecast_accuracy_samples))
-        if avg_forecast_accuracy_samples
-        else 0.0
+    empty_summary = {
+        "targetRevenue": 0.0,
+        "actualRevenue": 0.0,
+        "soldUnits": 0.0,
+        "markdownCost": 0.0,
+        "sellThrough": 0.0,
+        "stockOutDays": 0,
+        "upliftValue": 0.0,
+        "profitEffect": 0.0,
+        "forecastAccuracy": 0.0,
+    }
+    return [
+        by_campaign.get(idx, {"series": [], "summary": dict(empty_summary)})
+        for idx in range(len(campaigns))
+    ]
+
+
+@app.get("/api/forecast/campaign-detail-series")
+def api_get_campaign_detail_series(
+    storeCode: int = Query(...),
+    productCode: int = Query(...),
+    promoCode: str = Query(...),
+    eventDate: str = Query(..., description="YYYY-MM-DD"),
+    campaignStartDate: Optional[str] = Query(None, description="YYYY-MM-DD"),
+    campaignEndDate: Optional[str] = Query(None, description="YYYY-MM-DD"),
+    windowDaysBefore: int = Query(3, ge=0, le=30),
+    windowDaysAfter: int = Query(3, ge=0, le=30),
+):
+    """Return real daily series for popup chart and KPI summary."""
+    client = get_client()
+
+    start_date_obj, end_date_obj = _resolve_campaign_window(
+        eventDate, campaignStartDate, campaignEndDate, windowDaysBefore, windowDaysAfter
     )
 
-    summary = {
-        "targetRevenue": round(total_target_revenue, 2),
-        "actualRevenue": round(total_actual_revenue, 2),
-        "soldUnits": round(total_sold_units, 2),
-        "markdownCost": round(total_markdown_cost, 2),
-        "sellThrough": round(sell_through, 2),
-        "stockOutDays": int(total_stock_out_days),
-        "upliftValue": round(total_uplift_value, 2),
-        "profitEffect": round(total_profit_effect, 2),
-        "forecastAccuracy": round(forecast_accuracy, 2),
-    }
+    return _fetch_campaign_detail_series(client, [{
+        "storeCode": storeCode,
+        "productCode": productCode,
+        "promoCode": promoCode,
+        "startDate": start_date_obj,
+        "endDate": end_date_obj,
+    }])[0]
+
 
-    return {"series": series, "summary": summary}
+@app.post("/api/forecast/campaign-detail-series/batch")
+def api_get_campaign_detail_series_batch(payload: CampaignDetailSeriesBatchRequest):
+    """Daily series and KPI summary for many campaigns in one query."""
+    if len(payload.campaigns) > MAX_CAMPAIGN_DETAIL_BATCH:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {MAX_CAMPAIGN_DETAIL_BATCH} campaigns per request",
+        )
+
+    campaigns = []
+    for item in payload.campaigns:
+        start_date_obj, end_date_obj = _resolve_campaign_window(
+            item.eventDate,
+            item.campaignStartDate,
+            item.campaignEndDate,
+            item.windowDaysBefore,
+            item.windowDaysAfter,
+        )
+        campaigns.append({
+            "storeCode": item.storeCode,
+            "productCode": item.productCode,
+            "promoCode": item.promoCode,
+            "startDate": start_date_obj,
+            "endDate": end_date_obj,
+        })
+
+    client = get_client()
+    results = _fetch_campaign_detail_series(client, campaigns)
+
+    return {
+        "campaigns": [
+            {
+                "storeCode": c["storeCode"],
+                "productCode": c["productCode"],
+                "promoCode": c["promoCode"],
+                "eventDate": item.eventDate,
+                "startDate": c["startDate"].isoformat(),
+                "endDate": c["endDate"].isoformat(),
+                **result,
+            }
+            for item, c, result in zip(payload.campaigns, campaigns, results)
+        ]
+    }
 
 
 @app.get("/api/forecast/similar-campaigns")
@@ -971,20 +1061,41 @@ def api_get_similar_campaigns(
     storeIds: Optional[List[str]] = Query(None),
     regionIds: Optional[List[str]] = Query(None),
     categoryIds: Optional[List[str]] = Query(None),
-    limit: int = 5
+    limit: int = Query(5, ge=1, le=100),
+    campaignId: Optional[str] = Query(None, description="Existing campaign id (SC-...) to compare against"),
+    discount: Optional[float] = Query(None, description="Hypothetical campaign discount %"),
+    durationDays: Optional[int] = Query(None, ge=1, description="Hypothetical campaign duration"),
+    startDate: Optional[str] = Query(None, description="Hypothetical campaign start (YYYY-MM-DD)"),
 ):
-    """Get similar past campaigns"""
+    """Get past campaigns nearest to a chosen or hypothetical campaign"""
     client = get_client()
-    return get_similar_campaigns(
-        client,
-        table_name=TABLE_NAME,
-        promotion_type=promotionType,
-        product_ids=productIds,
-        store_ids=storeIds,
-        region_ids=regionIds,
-        category_ids=categoryIds,
-        limit=limit
-    )
+    target = {
+        key: value
+        for key, value in {
+            "discount": discount,
+            "durationDays": durationDays,
+            "startDate": startDate,
+            "categoryCodes": categoryIds if (discount is not None or durationDays or startDate) else None,
+        }.items()
+        if value is not None
+    }
+    try:
+        return get_similar_campaigns(
+            client,
+            table_name=TABLE_NAME,
+            promotion_type=promotionType,
+            product_ids=productIds,
+            store_ids=storeIds,
+            region_ids=regionIds,
+            category_ids=categoryIds,
+            limit=limit,
+            campaign_id=campaignId,
+            target=target,
+        )
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Campaign '{campaignId}' not found")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 @app.get("/api/forecast/calendar")
@@ -1012,6 +1123,34 @@ def api_get_forecast_calendar(
     )
 
 
+@app.get("/api/forecast/calendar-range")
+def api_get_forecast_calendar_range(
+    fromMonth: str = Query(..., description="First month (YYYY-MM)"),
+    toMonth: str = Query(..., description="Last month (YYYY-MM)"),
+    storeIds: Optional[List[str]] = Query(None),
+    regionIds: Optional[List[str]] = Query(None),
+    categoryIds: Optional[List[str]] = Query(None),
+    includeFuture: bool = Query(False),
+    futureCount: int = Query(10, ge=1, le=60),
+):
+    """Get promotion calendar events for a range of months, grouped per month"""
+    client = get_client()
+    try:
+        return get_forecast_calendar_range(
+            client,
+            table_name=TABLE_NAME,
+            store_ids=storeIds,
+            region_ids=regionIds,
+            category_ids=categoryIds,
+            from_month=fromMonth,
+            to_month=toMonth,
+            include_future=includeFuture,
+            future_count=futureCount,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @app.get("/api/forecast/product-promotions")
 def api_get_product_promotions_for_product(
     storeCode: Optional[int] = Query(None, description="Store code (magazakodu)"),
@@ -1068,9 +1207,30 @@ def api_get_product_promotions_for_product(
     return {"promotions": promotions}
 
 
-@app.post("/api/forecast/predict-demand")
-def api_predict_demand(payload: PredictDemandRequest):
-    """Proxy request to external demand prediction model."""
+prediction_upstream = upstream_from_env(
+    "Prediction", PREDICTION_API_URL, "PREDICTION_API", read_timeout=30.0, max_concurrency=8
+)
+
+
+market_upstream = upstream_from_env(
+    "Market", MARKET_SEARCH_API_URL, "MARKET_SEARCH_API", read_timeout=15.0, cache_ttl_seconds=3600.0
+)
+
+
+@metrics.collector
+def upstream_metrics():
+    return upstream_lines([prediction_upstream, market_upstream])
+
+
+@app.on_event("shutdown")
+async def close_upstream_clients():
+    await prediction_upstream.aclose()
+    await market_upstream.aclose()
+    shutdown_logging()
+
+
+def _prediction_request_data(payload: PredictDemandRequest) -> dict:
+    """Validate the scenario fields and return the payload sent to the model."""
     request_data = payload.model_dump() if hasattr(payload, "model_dump") else payload.dict()
 
     if payload.aktifPromosyonKodu == "17":
@@ -1088,70 +1248,199 @@ def api_predict_demand(payload: PredictDemandRequest):
                 status_code=400,
                 detail="Promosyon senaryosunda istenenIndirim / istenenMarj / istenenFiyat alanlarından sadece biri dolu olmalı.",
             )
+    return request_data
 
-    req = urllib.request.Request(
-        PREDICTION_API_URL,
-        data=json.dumps(request_data).encode("utf-8"),
-        headers={"Content-Type": "application/json"},
-        method="POST",
-    )
+
+@app.post("/api/forecast/predict-demand")
+async def api_predict_demand(payload: PredictDemandRequest):
+    """Proxy request to external demand prediction model."""
+    request_data = _prediction_request_data(payload)
 
     try:
-        with urllib.request.urlopen(req) as response:
-            body = response.read().decode("utf-8")
-            return json.loads(body) if body else {"status": "ok"}
-    except urllib.error.HTTPError as e:
-        body = e.read().decode("utf-8", errors="ignore")
-        detail = body or str(e)
-        raise HTTPException(status_code=e.code or 502, detail=detail)
-    except urllib.error.URLError as e:
-        raise HTTPException(status_code=502, detail=f"Prediction service connection failed: {e.reason}")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Prediction proxy failed: {str(e)}")
+        return await prediction_upstream.post_json(request_data)
+    except UpstreamError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
 
 
-@app.post("/api/market/search")
-def api_market_search(payload: MarketSearchRequest):
-    """Proxy request to market comparison API using store-based coordinates."""
-    coords = STORE_COORDINATES.get(str(payload.storeId))
-    if not coords:
+PREDICT_SWEEP_MAX_POINTS = int(os.getenv("PREDICT_SWEEP_MAX_POINTS", "50"))
+PREDICT_SWEEP_CONCURRENCY = int(os.getenv("PREDICT_SWEEP_CONCURRENCY", "8"))
+
+# grid field -> PredictDemandRequest scenario field
+PREDICT_SWEEP_FIELDS = {
+    "discounts": "istenenIndirim",
+    "margins": "istenenMarj",
+    "prices": "istenenFiyat",
+}
+
+
+def _summarize_prediction(result) -> dict:
+    """Total demand / revenue / profit over the model's daily forecast rows."""
+    rows = result.get("forecast") if isinstance(result, dict) else None
+    demand = revenue = profit = 0.0
+    for row in rows if isinstance(rows, list) else []:
+        if not isinstance(row, dict):
+            continue
+        try:
+            units = float(row.get("tahmin") or 0)
+            price = float(row.get("satisFiyati") or 0)
+            demand += units
+            revenue += float(row["ciro"]) if row.get("ciro") is not None else units * price
+            profit += float(row.get("gunluk_kar") or 0)
+        except (TypeError, ValueError):
+            continue
+    return {
+        "demand": round(demand, 2),
+        "revenue": round(revenue, 2),
+        "profit": round(profit, 2),
+    }
+
+
+@app.post("/api/forecast/predict-sweep")
+async def api_predict_sweep(payload: PredictSweepRequest):
+    """
+    Demand/revenue curve over a grid of discounts, margins or prices.
+    Points are requested concurrently (bounded) through the cached prediction
+    proxy, so repeated points are served from cache.
+    """
+    grids = {
+        name: getattr(payload, name)
+        for name in PREDICT_SWEEP_FIELDS
+        if getattr(payload, name)
+    }
+    if len(grids) != 1:
         raise HTTPException(
             status_code=400,
-            detail=f"Unknown storeId '{payload.storeId}'. No coordinates configured.",
+            detail="Exactly one of discounts / margins / prices must be provided",
+        )
+    if payload.base.aktifPromosyonKodu == "17":
+        raise HTTPException(
+            status_code=400,
+            detail="Senaryo taraması promosyonsuz (17) tahmin için yapılamaz",
+        )
+    if payload.objective not in {"revenue", "profit", "demand"}:
+        raise HTTPException(status_code=400, detail="objective must be revenue, profit or demand")
+
+    grid_name, grid_values = next(iter(grids.items()))
+    field = PREDICT_SWEEP_FIELDS[grid_name]
+    values = sorted({float(v) for v in grid_values if v is not None and math.isfinite(float(v))})
+    if not values or len(values) > PREDICT_SWEEP_MAX_POINTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Grid must contain 1..{PREDICT_SWEEP_MAX_POINTS} finite values",
         )
 
+    base_data = payload.base.model_dump() if hasattr(payload.base, "model_dump") else payload.base.dict()
+    slots = asyncio.Semaphore(max(1, min(PREDICT_SWEEP_CONCURRENCY, prediction_upstream.max_concurrency)))
+
+    async def run_point(value: float) -> dict:
+        request_data = {
+            **base_data,
+            "istenenIndirim": None,
+            "istenenMarj": None,
+            "istenenFiyat": None,
+            field: value,
+        }
+        async with slots:
+            try:
+                result = await prediction_upstream.post_json(request_data)
+            except UpstreamError as e:
+                return {"value": value, "error": e.detail, "status": e.status_code}
+        return {"value": value, **_summarize_prediction(result), "prediction": result}
+
+    points = await asyncio.gather(*(run_point(v) for v in values))
+
+    succeeded = [p for p in points if "error" not in p]
+    if not succeeded:
+        first = points[0]
+        raise HTTPException(status_code=first["status"], detail=first["error"])
+
+    best = max(succeeded, key=lambda p: p[payload.objective])
+    return {
+        "field": field,
+        "objective": payload.objective,
+        "points": points,
+        "best": {k: v for k, v in best.items() if k != "prediction"},
+    }
+
+
+@app.get("/api/forecast/quick-estimate")
+def api_quick_estimate(
+    productCode: int = Query(...),
+    discount: float = Query(0.0, ge=0, le=100, description="indirim yüzdesi (puan)"),
+    storeCode: Optional[int] = Query(None),
+    promoCode: Optional[str] = Query(None),
+    categoryCode: Optional[int] = Query(None),
+    days: int = Query(7, ge=1, le=365),
+):
+    """
+    In-process promotion uplift estimate for interactive what-if controls.
+    Use /api/forecast/predict-demand for the final (remote model) forecast.
+    """
+    client = get_client()
+    model = get_uplift_model(client, TABLE_NAME)
+    return model.estimate(
+        productCode,
+        discount,
+        store_code=storeCode,
+        promo_code=promoCode,
+        category_code=categoryCode,
+        days=days,
+    )
+
+
+def _market_request_data(query: str, coords: tuple, page: int, size: int, distance: int) -> dict:
     latitude, longitude = coords
-    request_data = {
-        "query": payload.query,
+    return {
+        "query": query,
         "latitude": latitude,
         "longitude": longitude,
-        "page": int(payload.page),
-        "size": int(payload.size),
-        "distance": int(payload.distance),
+        "page": int(page),
+        "size": int(size),
+        "distance": int(distance),
     }
 
-    req = urllib.request.Request(
-        MARKET_SEARCH_API_URL,
-        data=json.dumps(request_data).encode("utf-8"),
-        headers={"Content-Type": "application/json"},
-        method="POST",
-    )
 
-    try:
-        with urllib.request.urlopen(req) as response:
-            body = response.read().decode("utf-8")
-            return json.loads(body) if body else {"status": "ok"}
-    except urllib.error.HTTPError as e:
-        body = e.read().decode("utf-8", errors="ignore")
-        detail = body or str(e)
-        raise HTTPException(status_code=e.code or 502, detail=detail)
-    except urllib.error.URLError as e:
+def _market_cache_key(request_data: dict) -> dict:
+    # Case/whitespace variants of the same search share one cache entry; upstream gets the query as typed.
+    return {**request_data, "query": " ".join(turkish_lower(request_data["query"]).split())}
+
+
+@app.post("/api/market/search")
+async def api_market_search(payload: MarketSearchRequest):
+    """
+    Proxy request to market comparison API using store-based coordinates.
+    Results are cached per (query, store coordinates, page, size, distance);
+    serving page N prefetches page N+1 in the background.
+    """
+    coords = STORE_COORDINATES.get(str(payload.storeId))
+    if not coords:
         raise HTTPException(
-            status_code=502,
-            detail=f"Market service connection failed: {e.reason}",
+            status_code=400,
+            detail=f"Unknown storeId '{payload.storeId}'. No coordinates configured.",
         )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Market proxy failed: {str(e)}")
+
+    request_data = _market_request_data(
+        payload.query, coords, payload.page, payload.size, payload.distance
+    )
+
+    try:
+        result = await market_upstream.post_json(request_data, key_payload=_market_cache_key(request_data))
+    except UpstreamError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+    results = result.get("results") if isinstance(result, dict) else None
+    total_found = result.get("total_found") if isinstance(result, dict) else None
+    served = (request_data["page"] + 1) * request_data["size"]
+    has_next = (
+        total_found > served
+        if isinstance(total_found, (int, float))
+        else isinstance(results, list) and len(results) >= request_data["size"]
+    )
+    if has_next:
+        next_page = {**request_data, "page": request_data["page"] + 1}
+        market_upstream.prefetch(next_page, key_payload=_market_cache_key(next_page))
+
+    return result
 
 
 # =============================================================================
@@ -1190,9 +1479,11 @@ def api_get_inventory_items(
     page: int = 1,
     limit: int = 50,
     sortBy: str = "stockValue",
-    sortOrder: str = "desc"
+    sortOrder: str = "desc",
+    cursor: Optional[str] = Query(None, description="pagination.nextCursor of the previous page"),
+    search: Optional[str] = Query(None, description="Product name search"),
 ):
-    """Get inventory items with pagination"""
+    """Get inventory items with pagination (page number or keyset cursor)"""
     try:
         client = get_client()
         return get_inventory_items(
@@ -1208,10 +1499,11 @@ def api_get_inventory_items(
             limit=limit,
             sort_by=sortBy,
             sort_order=sortOrder,
+            cursor=cursor,
+            search=search,
         )
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        logger.exception("Inventory items failed")
         raise HTTPException(status_code=500, detail=f"Inventory Items Error: {str(e)}")
 
 
@@ -1249,6 +1541,7 @@ def api_get_inventory_store_performance(
     categoryIds: Optional[List[str]] = Query(None),
     productIds: Optional[List[str]] = Query(None),
     days: int = Query(30, ge=1, le=3650),
+    breakdown: Optional[str] = Query(None, description="'category' adds per-category rows per store"),
 ):
     """Get store inventory performance"""
     client = get_client()
@@ -1260,6 +1553,7 @@ def api_get_inventory_store_performance(
         category_ids=categoryIds,
         product_ids=productIds,
         days=days,
+        breakdown=breakdown,
     )
 
 
@@ -1372,6 +1666,144 @@ def health_check():
         return {"status": "unhealthy", "database": "disconnected", "error": str(e)}
 
 
+@app.get("/api/health/upstreams")
+def upstream_health():
+    """Latency percentiles, hedging, circuit breaker state and cache stats per upstream."""
+    return {"upstreams": [prediction_upstream.stats(), market_upstream.stats()]}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Prometheus text exposition (async so threadpool stats are read on the event loop)."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+# =============================================================================
+# DEBUG ENDPOINTS
+# =============================================================================
+
+def _require_debug_access(request: Request):
+    if not DEBUG_TOKEN:
+        raise HTTPException(status_code=403, detail="Debug endpoints are disabled (API_DEBUG_TOKEN is not set)")
+    if not secrets.compare_digest(request.headers.get("x-debug-token", ""), DEBUG_TOKEN):
+        raise HTTPException(status_code=403, detail="Debug endpoints require a valid X-Debug-Token header")
+
+
+@app.get("/api/_debug/queries")
+def debug_queries(
+    request: Request,
+    sortBy: str = Query("total", description="total | count | mean | p95 | rows | bytes"),
+    limit: int = Query(20, ge=1, le=500),
+    queryLog: bool = Query(False, description="Join server-side CPU/memory from system.query_log"),
+    hours: int = Query(24, ge=1, le=24 * 30),
+):
+    """Top query fingerprints by cost, optionally with system.query_log totals."""
+    _require_debug_access(request)
+    try:
+        queries = query_registry.top(sort_by=sortBy, limit=limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    query_log_error = None
+    if queryLog and queries:
+        try:
+            server_stats = query_log_stats(get_client(), [q["fingerprint"] for q in queries], hours=hours)
+            for q in queries:
+                q["queryLog"] = server_stats.get(q["fingerprint"])
+        except Exception as e:
+            query_log_error = str(e)
+
+    return {"sortBy": sortBy, "queries": queries, "queryLogError": query_log_error}
+
+
+@app.delete("/api/_debug/queries")
+def debug_reset_queries(request: Request):
+    """Clear the in-process fingerprint registry."""
+    _require_debug_access(request)
+    query_registry.reset()
+    return {"status": "ok"}
+
+
+class LoggingSettings(BaseModel):
+    route: Optional[str] = Field(None, description="Route template, e.g. /api/stores; omit for the default rate")
+    sampleRate: Optional[float] = Field(None, ge=0.0, le=1.0)
+    debug: Optional[bool] = Field(None, description="Also log full response bodies for the route")
+
+
+@app.get("/api/_debug/replay")
+def debug_replay(request: Request):
+    """Fixture record/replay mode and, when replaying, hit and miss counts."""
+    _require_debug_access(request)
+    return {
+        "recordDir": CLICKHOUSE_RECORD_DIR or None,
+        "replayDir": CLICKHOUSE_REPLAY_DIR or None,
+        "latency": CLICKHOUSE_REPLAY_LATENCY,
+        "replay": replay_stats(CLICKHOUSE_REPLAY_DIR).snapshot() if CLICKHOUSE_REPLAY_DIR else None,
+    }
+
+
+@app.get("/api/_debug/logging")
+def debug_logging(request: Request):
+    """Current log sampling rates, debug routes and dropped record count."""
+    _require_debug_access(request)
+    return log_control.snapshot()
+
+
+@app.put("/api/_debug/logging")
+def debug_update_logging(request: Request, settings: LoggingSettings):
+    """Change the sampling rate (default or per route) or toggle body logging for a route."""
+    _require_debug_access(request)
+    if settings.debug is not None and not settings.route:
+        raise HTTPException(status_code=400, detail="debug requires a route")
+    log_control.update(route=settings.route, rate=settings.sampleRate, debug=settings.debug)
+    return log_control.snapshot()
+
+
+@app.get("/api/_debug/profiles")
+def debug_profiles(request: Request):
+    """Recent request profiles (newest first); profile a request with the X-Profile header."""
+    _require_debug_access(request)
+    return {"profiles": profiles.list()}
+
+
+def _get_profile(profile_id: str) -> dict:
+    entry = profiles.get(profile_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail=f"Profile {profile_id} not found")
+    return entry
+
+
+@app.get("/api/_debug/profiles/{profile_id}")
+def debug_profile(request: Request, profile_id: str):
+    """Timing breakdown, SQL text, ClickHouse stats and top functions of one profiled request."""
+    _require_debug_access(request)
+    return profile_summary(_get_profile(profile_id), detail=True)
+
+
+@app.get("/api/_debug/profiles/{profile_id}/collapsed", response_class=PlainTextResponse)
+def debug_profile_collapsed(request: Request, profile_id: str):
+    """Collapsed stacks of a sampled profile (flamegraph.pl, speedscope, inferno)."""
+    _require_debug_access(request)
+    entry = _get_profile(profile_id)
+    if not entry["collapsed"]:
+        raise HTTPException(status_code=404, detail="Profile has no samples (use X-Profile: sample)")
+    return entry["collapsed"]
+
+
+@app.get("/api/_debug/profiles/{profile_id}/pstats")
+def debug_profile_pstats(request: Request, profile_id: str):
+    """cProfile stats in pstats format (snakeviz, flameprof)."""
+    _require_debug_access(request)
+    entry = _get_profile(profile_id)
+    if not entry["pstats"]:
+        raise HTTPException(status_code=404, detail="Profile has no cProfile stats (use X-Profile: cprofile)")
+    return Response(
+        content=entry["pstats"],
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": f'attachment; filename="{profile_id}.prof"'},
+    )
+
+
 # =============================================================================
 # RUN SERVER
 # =============================================================================
@@ -5,6 +5,17 @@ from datetime import date, timedelta
 import math
 import random
 import hashlib
+import logging
+import os
+
+from apiCache import SnapshotCache, decode_cursor, encode_cursor, get_data_version, get_latest_date
+from stockProjection import allocate_replenishment, project_stock
+from campaignIndex import get_campaign_index
+from hierarchyIndex import get_hierarchy_snapshot
+from productSearch import get_product_search_index, product_search_clause
+from filterIndex import get_filter_index
+
+logger = logging.getLogger("api.omerApiYan")
 
 
 def _normalize_filter_ids(values: list[str] | None) -> list[str]:
@@ -82,99 +93,82 @@ category_map = {
 
 
 
-def get_regions_hierarchy(
-    client,
-    table_name: str = "demoVerileri"
-) -> dict:
-
-    # ----- kategori kodları map -----
-    
-
-    # ----- clickhouse sorgu -----
-    query = f"""
-    SELECT
-        lowerUTF8(cografi_bolge) AS region,
-        concat(lowerUTF8(bulundugusehir), '_', lowerUTF8(ilce)) AS store_key,
-        concat(bulundugusehir, ' - ', ilce) AS store_label,
-        reyonkodu AS category,
-        urunkodu AS product_code,
-        any(urunismi) AS product_label,
-        any(stok) AS current_stock,
-        anyLast(roll_mean_14) AS forecast_demand
-    FROM {table_name}
-    WHERE tarih = yesterday()
-    GROUP BY
-        region,
-        store_key,
-        store_label,
-        category,
-        product_code
+def iter_regions_hierarchy(client, table_name: str = "demoVerileri"):
     """
+    GET /api/hierarchy
+    Full Region -> Store -> Category -> Product tree from the cached snapshot,
+    for streaming. Returns (product row count, generator of region nodes).
+    Prefer the child-level endpoints below for first paint.
+    """
+    snapshot = get_hierarchy_snapshot(client, table_name, category_map)
+    return len(snapshot.rows), snapshot.iter_regions()
 
-    rows = client.query(query).result_set
-
-    regions = {}
-
-    for (
-        region,
-        store_key,
-        store_label,
-        category_code,
-        product_code,
-        product_label,
-        current_stock,
-        forecast_demand
-    ) in rows:
-
-        # kategori kodunu isim ile değiştir
-        category_name = category_map.get(int(category_code), f"Kategori {category_code}")
 
-        regions.setdefault(region, {
-            "value": region,
-            "label": region.capitalize(),
-            "stores": {}
-        })
+def get_hierarchy_regions(client, table_name: str = "demoVerileri") -> dict:
+    """
+    GET /api/hierarchy/regions
+    """
+    snapshot = get_hierarchy_snapshot(client, table_name, category_map)
+    return {
+        "version": snapshot.version,
+        "asOf": snapshot.as_of.isoformat(),
+        "regions": snapshot.region_nodes(),
+    }
 
-        stores = regions[region]["stores"]
-        stores.setdefault(store_key, {
-            "value": store_key,
-            "label": store_label,
-            "categories": {}
-        })
 
-        categories = stores[store_key]["categories"]
-        categories.setdefault(category_name, {
-            "value": category_name,
-            "label": category_name,
-            "products": []
-        })
+def get_hierarchy_stores(client, table_name: str = "demoVerileri", region: str = "") -> dict:
+    """
+    GET /api/hierarchy/regions/{region}/stores
+    Raises KeyError for an unknown region.
+    """
+    snapshot = get_hierarchy_snapshot(client, table_name, category_map)
+    return {
+        "version": snapshot.version,
+        "region": region,
+        "stores": snapshot.store_nodes(region),
+    }
 
-        categories[category_name]["products"].append({
-            "value": str(product_code),
-            "label": product_label,
-            "forecastDemand": int(forecast_demand),
-            "currentStock": int(current_stock)
-        })
 
+def get_hierarchy_categories(client, table_name: str = "demoVerileri", store_key: str = "") -> dict:
+    """
+    GET /api/hierarchy/stores/{storeKey}/categories
+    Raises KeyError for an unknown store.
+    """
+    snapshot = get_hierarchy_snapshot(client, table_name, category_map)
     return {
-        "regions": [
-            {
-                "value": r["value"],
-                "label": r["label"],
-                "stores": [
-                    {
-                        "value": s["value"],
-                        "label": s["label"],
-                        "categories": list(s["categories"].values())
-                    }
-                    for s in r["stores"].values()
-                ]
-            }
-            for r in regions.values()
-        ]
+        "version": snapshot.version,
+        "store": store_key,
+        "categories": snapshot.category_nodes(store_key),
     }
 
 
+def get_hierarchy_products(
+    client,
+    table_name: str = "demoVerileri",
+    store_key: str = "",
+    category_code: int = 0,
+    offset: int = 0,
+    limit: int = 100,
+) -> dict:
+    """
+    GET /api/hierarchy/stores/{storeKey}/categories/{categoryCode}/products
+    Raises KeyError for an unknown store/category pair.
+    """
+    snapshot = get_hierarchy_snapshot(client, table_name, category_map)
+    offset = max(0, int(offset))
+    limit = max(1, int(limit))
+    products, total = snapshot.product_nodes(store_key, category_code, offset, limit)
+    return {
+        "version": snapshot.version,
+        "store": store_key,
+        "category": str(category_code),
+        "products": products,
+        "pagination": {
+            "offset": offset,
+            "limit": limit,
+            "total": total,
+        },
+    }
 
 
 def get_stores(
@@ -285,10 +279,15 @@ def get_products(
     table_name: str = "demoVerileri",
     region_ids: list[str] | None = None,
     store_ids: list[str] | None = None,
-    category_ids: list[str] | None = None
+    category_ids: list[str] | None = None,
+    search: str | None = None,
+    limit: int | None = None,
+    cursor: str | None = None,
 ) -> dict:
     """
-    Returns flat product list.
+    Returns flat product list, ordered by label.
+    With `limit`, returns at most that many products and a `nextCursor`
+    (keyset on label, value) when more remain.
 
     Product value format:
       {storeValue}_{categoryValue}_{productValue}
@@ -299,7 +298,7 @@ def get_products(
     Optional filters:
       - regionIds (cografi_bolge)
       - storeIds (magazakodu)
-      - categoryIds (store_sektorkodu)
+      - categoryIds (reyonkodu, as /api/categories returns it)
     """
 
     where_clauses = ["1=1"]
@@ -323,7 +322,7 @@ def get_products(
                 if len(parts) == 2:
                     store_val, category_val = parts
                     composite_filters.append(
-                        f"(toString(magazakodu) = '{store_val}' AND toString(sektorkodu) = '{category_val}')"
+                        f"(toString(magazakodu) = '{store_val}' AND toString(reyonkodu) = '{category_val}')"
                     )
             else:
                 simple_ids.append(f"'{cid}'")
@@ -333,15 +332,29 @@ def get_products(
             conditions.append("(" + " OR ".join(composite_filters) + ")")
         
         if simple_ids:
-            conditions.append(f"toString(sektorkodu) IN ({', '.join(simple_ids)})")
+            conditions.append(f"toString(reyonkodu) IN ({', '.join(simple_ids)})")
             
         if conditions:
             where_clauses.append("(" + " OR ".join(conditions) + ")")
 
+    if search:
+        where_clauses.append(product_search_clause(client, table_name, search))
+
     where_sql = ""
     if where_clauses:
         where_sql = "WHERE " + " AND ".join(where_clauses)
 
+    def _ch_str(value) -> str:
+        return "'" + str(value).replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+    having_sql = ""
+    cursor_payload = decode_cursor(cursor)
+    if cursor_payload and "label" in cursor_payload and "value" in cursor_payload:
+        having_sql = (
+            f"HAVING (label, value) > ({_ch_str(cursor_payload['label'])}, {_ch_str(cursor_payload['value'])})"
+        )
+    limit_sql = f"LIMIT {int(limit) + 1}" if limit else ""
+
     query = f"""
     SELECT
         concat(
@@ -368,12 +381,21 @@ def get_products(
         value,
         label,
         categoryKey
-    ORDER BY label
+    {having_sql}
+    ORDER BY label, value
+    {limit_sql}
     """
 
     df = client.query_df(query)
 
+    next_cursor = None
+    if limit and len(df) > limit:
+        df = df.iloc[:limit]
+        last = df.iloc[-1]
+        next_cursor = encode_cursor({"label": str(last["label"]), "value": str(last["value"])})
+
     return {
+        "nextCursor": next_cursor,
         "products": [
             {
                 "value": row["value"],
@@ -393,6 +415,57 @@ def get_products(
     }
 
 
+def search_products(
+    client,
+    table_name: str = "demoVerileri",
+    query: str = "",
+    limit: int = 10,
+) -> dict:
+    """
+    GET /api/products/search
+    Ranked typeahead over product names from the in-memory index.
+    """
+    index = get_product_search_index(client, table_name)
+    return {
+        "products": [
+            {"value": str(code), "label": name, "score": score}
+            for code, name, score in index.search(query, limit=max(1, int(limit)))
+        ]
+    }
+
+
+def get_filter_options(
+    client,
+    table_name: str = "demoVerileri",
+    region_ids: list[str] | None = None,
+    store_ids: list[str] | None = None,
+    category_ids: list[str] | None = None,
+    product_ids: list[str] | None = None,
+    product_limit: int = 500,
+) -> dict:
+    """
+    GET /api/filters/options
+    Valid options and listing counts for every filter level given a partial
+    selection, from the in-memory membership index. Each level is constrained
+    by the selections of the other levels.
+    """
+    index = get_filter_index(client, table_name, category_map)
+    selection = {
+        "region": [str(r).lower() for r in region_ids or []],
+        "store": [int(s) for s in _normalize_filter_ids(store_ids)],
+        "category": [int(c) for c in _normalize_filter_ids(category_ids)],
+        "product": [int(p) for p in _normalize_filter_ids(product_ids)],
+    }
+    options = index.options(selection, product_limit=max(1, int(product_limit)))
+    return {
+        "version": index.version,
+        "regions": options["region"],
+        "stores": options["store"],
+        "categories": options["category"],
+        "products": options["product"],
+    }
+
+
 def get_reyonlar(
     
     client,
@@ -1006,8 +1079,7 @@ def get_inventory_alerts(
         where_clauses.append(f"toString(urunkodu) IN ({prods})")
 
     if search:
-        safe_search = str(search).lower().replace("'", "''")
-        where_clauses.append(f"lower(urunismi) LIKE '%{safe_search}%'")
+        where_clauses.append(product_search_clause(client, table_name, search))
 
     where_sql = " AND ".join(where_clauses)
 
@@ -1368,7 +1440,7 @@ def get_demand_kpis(
             high_growth
         ) = client.query(query).result_set[0]
     except Exception as e:
-        print(f"Error executing demand KPIs query: {e}")
+        logger.exception("Error executing demand KPIs query")
         return {
             "totalForecast": {"value": 0, "units": 0, "trend": 0.0},
             "accuracy": {"value": 0.0, "trend": 0.0},
@@ -1466,7 +1538,7 @@ def get_demand_year_comparison(
     try:
         rows = client.query(query).result_set
     except Exception as e:
-        print(f"Error executing demand year comparison query: {e}")
+        logger.exception("Error executing demand year comparison query")
         return {"data": [], "error": str(e)}
 
     lookup = {}
@@ -1532,7 +1604,7 @@ def get_demand_monthly_bias(
     try:
         rows = client.query(query).result_set
     except Exception as e:
-        print(f"Error executing demand monthly bias query: {e}")
+        logger.exception("Error executing demand monthly bias query")
         return {"data": [], "error": str(e)}
 
     ay_map = {
@@ -1678,7 +1750,7 @@ def get_demand_trend_forecast(
     try:
         rows = client.query(query).result_rows
     except Exception as e:
-        print(f"Error executing trend forecast query: {e}")
+        logger.exception("Error executing trend forecast query")
         return {"data": [], "error": str(e)}
 
     by_date = {}
@@ -2076,7 +2148,7 @@ def get_growth_products(
         SELECT
             toString(urunkodu) AS sku,
             any(urunismi) AS product_name,
-            any(reyonkodu) AS reyonkodu,
+            any(reyonkodu) AS reyon_code,
             sumIf(satismiktari, tarih >= today() - {safe_days} AND tarih < today()) AS current_sales,
             sumIf(
                 satismiktari,
@@ -2094,7 +2166,7 @@ def get_growth_products(
     SELECT
         sku,
         product_name,
-        reyonkodu,
+        reyon_code,
         current_sales,
         last_sales,
         growth_pct,
@@ -2263,136 +2335,273 @@ def get_similar_campaigns(
     store_ids: list[str] | None = None,
     region_ids: list[str] | None = None,
     category_ids: list[str] | None = None,
-    limit: int = 5
+    limit: int = 5,
+    campaign_id: str | None = None,
+    target: dict | None = None,
 ) -> dict:
     """
     GET /api/forecast/similar-campaigns
+
+    k-nearest campaigns from the in-memory campaign feature index.
+    The target is an existing campaign (`campaign_id`), a hypothetical one
+    (`target`: discount, durationDays, promotionType, startDate, categoryCodes,
+    lift, sellThrough), or, when neither is given, the centroid of the scope.
     """
 
-    where_clauses = [
-        "aktifPromosyonKodu > 0",
-        "aktifPromosyonAdi != 'Tayin edilmedi'"
-    ]
+    index = get_campaign_index(client, table_name, category_map)
 
-    if promotion_type:
-        where_clauses.append(
-            f"""
-            multiIf(
-                KATALOG=1, 'KATALOG',
-                LEAFLET=1, 'LEAFLET',
-                `GAZETE ILANI`=1, 'GAZETE ILANI',
-                `Hybris % Kampanya`=1, 'INTERNET_INDIRIMI',
-                HYBR=1, 'HYBR',
-                'DIGER'
-            ) = '{promotion_type}'
-            """
-        )
+    scope = index.scope_mask(
+        store_codes=[int(s) for s in _normalize_filter_ids(store_ids)],
+        regions=region_ids,
+        category_codes=[int(c) for c in _normalize_filter_ids(category_ids)],
+        product_codes=_normalize_filter_ids(product_ids),
+        promotion_type=promotion_type,
+    )
 
-    if product_ids:
-        where_clauses.append(
-            "urunkodu IN (" + ",".join([f"'{p}'" for p in product_ids]) + ")"
-        )
+    hypothetical = dict(target or {})
+    if hypothetical.get("categoryCodes"):
+        hypothetical["categoryCodes"] = _normalize_filter_ids(hypothetical["categoryCodes"])
+    if hypothetical and promotion_type and not hypothetical.get("promotionType"):
+        hypothetical["promotionType"] = promotion_type
+
+    target_vector, active, exclude = index.target_vector(
+        campaign_id=campaign_id,
+        hypothetical=hypothetical,
+        scope=scope,
+    )
+    rows, scores = index.nearest(target_vector, active, scope, k=max(1, int(limit)), exclude=exclude)
+
+    return {
+        "campaigns": [index.describe(int(row), float(score)) for row, score in zip(rows, scores)]
+    }
+
+from typing import List, Optional
+
+
+CALENDAR_CACHE_MB = int(os.getenv("CALENDAR_CACHE_MB", "64"))
+CALENDAR_CACHE_TTL_SECONDS = int(os.getenv("CALENDAR_CACHE_TTL_SECONDS", "21600"))
+
+# One entry per (filters, year, month). Closed months are keyed without the
+# data version so daily ETL loads do not evict them.
+_calendar_month_cache = SnapshotCache(
+    max_bytes=CALENDAR_CACHE_MB * 1024 * 1024,
+    ttl_seconds=CALENDAR_CACHE_TTL_SECONDS,
+    name="calendar_month",
+)
+
+
+def _calendar_where(
+    store_ids: Optional[List[str]] = None,
+    region_ids: Optional[List[str]] = None,
+    category_ids: Optional[List[str]] = None,
+) -> list[str]:
+    where_clauses = ["aktifPromosyonKodu IS NOT NULL"]
 
     if store_ids:
-        where_clauses.append(
-            "toString(magazakodu) IN (" + ",".join([f"'{s}'" for s in store_ids]) + ")"
-        )
+        store_list = ", ".join(f"'{str(s).strip()}'" for s in store_ids)
+        where_clauses.append(f"toString(magazakodu) IN ({store_list})")
 
     if region_ids:
-        where_clauses.append(
-            "lowerUTF8(cografi_bolge) IN (" + ",".join([f"'{r.lower()}'" for r in region_ids]) + ")"
-        )
+        region_list = ", ".join(f"'{r.lower()}'" for r in region_ids)
+        where_clauses.append(f"lowerUTF8(cografi_bolge) IN ({region_list})")
 
     if category_ids:
-        where_clauses.append(
-            "toString(reyonkodu) IN (" + ",".join([f"'{c}'" for c in category_ids]) + ")"
-        )
+        category_list = ", ".join(f"'{c}'" for c in category_ids)
+        where_clauses.append(f"toString(reyonkodu) IN ({category_list})")
 
-    where_sql = "WHERE " + " AND ".join(where_clauses)
+    return where_clauses
 
-    query = f"""
-    WITH campaign_stats AS (
-        SELECT
-            aktifPromosyonKodu                         AS campaign_id,
-            any(aktifPromosyonAdi)                     AS name,
-            min(tarih)                                 AS start_date,
-            max(tarih)                                 AS end_date,
 
-            multiIf(
-                max(KATALOG)=1, 'KATALOG',
-                max(LEAFLET)=1, 'LEAFLET',
-                max(`GAZETE ILANI`)=1, 'GAZETE ILANI',
-                max(`Hybris % Kampanya`)=1, 'INTERNET_INDIRIMI',
-                max(HYBR)=1, 'HYBR',
-                'DIGER'
-            ) AS type,
+def _month_start(year: int, month: int) -> date:
+    return date(int(year), int(month), 1)
 
-            round(
-                100 * (
-                    sum(satismiktari * satisFiyati)
-                    - sum(roll_mean_7 * satisFiyati)
-                )
-                / nullIf(sum(roll_mean_7 * satisFiyati), 0),
-            0) AS lift,
 
-            countIf(stok_out = 1)                      AS stockOutDays,
+def _next_month(d: date) -> date:
+    return date(d.year + (d.month == 12), d.month % 12 + 1, 1)
 
-            round(sum(roll_mean_7 * satisFiyati), 0)   AS targetRevenue,
-            round(sum(satismiktari * satisFiyati), 0)  AS actualRevenue,
 
-            dateDiff('day', min(tarih), max(tarih)) + 1 AS actualStockDays,
+def _calendar_months(
+    client,
+    table_name: str,
+    where_clauses: list[str],
+    months: list[tuple[int, int]],
+) -> dict:
+    """
+    Return {(year, month): {date_key: [promo, ...]}} for the requested months.
+    Months missing from the cache are fetched together in one date-range scan
+    (prunable by the tarih partition key) and cached one bucket per month.
+    """
+    where_sql = " AND ".join(where_clauses)
+    latest_date = get_latest_date(client, table_name)
+    data_version = get_data_version(client, table_name)
+
+    def cache_key(year: int, month: int) -> tuple:
+        closed = _next_month(_month_start(year, month)) <= latest_date
+        return (table_name, where_sql, year, month, "closed" if closed else data_version)
+
+    result = {}
+    missing = []
+    for year, month in months:
+        cached = _calendar_month_cache.get(cache_key(year, month))
+        if cached is None:
+            missing.append((year, month))
+        else:
+            result[(year, month)] = cached
 
-            round(
-                100 * sum(satismiktari)
-                / nullIf(sum(stok + satismiktari), 1),
-            0) AS sellThrough,
+    if missing:
+        scan_start = _month_start(*min(missing))
+        scan_end = _next_month(_month_start(*max(missing)))
 
-            round(
-                sum(
-                    (roll_mean_7 - satismiktari)
-                    * satisFiyati
-                ),
-            0) AS markdownCost
+        query = f"""
+            SELECT
+                toDate(tarih) AS event_date,
+                aktifPromosyonKodu AS promo_id,
+                any(aktifPromosyonAdi) AS promo_name,
+                multiIf(
+                    KATALOG = 1, 'Katalog',
+                    LEAFLET = 1, 'Leaflet',
+                    `GAZETE ILANI` = 1, 'Gazete İlanı',
+                    `Hybris % Kampanya` = 1, 'Hybris % Kampanya',
+                    HYBR = 1, 'Hybrid',
+                    'Diğer'
+                ) AS promo_type,
+                round(any(indirimYuzdesi), 0) AS discount
+            FROM {table_name}
+            WHERE {where_sql}
+              AND tarih >= toDate('{scan_start.isoformat()}')
+              AND tarih < toDate('{scan_end.isoformat()}')
+            GROUP BY
+                event_date,
+                promo_id,
+                promo_type
+            ORDER BY event_date ASC
+        """
 
-        FROM {table_name}
-        {where_sql}
-        GROUP BY aktifPromosyonKodu
-    )
+        fetched = {key: {} for key in missing}
+        for event_date, promo_id, promo_name, promo_type, discount in client.query(query).result_rows:
+            bucket = fetched.get((event_date.year, event_date.month))
+            if bucket is None:
+                continue
+            bucket.setdefault(event_date.isoformat(), []).append({
+                "id": str(promo_id),
+                "name": promo_name,
+                "type": promo_type,
+                "discount": int(discount) if discount is not None else None
+            })
 
-    SELECT
-        concat('SC-', toString(campaign_id))            AS id,
-        name,
-        formatDateTime(start_date, '%b %Y')             AS date,
-        type,
-        lift,
-
-        stockOutDays,
-        targetRevenue,
-        actualRevenue,
-        actualStockDays,
-        actualStockDays                                AS plannedStockDays,
-        sellThrough,
-        markdownCost,
-
-        greatest(
-            0,
-            100
-            - abs(lift - avg(lift) OVER ())
-            - abs(actualStockDays - avg(actualStockDays) OVER ()) * 2
-        ) AS similarityScore
-
-    FROM campaign_stats
-    ORDER BY similarityScore DESC
-    LIMIT {limit}
+        for (year, month), bucket in fetched.items():
+            _calendar_month_cache.put(cache_key(year, month), bucket)
+            result[(year, month)] = bucket
+
+    return result
+
+
+def _add_future_events(
+    client,
+    table_name: str,
+    where_clauses: list[str],
+    calendar_map: dict,
+    future_count: int,
+    seed_src: str,
+) -> None:
+    """
+    Merge promotions of the next `future_count` days into calendar_map.
+    If no real forward data exists, synthesize upcoming promotions from recent
+    templates in the same filtered scope (V5-style fallback).
     """
+    today_date = date.today()
+    horizon_last = today_date + timedelta(days=int(future_count) - 1)
 
-    df = client.query_df(query)
+    future_months = []
+    cursor = _month_start(today_date.year, today_date.month)
+    while cursor <= horizon_last:
+        future_months.append((cursor.year, cursor.month))
+        cursor = _next_month(cursor)
 
-    return {
-        "campaigns": df.to_dict(orient="records")
-    }
+    for bucket in _calendar_months(client, table_name, where_clauses, future_months).values():
+        for date_key, promos in bucket.items():
+            if not (today_date <= date.fromisoformat(date_key) <= horizon_last):
+                continue
+            existing_promos = calendar_map.setdefault(date_key, [])
+            for promo in promos:
+                if not any(str(p.get("id")) == promo["id"] for p in existing_promos):
+                    existing_promos.append(dict(promo))
 
-from typing import List, Optional
+    has_upcoming = any(date.fromisoformat(d) >= today_date for d in calendar_map.keys())
+    if has_upcoming:
+        return
+
+    template_query = f"""
+        SELECT
+            toString(aktifPromosyonKodu) AS promo_id,
+            any(aktifPromosyonAdi) AS promo_name,
+            multiIf(
+                KATALOG = 1, 'Katalog',
+                LEAFLET = 1, 'Leaflet',
+                `GAZETE ILANI` = 1, 'Gazete İlanı',
+                `Hybris % Kampanya` = 1, 'Hybris % Kampanya',
+                HYBR = 1, 'Hybrid',
+                'Diğer'
+            ) AS promo_type,
+            round(avg(indirimYuzdesi), 0) AS avg_discount,
+            count() AS cnt
+        FROM {table_name}
+        WHERE {" AND ".join(where_clauses)}
+        GROUP BY promo_id, promo_type
+        ORDER BY cnt DESC
+        LIMIT 12
+    """
+
+    template_rows = client.query(template_query).result_rows
+
+    templates = []
+    for promo_id, promo_name, promo_type, avg_discount, _cnt in template_rows:
+        promo_id_text = str(promo_id)
+        promo_name_text = str(promo_name or "").strip()
+        # skip no-promo / undefined labels
+        if promo_id_text == "17":
+            continue
+        if promo_name_text.lower() in {"", "tayin edilmedi"}:
+            continue
+        templates.append({
+            "id": promo_id_text,
+            "name": promo_name_text,
+            "type": str(promo_type or "Diğer"),
+            "discount": int(avg_discount) if avg_discount is not None else None,
+        })
+
+    if not templates:
+        templates = [
+            {"id": "6", "name": "GAZETE ILANI", "type": "Gazete İlanı", "discount": 15},
+            {"id": "10", "name": "KATALOG", "type": "Katalog", "discount": 8},
+            {"id": "12", "name": "Mağ.İçi Akt-FMCG", "type": "Diğer", "discount": 10},
+            {"id": "16", "name": "ZKAE", "type": "Diğer", "discount": 6},
+        ]
+
+    seed_val = int(hashlib.md5(seed_src.encode("utf-8")).hexdigest()[:8], 16)
+    rng = random.Random(seed_val)
+
+    campaign_count = min(max(4, int(future_count) // 2), 12)
+
+    for _ in range(campaign_count):
+        tpl = templates[rng.randrange(len(templates))]
+        start_offset = rng.randint(0, max(0, int(future_count) - 1))
+        duration = rng.randint(1, min(7, int(future_count)))
+        start_day = today_date + timedelta(days=start_offset)
+
+        for step in range(duration):
+            day = start_day + timedelta(days=step)
+            if day > horizon_last:
+                break
+            date_key = day.isoformat()
+            existing_promos = calendar_map.setdefault(date_key, [])
+            if not any(str(p.get("id")) == tpl["id"] for p in existing_promos):
+                existing_promos.append({
+                    "id": tpl["id"],
+                    "name": tpl["name"],
+                    "type": tpl["type"],
+                    "discount": tpl["discount"],
+                })
 
 
 def get_forecast_calendar(
@@ -2413,225 +2622,263 @@ def get_forecast_calendar(
     if month is None or year is None:
         raise ValueError("month ve year zorunludur")
 
-    where_clauses = [
-        "aktifPromosyonKodu IS NOT NULL"
-    ]
+    where_clauses = _calendar_where(store_ids, region_ids, category_ids)
+    month_events = _calendar_months(client, table_name, where_clauses, [(int(year), int(month))])
 
-    # 🔴 FIX: magazakodu UInt → toString + lower
-    if store_ids:
-        store_list = ", ".join(f"'{s.lower()}'" for s in store_ids)
-        where_clauses.append(
-            f"lower(toString(magazakodu)) IN ({store_list})"
-        )
+    calendar_map = {
+        date_key: [dict(promo) for promo in promos]
+        for date_key, promos in month_events[(int(year), int(month))].items()
+    }
 
-    if region_ids:
-        region_list = ", ".join(f"'{r.lower()}'" for r in region_ids)
-        where_clauses.append(
-            f"lowerUTF8(cografi_bolge) IN ({region_list})"
+    if include_future and future_count > 0:
+        _add_future_events(
+            client,
+            table_name,
+            where_clauses,
+            calendar_map,
+            future_count,
+            seed_src=f"{month}-{year}-{store_ids}-{region_ids}-{category_ids}-{future_count}",
         )
 
-    if category_ids:
-        category_list = ", ".join(f"'{c}'" for c in category_ids)
-        where_clauses.append(
-            f"toString(reyonkodu) IN ({category_list})"
+    return {
+        "events": [
+            {"date": d, "promotions": promos}
+            for d, promos in sorted(calendar_map.items(), key=lambda item: item[0])
+        ]
+    }
+
+
+def get_forecast_calendar_range(
+    client,
+    table_name: str = "demoVerileri",
+    store_ids: Optional[List[str]] = None,
+    region_ids: Optional[List[str]] = None,
+    category_ids: Optional[List[str]] = None,
+    from_month: str = None,   # YYYY-MM
+    to_month: str = None,     # YYYY-MM
+    include_future: bool = False,
+    future_count: int = 10,
+) -> dict:
+    """
+    GET /api/forecast/calendar-range
+    Events for every month in [from_month, to_month], grouped per month.
+    Uncached months are fetched in a single scan.
+    """
+
+    def parse_month(value: str) -> date:
+        try:
+            year_text, month_text = str(value).split("-", 1)
+            return _month_start(int(year_text), int(month_text))
+        except Exception:
+            raise ValueError(f"Gecersiz ay formati: {value} (YYYY-MM bekleniyor)")
+
+    first = parse_month(from_month)
+    last = parse_month(to_month)
+    if last < first:
+        raise ValueError("to_month, from_month'tan once olamaz")
+
+    months = []
+    cursor = first
+    while cursor <= last:
+        months.append((cursor.year, cursor.month))
+        cursor = _next_month(cursor)
+    if len(months) > 24:
+        raise ValueError("En fazla 24 aylik aralik istenebilir")
+
+    where_clauses = _calendar_where(store_ids, region_ids, category_ids)
+    month_events = _calendar_months(client, table_name, where_clauses, months)
+
+    calendar_map = {
+        date_key: [dict(promo) for promo in promos]
+        for key in months
+        for date_key, promos in month_events[key].items()
+    }
+
+    if include_future and future_count > 0:
+        _add_future_events(
+            client,
+            table_name,
+            where_clauses,
+            calendar_map,
+            future_count,
+            seed_src=f"{from_month}-{to_month}-{store_ids}-{region_ids}-{category_ids}-{future_count}",
         )
 
-    where_clauses.append(f"toYear(tarih) = {year}")
-    where_clauses.append(f"toMonth(tarih) = {month}")
+    by_month: dict[tuple, list] = {key: [] for key in months}
+    for d, promos in sorted(calendar_map.items(), key=lambda item: item[0]):
+        event_day = date.fromisoformat(d)
+        bucket = by_month.get((event_day.year, event_day.month))
+        if bucket is not None:
+            bucket.append({"date": d, "promotions": promos})
 
-    where_sql = " AND ".join(where_clauses)
+    return {
+        "months": [
+            {"year": year, "month": month, "events": by_month[(year, month)]}
+            for year, month in months
+        ]
+    }
 
-    query = f"""
-        SELECT
-            toDate(tarih) AS event_date,
-            aktifPromosyonKodu AS promo_id,
-            any(aktifPromosyonAdi) AS promo_name,
-            multiIf(
-                KATALOG = 1, 'Katalog',
-                LEAFLET = 1, 'Leaflet',
-                `GAZETE ILANI` = 1, 'Gazete İlanı',
-                `Hybris % Kampanya` = 1, 'Hybris % Kampanya',
-                HYBR = 1, 'Hybrid',
-                'Diğer'
-            ) AS promo_type,
-            round(any(indirimYuzdesi), 0) AS discount
-        FROM {table_name}
-        WHERE {where_sql}
-        GROUP BY
-            event_date,
-            promo_id,
-            promo_type
-        ORDER BY event_date ASC
-    """
 
-    rows = client.query(query).result_rows
+from typing import List, Optional
 
-    calendar_map = {}
 
-    for event_date, promo_id, promo_name, promo_type, discount in rows:
-        date_key = event_date.isoformat()
+INVENTORY_SNAPSHOT_CACHE_MB = int(os.getenv("INVENTORY_SNAPSHOT_CACHE_MB", "256"))
+INVENTORY_SNAPSHOT_TTL_SECONDS = int(os.getenv("INVENTORY_SNAPSHOT_TTL_SECONDS", "900"))
 
-        calendar_map.setdefault(date_key, []).append({
-            "id": str(promo_id),
-            "name": promo_name,
-            "type": promo_type,
-            "discount": int(discount) if discount is not None else None
-        })
+# Columnar inventory snapshots per filter set, plus the sorted views derived from them.
+_inventory_snapshot_cache = SnapshotCache(
+    max_bytes=INVENTORY_SNAPSHOT_CACHE_MB * 1024 * 1024,
+    ttl_seconds=INVENTORY_SNAPSHOT_TTL_SECONDS,
+    name="inventory_snapshot",
+)
 
-    if include_future and future_count > 0:
-        future_where = [
-            "aktifPromosyonKodu IS NOT NULL",
-            "toDate(tarih) >= today()",
-            f"toDate(tarih) <= addDays(today(), {int(future_count) - 1})",
-        ]
+INVENTORY_SORT_FIELDS = {
+    "stockValue",
+    "stockLevel",
+    "forecastedDemand",
+    "daysOfCoverage",
+    "price",
+    "todaysSales",
+}
 
-        if store_ids:
-            store_list = ", ".join(f"'{s.lower()}'" for s in store_ids)
-            future_where.append(f"lower(toString(magazakodu)) IN ({store_list})")
 
-        if region_ids:
-            region_list = ", ".join(f"'{r.lower()}'" for r in region_ids)
-            future_where.append(f"lowerUTF8(cografi_bolge) IN ({region_list})")
+def _load_inventory_snapshot(
+    client,
+    table_name: str,
+    where_sql: str,
+    aggregate_by_store: bool,
+) -> dict:
+    """
+    One scan over the filtered history: latest stock/forecast/value/price per
+    store x category x product, today's sales and last restock date.
+    Returns NumPy columns at the granularity served by /api/inventory/items.
+    """
 
-        if category_ids:
-            category_list = ", ".join(f"'{c}'" for c in category_ids)
-            future_where.append(f"toString(reyonkodu) IN ({category_list})")
+    base_snapshot = f"""
+        SELECT
+            toString(urunkodu)                                      AS sku,
+            toString(reyonkodu)                                     AS category,
+            toString(magazakodu)                                    AS store,
+            greatest(toFloat64(argMax(stok, tarih)), 0)             AS stockLevel,
+            greatest(toFloat64(argMax(roll_mean_7, tarih)), 0)      AS forecastDaily,
+            greatest(toFloat64(argMax(degerlenmisstok, tarih)), 0)  AS stockValue,
+            greatest(toFloat64(argMax(satisFiyati, tarih)), 0)      AS price,
+            argMax(urunismi, tarih)                                 AS productName,
+            greatest(sumIf(satismiktari, tarih = today()), 0)       AS todaysSales,
+            maxIf(tarih, stok > 0)                                  AS lastRestockDate
+        FROM {table_name}
+        WHERE {where_sql}
+        GROUP BY urunkodu, reyonkodu, magazakodu
+    """
 
-        future_query = f"""
+    if aggregate_by_store:
+        query = f"""
             SELECT
-                toDate(tarih) AS event_date,
-                aktifPromosyonKodu AS promo_id,
-                any(aktifPromosyonAdi) AS promo_name,
-                multiIf(
-                    KATALOG = 1, 'Katalog',
-                    LEAFLET = 1, 'Leaflet',
-                    `GAZETE ILANI` = 1, 'Gazete İlanı',
-                    `Hybris % Kampanya` = 1, 'Hybris % Kampanya',
-                    HYBR = 1, 'Hybrid',
-                    'Diğer'
-                ) AS promo_type,
-                round(any(indirimYuzdesi), 0) AS discount
-            FROM {table_name}
-            WHERE {" AND ".join(future_where)}
-            GROUP BY
-                event_date,
-                promo_id,
-                promo_type
-            ORDER BY event_date ASC
+                sku,
+                productName,
+                category,
+                concat(store, '_', category, '_', sku)  AS productKey,
+                stockLevel,
+                forecastDaily,
+                stockValue,
+                toFloat64(todaysSales)                  AS todaysSalesFloat,
+                lastRestockDate,
+                price
+            FROM (
+                {base_snapshot}
+            )
+        """
+    else:
+        query = f"""
+            SELECT
+                sku,
+                any(productName)                        AS productNameAny,
+                any(category)                           AS categoryAny,
+                sku                                     AS productKey,
+                sum(stockLevel)                         AS stockLevelSum,
+                sum(forecastDaily)                      AS fdDailySum,
+                sum(stockValue)                         AS stockValueSum,
+                toFloat64(sum(todaysSales))             AS todaysSalesSum,
+                max(lastRestockDate)                    AS lastRestockDateMax,
+                avg(price)                              AS priceAvg
+            FROM (
+                {base_snapshot}
+            )
+            GROUP BY sku
         """
 
-        future_rows = client.query(future_query).result_rows
+    columns = client.query(query).result_columns
+    names = [
+        "sku", "productName", "category", "productKey",
+        "stockLevel", "forecastDaily", "stockValue", "todaysSales",
+        "lastRestockDate", "price",
+    ]
+    if not columns:
+        columns = [[] for _ in names]
+
+    snapshot = {}
+    for name, values in zip(names, columns):
+        if name in {"sku", "category", "productKey"}:
+            snapshot[name] = np.asarray([str(v) for v in values], dtype=str)
+        elif name in {"productName", "lastRestockDate"}:
+            snapshot[name] = np.asarray(list(values), dtype=object)
+        else:
+            snapshot[name] = np.asarray(
+                [float(v) if v is not None else 0.0 for v in values], dtype=np.float64
+            )
+    return snapshot
 
-        for event_date, promo_id, promo_name, promo_type, discount in future_rows:
-            date_key = event_date.isoformat()
-            existing_promos = calendar_map.setdefault(date_key, [])
-            if not any(str(p.get("id")) == str(promo_id) for p in existing_promos):
-                existing_promos.append({
-                    "id": str(promo_id),
-                    "name": promo_name,
-                    "type": promo_type,
-                    "discount": int(discount) if discount is not None else None
-                })
 
-        # If real forward data does not exist, synthesize upcoming promotions
-        # using recent templates from the same filtered scope (V5-style fallback).
-        today_date = date.today()
-        has_upcoming = any(date.fromisoformat(d) >= today_date for d in calendar_map.keys())
-
-        if not has_upcoming:
-            template_where = ["aktifPromosyonKodu IS NOT NULL"]
-            if store_ids:
-                store_list = ", ".join(f"'{s.lower()}'" for s in store_ids)
-                template_where.append(f"lower(toString(magazakodu)) IN ({store_list})")
-            if region_ids:
-                region_list = ", ".join(f"'{r.lower()}'" for r in region_ids)
-                template_where.append(f"lowerUTF8(cografi_bolge) IN ({region_list})")
-            if category_ids:
-                category_list = ", ".join(f"'{c}'" for c in category_ids)
-                template_where.append(f"toString(reyonkodu) IN ({category_list})")
-
-            template_query = f"""
-                SELECT
-                    toString(aktifPromosyonKodu) AS promo_id,
-                    any(aktifPromosyonAdi) AS promo_name,
-                    multiIf(
-                        KATALOG = 1, 'Katalog',
-                        LEAFLET = 1, 'Leaflet',
-                        `GAZETE ILANI` = 1, 'Gazete İlanı',
-                        `Hybris % Kampanya` = 1, 'Hybris % Kampanya',
-                        HYBR = 1, 'Hybrid',
-                        'Diğer'
-                    ) AS promo_type,
-                    round(avg(indirimYuzdesi), 0) AS avg_discount,
-                    count() AS cnt
-                FROM {table_name}
-                WHERE {" AND ".join(template_where)}
-                GROUP BY promo_id, promo_type
-                ORDER BY cnt DESC
-                LIMIT 12
-            """
-
-            template_rows = client.query(template_query).result_rows
-
-            templates = []
-            for promo_id, promo_name, promo_type, avg_discount, _cnt in template_rows:
-                promo_id_text = str(promo_id)
-                promo_name_text = str(promo_name or "").strip()
-                # skip no-promo / undefined labels
-                if promo_id_text == "17":
-                    continue
-                if promo_name_text.lower() in {"", "tayin edilmedi"}:
-                    continue
-                templates.append({
-                    "id": promo_id_text,
-                    "name": promo_name_text,
-                    "type": str(promo_type or "Diğer"),
-                    "discount": int(avg_discount) if avg_discount is not None else None,
-                })
+def _inventory_view(snapshot: dict, days: int, status: str | None, sort_by: str, descending: bool) -> dict:
+    """
+    Derive the days-dependent metrics, apply the status filter and sort.
+    The sort key maps NULL-like values (no forecast / no stock) to +inf so
+    they land last in both directions, matching ClickHouse NULLS LAST.
+    """
+    fd = snapshot["forecastDaily"]
+    stock = snapshot["stockLevel"]
 
-            if not templates:
-                templates = [
-                    {"id": "6", "name": "GAZETE ILANI", "type": "Gazete İlanı", "discount": 15},
-                    {"id": "10", "name": "KATALOG", "type": "Katalog", "discount": 8},
-                    {"id": "12", "name": "Mağ.İçi Akt-FMCG", "type": "Diğer", "discount": 10},
-                    {"id": "16", "name": "ZKAE", "type": "Diğer", "discount": 6},
-                ]
-
-            seed_src = f"{month}-{year}-{store_ids}-{region_ids}-{category_ids}-{future_count}"
-            seed_val = int(hashlib.md5(seed_src.encode("utf-8")).hexdigest()[:8], 16)
-            rng = random.Random(seed_val)
-
-            campaign_count = min(max(4, int(future_count) // 2), 12)
-            horizon_last = today_date + timedelta(days=int(future_count) - 1)
-
-            for _ in range(campaign_count):
-                tpl = templates[rng.randrange(len(templates))]
-                start_offset = rng.randint(0, max(0, int(future_count) - 1))
-                duration = rng.randint(1, min(7, int(future_count)))
-                start_day = today_date + timedelta(days=start_offset)
-
-                for step in range(duration):
-                    day = start_day + timedelta(days=step)
-                    if day > horizon_last:
-                        break
-                    date_key = day.isoformat()
-                    existing_promos = calendar_map.setdefault(date_key, [])
-                    if not any(str(p.get("id")) == tpl["id"] for p in existing_promos):
-                        existing_promos.append({
-                            "id": tpl["id"],
-                            "name": tpl["name"],
-                            "type": tpl["type"],
-                            "discount": tpl["discount"],
-                        })
+    with np.errstate(divide="ignore", invalid="ignore"):
+        coverage = np.where(fd > 0, np.round(stock / fd, 1), np.nan)
+        turnover = np.where(stock > 0, np.round(snapshot["todaysSales"] / stock, 2), np.nan)
 
-    return {
-        "events": [
-            {"date": d, "promotions": promos}
-            for d, promos in sorted(calendar_map.items(), key=lambda item: item[0])
-        ]
+    derived = {
+        "minStockLevel": np.round(fd * 3, 0),
+        "maxStockLevel": np.round(fd * days, 0),
+        "reorderPoint": np.round(fd * 7, 0),
+        "forecastedDemand": np.round(fd * days, 0),
+        "daysOfCoverage": coverage,
+        "turnoverRate": turnover,
+        "status": np.select(
+            [stock == 0, stock < fd * 3, stock > fd * days],
+            ["Out of Stock", "Low Stock", "Overstock"],
+            default="In Stock",
+        ),
     }
 
-from typing import List, Optional
+    rows = np.arange(len(stock))
+    if status in {"Out of Stock", "Low Stock", "Overstock", "In Stock"}:
+        rows = rows[derived["status"] == status]
+
+    if sort_by in derived:
+        sort_values = derived[sort_by][rows]
+    elif sort_by == "price":
+        sort_values = np.round(snapshot["price"][rows], 2)
+    else:
+        sort_values = snapshot[sort_by][rows]
+
+    sort_key = -sort_values if descending else sort_values.copy()
+    sort_key[np.isnan(sort_key)] = np.inf
+
+    product_keys = snapshot["productKey"][rows]
+    order = np.lexsort((product_keys, sort_key))
+
+    return {
+        "rows": rows[order],
+        "sortKey": sort_key[order],
+        "productKey": product_keys[order],
+        **derived,
+    }
 
 
 def get_inventory_items(
@@ -2647,22 +2894,23 @@ def get_inventory_items(
     limit: int = 50,
     sort_by: str = "stockValue",
     sort_order: str = "desc",
+    cursor: Optional[str] = None,
+    search: Optional[str] = None,
 ) -> dict:
     """
     GET /api/inventory/items
+
+    The filtered snapshot is computed once per filter set and data version and
+    kept in a size-bounded columnar cache; paging, sorting and status filtering
+    run in memory. `cursor` (from pagination.nextCursor) resumes after the last
+    row of the previous page instead of counting an offset.
     """
 
-    offset = (page - 1) * limit
-    sort_order = "ASC" if sort_order.lower() == "asc" else "DESC"
-    allowed_sort_fields = {
-        "stockValue",
-        "stockLevel",
-        "forecastedDemand",
-        "daysOfCoverage",
-        "price",
-        "todaysSales",
-    }
-    if sort_by not in allowed_sort_fields:
+    page = max(1, int(page))
+    limit = max(1, int(limit))
+    days = int(days)
+    descending = sort_order.lower() != "asc"
+    if sort_by not in INVENTORY_SORT_FIELDS:
         sort_by = "stockValue"
 
     where_clauses = ["1 = 1"]
@@ -2686,193 +2934,84 @@ def get_inventory_items(
         prods = ", ".join(f"'{p}'" for p in normalized_product_ids)
         where_clauses.append(f"toString(urunkodu) IN ({prods})")
 
-    where_sql = " AND ".join(where_clauses)
-    status_filter_sql = ""
-    if status in {"Out of Stock", "Low Stock", "Overstock", "In Stock"}:
-        status_filter_sql = f"HAVING status = '{status}'"
-
-    aggregate_by_store = bool(normalized_product_ids) and normalized_store_ids and len(normalized_store_ids) == 1
-
-    base_snapshot = f"""
-        SELECT
-            l.sku                     AS sku,
-            l.category                AS category,
-            l.store                   AS store,
-            l.stockLevel              AS stockLevel,
-            l.forecastDaily           AS forecastDaily,
-            l.stockValue              AS stockValue,
-            l.price                   AS price,
-            l.productName             AS productName,
-            a.todaysSales             AS todaysSales,
-            a.lastRestockDate         AS lastRestockDate
-        FROM (
-            SELECT
-                toString(urunkodu)     AS sku,
-                toString(reyonkodu)    AS category,
-                toString(magazakodu)   AS store,
-                greatest(toFloat64(stok), 0)            AS stockLevel,
-                greatest(toFloat64(roll_mean_7), 0)     AS forecastDaily,
-                greatest(toFloat64(degerlenmisstok), 0) AS stockValue,
-                greatest(toFloat64(satisFiyati), 0)     AS price,
-                urunismi               AS productName
-            FROM {table_name}
-            WHERE {where_sql}
-            ORDER BY tarih DESC
-            LIMIT 1 BY urunkodu, reyonkodu, magazakodu
-        ) AS l
-        LEFT JOIN (
-            SELECT
-                toString(urunkodu)     AS sku,
-                toString(reyonkodu)    AS category,
-                toString(magazakodu)   AS store,
-                greatest(sumIf(satismiktari, tarih = today()), 0) AS todaysSales,
-                maxIf(tarih, stok > 0) AS lastRestockDate
-            FROM {table_name}
-            WHERE {where_sql}
-            GROUP BY urunkodu, reyonkodu, magazakodu
-        ) AS a
-        ON l.sku = a.sku AND l.category = a.category AND l.store = a.store
-    """
-
-    if aggregate_by_store:
-        query = f"""
-            SELECT
-                sku                                                   AS id,
-                sku                                                   AS sku,
-                productName                                           AS productName,
-                category                                              AS category,
-                concat(store, '_', category, '_', sku)                AS productKey,
-
-                stockLevel                                            AS stockLevel,
-                round(forecastDaily * 3, 0)                           AS minStockLevel,
-                round(forecastDaily * {int(days)}, 0)                 AS maxStockLevel,
-                round(forecastDaily * 7, 0)                           AS reorderPoint,
-                round(forecastDaily * {int(days)}, 0)                 AS forecastedDemand,
-
-                stockValue                                            AS stockValue,
-                round(stockLevel / nullIf(forecastDaily, 0), 1)       AS daysOfCoverage,
+    if search:
+        where_clauses.append(product_search_clause(client, table_name, search))
 
-                multiIf(
-                    stockLevel = 0, 'Out of Stock',
-                    stockLevel < forecastDaily * 3, 'Low Stock',
-                    stockLevel > forecastDaily * {int(days)}, 'Overstock',
-                    'In Stock'
-                )                                                     AS status,
-
-                round(
-                    todaysSales / nullIf(stockLevel, 0),
-                    2
-                )                                                     AS turnoverRate,
-
-                lastRestockDate                                       AS lastRestockDate,
-                5                                                     AS leadTimeDays,
-                0                                                     AS quantityOnOrder,
-                todaysSales                                           AS todaysSales,
-                round(price, 2)                                       AS price
-            FROM (
-                {base_snapshot}
-            )
-            {status_filter_sql}
-            ORDER BY {sort_by} {sort_order}
-            LIMIT {limit} OFFSET {offset}
-        """
-    else:
-        query = f"""
-            SELECT
-                sku                                                   AS id,
-                sku                                                   AS sku,
-                productName                                           AS productName,
-                category                                              AS category,
-                sku                                                   AS productKey,
+    where_sql = " AND ".join(where_clauses)
 
-                stockLevelSum                                         AS stockLevel,
-                round(fdDailySum * 3, 0)                              AS minStockLevel,
-                round(fdDailySum * {int(days)}, 0)                    AS maxStockLevel,
-                round(fdDailySum * 7, 0)                              AS reorderPoint,
-                round(fdDailySum * {int(days)}, 0)                    AS forecastedDemand,
+    aggregate_by_store = bool(normalized_product_ids) and len(normalized_store_ids) == 1
 
-                stockValueSum                                         AS stockValue,
-                round(stockLevelSum / nullIf(fdDailySum, 0), 1)       AS daysOfCoverage,
+    snapshot_key = (table_name, get_data_version(client, table_name), where_sql, aggregate_by_store)
+    snapshot = _inventory_snapshot_cache.get_or_build(
+        snapshot_key,
+        lambda: _load_inventory_snapshot(client, table_name, where_sql, aggregate_by_store),
+    )
+    view = _inventory_snapshot_cache.get_or_build(
+        snapshot_key + ("view", days, status, sort_by, descending),
+        lambda: _inventory_view(snapshot, days, status, sort_by, descending),
+    )
 
-                multiIf(
-                    stockLevelSum = 0, 'Out of Stock',
-                    stockLevelSum < fdDailySum * 3, 'Low Stock',
-                    stockLevelSum > fdDailySum * {int(days)}, 'Overstock',
-                    'In Stock'
-                )                                                     AS status,
-
-                round(
-                    todaysSalesSum / nullIf(stockLevelSum, 0),
-                    2
-                )                                                     AS turnoverRate,
-
-                lastRestockDateMax                                    AS lastRestockDate,
-                5                                                     AS leadTimeDays,
-                0                                                     AS quantityOnOrder,
-                todaysSalesSum                                        AS todaysSales,
-                round(priceAvg, 2)                                    AS price
-            FROM (
-                SELECT
-                    sku,
-                    any(productName)                                  AS productName,
-                    any(category)                                     AS category,
-                    sum(stockLevel)                                   AS stockLevelSum,
-                    sum(stockValue)                                   AS stockValueSum,
-                    sum(todaysSales)                                  AS todaysSalesSum,
-                    max(lastRestockDate)                              AS lastRestockDateMax,
-                    avg(price)                                        AS priceAvg,
-                    sum(toFloat64(forecastDaily))                     AS fdDailySum
-                FROM (
-                    {base_snapshot}
-                )
-                GROUP BY sku
-            )
-            {status_filter_sql}
-            ORDER BY {sort_by} {sort_order}
-            LIMIT {limit} OFFSET {offset}
-        """
+    total = len(view["rows"])
+    total_pages = (total + limit - 1) // limit
 
-    items = client.query(query).result_rows
+    start = (page - 1) * limit
+    cursor_payload = decode_cursor(cursor)
+    if cursor_payload and cursor_payload.get("view") == [sort_by, descending, status, days]:
+        # Keyset: first row strictly after (sortKey, productKey) of the previous page.
+        last_key = float(cursor_payload.get("key", 0))
+        last_product_key = str(cursor_payload.get("id", ""))
+        lo = int(np.searchsorted(view["sortKey"], last_key, side="left"))
+        hi = int(np.searchsorted(view["sortKey"], last_key, side="right"))
+        start = lo + int(np.searchsorted(view["productKey"][lo:hi], last_product_key, side="right"))
+        page = start // limit + 1
+
+    end = min(start + limit, total)
+    positions = range(start, end)
+
+    next_cursor = None
+    if end < total and end > start:
+        next_cursor = encode_cursor({
+            "view": [sort_by, descending, status, days],
+            "key": float(view["sortKey"][end - 1]),
+            "id": str(view["productKey"][end - 1]),
+        })
 
-    count_query = f"""
-        SELECT countDistinct(sku)
-        FROM (
-            {base_snapshot}
-        )
-    """
-    total = client.query(count_query).result_rows[0][0]
-    total_pages = (total + limit - 1) // limit
+    items = []
+    for pos in positions:
+        i = int(view["rows"][pos])
+        last_restock = snapshot["lastRestockDate"][i]
+        coverage = view["daysOfCoverage"][i]
+        turnover = view["turnoverRate"][i]
+        items.append({
+            "id": str(snapshot["sku"][i]),
+            "sku": str(snapshot["sku"][i]),
+            "productName": snapshot["productName"][i],
+            "category": str(snapshot["category"][i]),
+            "productKey": str(snapshot["productKey"][i]),
+            "stockLevel": max(0, int(snapshot["stockLevel"][i])),
+            "minStockLevel": max(0, int(view["minStockLevel"][i])),
+            "maxStockLevel": max(0, int(view["maxStockLevel"][i])),
+            "reorderPoint": max(0, int(view["reorderPoint"][i])),
+            "forecastedDemand": max(0, int(view["forecastedDemand"][i])),
+            "stockValue": max(0, int(snapshot["stockValue"][i])),
+            "daysOfCoverage": max(0.0, float(coverage)) if not np.isnan(coverage) else 0.0,
+            "status": str(view["status"][i]),
+            "turnoverRate": max(0.0, float(turnover)) if not np.isnan(turnover) else 0.0,
+            "lastRestockDate": last_restock.isoformat() if last_restock else None,
+            "leadTimeDays": 5,
+            "quantityOnOrder": 0,
+            "todaysSales": max(0, int(snapshot["todaysSales"][i])),
+            "price": max(0.0, round(float(snapshot["price"][i]), 2)),
+        })
 
     return {
-        "items": [
-            {
-                "id": r[0],
-                "sku": r[1],
-                "productName": r[2],
-                "category": r[3],
-                "productKey": r[4],
-                "stockLevel": max(0, int(r[5] or 0)),
-                "minStockLevel": max(0, int(r[6] or 0)),
-                "maxStockLevel": max(0, int(r[7] or 0)),
-                "reorderPoint": max(0, int(r[8] or 0)),
-                "forecastedDemand": max(0, int(r[9] or 0)),
-                "stockValue": max(0, int(r[10] or 0)),
-                "daysOfCoverage": max(0.0, float(r[11] or 0)),
-                "status": r[12],
-                "turnoverRate": max(0.0, float(r[13] or 0)),
-                "lastRestockDate": r[14].isoformat() if r[14] else None,
-                "leadTimeDays": r[15],
-                "quantityOnOrder": r[16],
-                "todaysSales": max(0, int(r[17] or 0)),
-                "price": max(0.0, float(r[18] or 0)),
-            }
-            for r in items
-        ],
+        "items": items,
         "pagination": {
             "total": int(total),
             "page": page,
             "limit": limit,
             "totalPages": int(total_pages),
+            "nextCursor": next_cursor,
         },
     }
 
@@ -2894,6 +3033,10 @@ def get_inventory_stock_trends(
 ) -> dict:
     """
     GET /api/inventory/stock-trends
+
+    Projected points (include_future) come from a per store x SKU simulation;
+    `stockoutSkus` counts series at zero stock on each day. The flat
+    daily_replenishment budget is split across series by demand share.
     """
 
     where_clauses = [
@@ -2926,7 +3069,8 @@ def get_inventory_stock_trends(
             toDate(tarih)                              AS date,
             sum(greatest(toFloat64(stok), 0))          AS actualStock,
             round(sum(greatest(toFloat64(roll_mean_7), 0)), 0)                 AS forecastDemand,
-            round(sum(greatest(toFloat64(roll_mean_7), 0)) * 3, 0)             AS safetyStock
+            round(sum(greatest(toFloat64(roll_mean_7), 0)) * 3, 0)             AS safetyStock,
+            countIf(stok <= 0)                                                  AS stockoutSkus
         FROM {table_name}
         WHERE {where_sql}
         GROUP BY date
@@ -2941,36 +3085,44 @@ def get_inventory_stock_trends(
             "actualStock": max(0, int(r[1] or 0)),
             "forecastDemand": max(0, int(r[2] or 0)),
             "safetyStock": max(0, int(r[3] or 0)),
+            "stockoutSkus": int(r[4] or 0),
             "isProjected": False,
         }
         for r in rows
     ]
 
     if include_future and future_days > 0:
-        if trends:
-            last_date = date.fromisoformat(trends[-1]["date"])
-            projected_stock = trends[-1]["actualStock"]
-            recent = trends[-7:] if len(trends) >= 7 else trends
-            avg_forecast = int(
-                round(sum(item["forecastDemand"] for item in recent) / max(len(recent), 1))
-            )
-        else:
-            last_date = date.today()
-            projected_stock = 0
-            avg_forecast = 0
-
-        projected_daily_demand = max(0, avg_forecast)
-        replenishment = max(0, int(daily_replenishment))
+        # Project each store x SKU from its own latest stock and roll_mean_7 demand,
+        # then aggregate, so early stockouts are not masked by overstocked SKUs.
+        series_query = f"""
+            SELECT
+                greatest(ifNull(toFloat64(argMax(stok, tarih)), 0), 0)         AS current_stock,
+                greatest(ifNull(toFloat64(argMax(roll_mean_7, tarih)), 0), 0)  AS daily_demand
+            FROM {table_name}
+            WHERE {where_sql}
+            GROUP BY magazakodu, urunkodu
+        """
+        series_columns = client.query(series_query).result_columns
+        current_stock = np.asarray(series_columns[0] if series_columns else [], dtype=np.float64)
+        daily_demand = np.asarray(series_columns[1] if series_columns else [], dtype=np.float64)
+
+        last_date = date.fromisoformat(trends[-1]["date"]) if trends else date.today()
+        projection = project_stock(
+            current_stock,
+            daily_demand,
+            allocate_replenishment(max(0, int(daily_replenishment)), daily_demand),
+            horizon=int(future_days),
+        )
 
-        for i in range(1, int(future_days) + 1):
-            next_date = last_date + timedelta(days=i)
-            projected_stock = max(0, projected_stock + replenishment - projected_daily_demand)
+        for i in range(len(projection["stock"])):
+            projected_daily_demand = float(projection["demand"][i])
             trends.append(
                 {
-                    "date": next_date.isoformat(),
-                    "actualStock": max(0, int(projected_stock)),
-                    "forecastDemand": max(0, int(projected_daily_demand)),
+                    "date": (last_date + timedelta(days=i + 1)).isoformat(),
+                    "actualStock": max(0, int(projection["stock"][i])),
+                    "forecastDemand": max(0, int(round(projected_daily_demand))),
                     "safetyStock": max(0, int(round(projected_daily_demand * 3))),
+                    "stockoutSkus": int(projection["stockoutCount"][i]),
                     "isProjected": True,
                 }
             )
@@ -2989,12 +3141,22 @@ def get_inventory_store_performance(
     category_ids: Optional[List[str]] = None,
     product_ids: Optional[List[str]] = None,
     days: int = 30,
+    breakdown: Optional[str] = None,   # None | "category"
 ) -> dict:
     """
     GET /api/inventory/store-performance
+
+    Reads only the columns it needs, bounded to the `days` sales window and the
+    same window ending at the latest loaded date for the stock snapshot.
+    With breakdown="category" each store also carries per-category rows,
+    aggregated from the same scan via GROUPING SETS.
     """
 
-    where_clauses = ["1 = 1"]
+    safe_days = int(days) if int(days) > 0 else 30
+    latest_date = get_latest_date(client, table_name)
+    scan_start = min(date.today(), latest_date) - timedelta(days=safe_days)
+
+    where_clauses = [f"tarih >= toDate('{scan_start.isoformat()}')"]
 
     if region_ids:
         regions = ", ".join(f"'{str(r).lower()}'" for r in region_ids)
@@ -3016,110 +3178,103 @@ def get_inventory_store_performance(
         where_clauses.append(f"toString(urunkodu) IN ({prods})")
 
     where_sql = " AND ".join(where_clauses)
+    by_category = breakdown == "category"
+
+    # grouping(category_code) = 1 marks the store-level grouping set; 0 is a valid reyonkodu.
+    group_by_sql = (
+        "GROUPING SETS ((magazakodu), (magazakodu, category_code))"
+        if by_category
+        else "magazakodu"
+    )
+    category_select_sql = "category_code" if by_category else "toUInt32(0)"
+    store_level_sql = "grouping(category_code)" if by_category else "toUInt8(1)"
 
     query = f"""
-        WITH filtered AS (
-            SELECT *
-            FROM {table_name}
-            WHERE {where_sql}
-        ),
-        store_meta AS (
+        WITH sku_level AS (
             SELECT
                 magazakodu,
-                argMax(bulundugusehir, tarih) AS city_name,
-                argMax(ilce, tarih) AS district
-            FROM filtered
-            GROUP BY magazakodu
-        ),
-        store_stock AS (
-            SELECT
-                magazakodu,
-                sum(stock_latest) AS stockLevel
-            FROM (
-                SELECT
-                    magazakodu,
-                    urunkodu,
-                    greatest(toFloat64(argMax(stok, tarih)), 0) AS stock_latest
-                FROM filtered
-                GROUP BY magazakodu, urunkodu
-            )
-            GROUP BY magazakodu
+                toUInt32OrZero(toString(reyonkodu))                            AS category_code,
+                argMax(bulundugusehir, tarih)                                   AS city_name,
+                argMax(ilce, tarih)                                             AS district,
+                greatest(toFloat64(argMax(stok, tarih)), 0)                     AS stock_latest,
+                sumIf(satismiktari, tarih >= today() - {safe_days} AND tarih < today()) AS sales_period,
+                uniqExactStateIf(toDate(tarih), tarih >= today() - {safe_days} AND tarih < today()) AS days_state
+            FROM {table_name}
+            WHERE {where_sql}
+            GROUP BY magazakodu, reyonkodu, urunkodu
         ),
-        store_sales AS (
+        grouped AS (
             SELECT
                 magazakodu,
-                greatest(
-                    sumIf(satismiktari, tarih >= today() - {int(days)} AND tarih < today()),
-                    0
-                ) AS sales_period,
-                countDistinctIf(toDate(tarih), tarih >= today() - {int(days)} AND tarih < today()) AS days_period
-            FROM filtered
-            GROUP BY magazakodu
+                {category_select_sql}                                           AS category_id,
+                {store_level_sql}                                               AS store_level,
+                any(city_name)                                                  AS store_city,
+                any(district)                                                   AS store_district,
+                sum(stock_latest)                                               AS stock_level,
+                greatest(sum(sales_period), 0)                                  AS sales_total,
+                uniqExactMerge(days_state)                                      AS days_period
+            FROM sku_level
+            GROUP BY {group_by_sql}
         )
 
         SELECT
-            toString(m.magazakodu)                                          AS storeId,
+            toString(magazakodu)                                            AS storeId,
             if(
-                lengthUTF8(trim(BOTH ' ' FROM coalesce(m.district, ''))) = 0,
-                coalesce(m.city_name, toString(m.magazakodu)),
-                concat(coalesce(m.city_name, toString(m.magazakodu)), ' - ', m.district)
+                lengthUTF8(trim(BOTH ' ' FROM coalesce(store_district, ''))) = 0,
+                coalesce(store_city, toString(magazakodu)),
+                concat(coalesce(store_city, toString(magazakodu)), ' - ', store_district)
             )                                                               AS storeName,
-            s.stockLevel                                                    AS stockLevel,
+            stock_level                                                     AS stockLevel,
             round(
-                100 * coalesce(sa.sales_period, 0) /
-                nullIf(coalesce(sa.sales_period, 0) + s.stockLevel, 0),
+                100 * sales_total / nullIf(sales_total + stock_level, 0),
                 2
             )                                                               AS sellThroughRate,
+            round(sales_total / nullIf(days_period, 0), 0)                  AS dailySales,
             round(
-                coalesce(sa.sales_period, 0) / nullIf(coalesce(sa.days_period, 0), 0),
-                0
-            )                                                               AS dailySales,
-            round(
-                s.stockLevel /
-                nullIf(
-                    coalesce(sa.sales_period, 0) / nullIf(coalesce(sa.days_period, 0), 0),
-                    0
-                ),
+                stock_level / nullIf(sales_total / nullIf(days_period, 0), 0),
                 0
             )                                                               AS daysOfInventory,
             round(
-                0.5 * (
-                    100 * coalesce(sa.sales_period, 0) /
-                    nullIf(coalesce(sa.sales_period, 0) + s.stockLevel, 0)
-                )
+                0.5 * (100 * sales_total / nullIf(sales_total + stock_level, 0))
                 +
                 0.5 * greatest(0, 100 - abs(
-                    (
-                        s.stockLevel /
-                        nullIf(
-                            coalesce(sa.sales_period, 0) / nullIf(coalesce(sa.days_period, 0), 0),
-                            0
-                        )
-                    ) - {int(days)}
+                    stock_level / nullIf(sales_total / nullIf(days_period, 0), 0)
+                    - {safe_days}
                 )),
                 2
-            )                                                               AS storeEfficiency
-
-        FROM store_meta m
-        LEFT JOIN store_stock s USING (magazakodu)
-        LEFT JOIN store_sales sa USING (magazakodu)
-        WHERE s.stockLevel IS NOT NULL
+            )                                                               AS storeEfficiency,
+            category_id                                                     AS categoryId,
+            store_level                                                     AS storeLevel
+        FROM grouped
         ORDER BY storeEfficiency DESC
     """
 
     rows = client.query(query).result_rows
 
-    return {
-        "stores": [
-            {
-                "storeId": r[0],
-                "storeName": r[1],
-                "stockLevel": int(r[2] or 0),
-                "sellThroughRate": float(r[3] or 0),
-                "dailySales": int(r[4] or 0),
-                "daysOfInventory": int(r[5] or 0),
-                "storeEfficiency": float(r[6] or 0),
-            }
-            for r in rows
-        ]
-    }
+    def to_metrics(r) -> dict:
+        return {
+            "stockLevel": int(r[2] or 0),
+            "sellThroughRate": float(r[3] or 0),
+            "dailySales": int(r[4] or 0),
+            "daysOfInventory": int(r[5] or 0),
+            "storeEfficiency": float(r[6] or 0),
+        }
+
+    stores = []
+    categories_by_store: dict[str, list[dict]] = {}
+    for r in rows:
+        category_id = int(r[7] or 0)
+        if r[8]:
+            stores.append({"storeId": r[0], "storeName": r[1], **to_metrics(r)})
+        else:
+            categories_by_store.setdefault(r[0], []).append({
+                "categoryId": str(category_id),
+                "categoryName": category_map.get(category_id, f"Kategori {category_id}"),
+                **to_metrics(r),
+            })
+
+    if by_category:
+        for store in stores:
+            store["categories"] = categories_by_store.get(store["storeId"], [])
+
+    return {"stores": stores}
@@ -0,0 +1,167 @@
+"""
+In-process product name search with Turkish-aware normalization.
+
+Names are case-folded with Turkish rules (I -> ı, İ -> i) and then folded to
+their base letters (ı/i, ş/s, ğ/g, ü/u, ö/o, ç/c), so "sut", "SÜT" and "Süt"
+all match the same products. Every word of every name goes into a sorted
+token array; a query term matches all tokens it is a prefix of, found with two
+binary searches. Multi-word queries require every term to match.
+
+Ranking per term: exact word > word prefix, +1 when it is the first word of
+the name; ties break on shorter names. The index is rebuilt once per data
+version.
+"""
+
+import os
+import re
+import threading
+
+import numpy as np
+
+from apiCache import get_data_version
+
+# Above this many matching products, callers should keep the SQL text filter
+# instead of sending a huge IN list.
+PRODUCT_SEARCH_MAX_IN = int(os.getenv("PRODUCT_SEARCH_MAX_IN", "20000"))
+
+_TR_UPPER = str.maketrans({"I": "ı", "İ": "i"})
+_FOLD = str.maketrans({
+    "ı": "i", "ş": "s", "ğ": "g", "ü": "u", "ö": "o", "ç": "c",
+    "â": "a", "î": "i", "û": "u", "̇": None,
+})
+_WORD_SPLIT = re.compile(r"[^0-9a-z]+")
+
+
+def turkish_lower(text) -> str:
+    """Lower-case with Turkish dotted/dotless I rules, keeping other diacritics."""
+    return str(text or "").translate(_TR_UPPER).lower()
+
+
+def turkish_fold(text) -> str:
+    """Turkish case-fold, then strip diacritics to the matching base letter."""
+    return turkish_lower(text).translate(_FOLD)
+
+
+def search_terms(text) -> list[str]:
+    return [t for t in _WORD_SPLIT.split(turkish_fold(text)) if t]
+
+
+class ProductSearchIndex:
+    def __init__(self, version: str, rows: list):
+        self.version = version
+
+        self.codes = np.asarray([int(code) for code, _ in rows], dtype=np.int64)
+        self.names = [str(name or "") for _, name in rows]
+        self.name_lengths = np.asarray([len(n) for n in self.names], dtype=np.int64)
+
+        tokens, owners, positions = [], [], []
+        for i, name in enumerate(self.names):
+            for pos, term in enumerate(search_terms(name)):
+                tokens.append(term)
+                owners.append(i)
+                positions.append(pos)
+
+        token_arr = np.asarray(tokens, dtype=str) if tokens else np.empty(0, dtype="<U1")
+        order = np.argsort(token_arr, kind="stable")
+        self.tokens = token_arr[order]
+        self.owners = np.asarray(owners, dtype=np.int64)[order]
+        self.first_word = np.asarray(positions, dtype=np.int64)[order] == 0
+
+    def _term_scores(self, term: str) -> np.ndarray:
+        """Best score of one term per product (0 = no match), dense over all products."""
+        best = np.zeros(len(self.codes), dtype=np.int64)
+        # Keep probes within the array's fixed string width; a wider probe
+        # would make NumPy cast the whole token array on every search.
+        width = self.tokens.dtype.itemsize // 4
+        if len(term) > width:
+            return best
+        lo = int(np.searchsorted(self.tokens, term, side="left"))
+        if len(term) == width:
+            hi = int(np.searchsorted(self.tokens, term, side="right"))
+        else:
+            hi = int(np.searchsorted(self.tokens, term + "\uffff", side="left"))
+        if hi <= lo:
+            return best
+
+        owners = self.owners[lo:hi]
+        scores = 1 + (self.tokens[lo:hi] == term).astype(np.int64) + self.first_word[lo:hi]
+        # Assign in increasing score order so each product keeps its best match.
+        for score in (1, 2, 3):
+            best[owners[scores == score]] = score
+        return best
+
+    def _scores(self, query: str) -> np.ndarray:
+        """Summed term scores per product; 0 unless every term matches."""
+        total = np.zeros(len(self.codes), dtype=np.int64)
+        for n, term in enumerate(set(search_terms(query))):
+            scores = self._term_scores(term)
+            total = scores if n == 0 else np.where((total > 0) & (scores > 0), total + scores, 0)
+        return total
+
+    def search(self, query: str, limit: int | None = None) -> list[tuple[int, str, int]]:
+        """Ranked (urunkodu, urunismi, score) for products matching every query term."""
+        total = self._scores(query)
+        matched = np.flatnonzero(total > 0)
+        if len(matched) == 0:
+            return []
+
+        # Higher score first, then shorter names.
+        rank_key = -total[matched] * 100000 + self.name_lengths[matched]
+        if limit is not None and int(limit) < len(matched):
+            top = np.argpartition(rank_key, int(limit) - 1)[:int(limit)]
+            matched, rank_key = matched[top], rank_key[top]
+        order = np.argsort(rank_key, kind="stable")
+        return [
+            (int(self.codes[i]), self.names[i], int(total[i]))
+            for i in matched[order]
+        ]
+
+    def match_codes(self, query: str) -> np.ndarray:
+        """All matching urunkodu values, sorted (for IN filters on the sort key)."""
+        return np.sort(self.codes[self._scores(query) > 0])
+
+
+def load_product_names(client, table_name: str) -> list:
+    query = f"""
+        SELECT urunkodu, any(urunismi) AS product_name
+        FROM {table_name}
+        GROUP BY urunkodu
+    """
+    return [tuple(r) for r in client.query(query).result_rows]
+
+
+_indexes: dict[str, ProductSearchIndex] = {}
+_build_lock = threading.Lock()
+
+
+def get_product_search_index(client, table_name: str = "demoVerileri") -> ProductSearchIndex:
+    """Return the index for the current data version, rebuilding it once per change."""
+    version = get_data_version(client, table_name)
+    index = _indexes.get(table_name)
+    if index is not None and index.version == version:
+        return index
+
+    with _build_lock:
+        index = _indexes.get(table_name)
+        if index is None or index.version != version:
+            index = ProductSearchIndex(version, load_product_names(client, table_name))
+            _indexes[table_name] = index
+    return index
+
+
+def product_search_clause(client, table_name: str, search: str) -> str:
+    """
+    SQL predicate for a product name search.
+    Resolves the term to an `urunkodu IN (...)` list on the sort key; very
+    broad terms fall back to a case-insensitive substring match.
+    """
+    if not search_terms(search):
+        return "1 = 1"
+
+    codes = get_product_search_index(client, table_name).match_codes(search)
+    if len(codes) == 0:
+        return "0 = 1"
+    if len(codes) > PRODUCT_SEARCH_MAX_IN:
+        safe_search = str(search).replace("\\", "\\\\").replace("'", "\\'")
+        return f"positionCaseInsensitiveUTF8(urunismi, '{safe_search}') > 0"
+    return f"urunkodu IN ({', '.join(str(c) for c in codes)})"
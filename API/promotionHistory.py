@@ -0,0 +1,421 @@
+"""
+Incrementally maintained campaign-period store behind /api/forecast/promotion-history.
+
+A campaign period is one contiguous run of days of a promotion code for a
+store x product (gaps-and-islands over daily rows). All periods are computed
+once and kept as NumPy columns; filters, sorting and keyset pagination run in
+memory.
+
+When the data version changes and the fact table only grew, the store is
+refreshed incrementally: periods that end on or after the previous watermark
+(the last loaded date, minus one day for restated loads) are dropped and
+recomputed from a scan starting at the earliest of their start dates, so only
+periods touched by the new data are rebuilt. `python promotionHistory.py
+--chdb PATH --watermark DATE` checks that an incremental refresh from DATE
+matches a full rebuild. A shrinking table triggers a full rebuild, as does the
+optional PROMOTION_HISTORY_FULL_REFRESH_SECONDS interval (off by default).
+"""
+
+import argparse
+import hashlib
+import os
+import threading
+import time
+import numpy as np
+
+from apiCache import (
+    SnapshotCache,
+    decode_cursor,
+    encode_cursor,
+    get_data_version,
+    get_latest_date,
+)
+
+# Incremental refreshes cannot see restatements of rows older than the
+# watermark; where the ETL rewrites history in place, a periodic full rebuild
+# (e.g. 604800 for weekly) picks them up. 0 disables it. The interval counts
+# from the last full build, so it must stay well above the load cadence.
+PROMOTION_HISTORY_FULL_REFRESH_SECONDS = int(
+    os.getenv("PROMOTION_HISTORY_FULL_REFRESH_SECONDS", "0")
+)
+PROMOTION_HISTORY_VIEW_CACHE_MB = int(os.getenv("PROMOTION_HISTORY_VIEW_CACHE_MB", "64"))
+
+# sortBy -> period column
+PROMOTION_HISTORY_SORT_FIELDS = {
+    "date": "endOrdinal",
+    "uplift": "upliftPct",
+    "accuracy": "forecastAccuracy",
+}
+
+_EPOCH_ORDINAL = np.datetime64("1970-01-01", "D")
+
+# Filtered, sorted row order per (table, store version, filters, sort).
+_view_cache = SnapshotCache(
+    max_bytes=PROMOTION_HISTORY_VIEW_CACHE_MB * 1024 * 1024,
+    ttl_seconds=0,
+    name="promotion_history_view",
+)
+
+
+def _load_periods(client, table_name: str, since=None, until=None) -> dict:
+    """Campaign periods over the whole table, or over the days from `since` to `until` (inclusive)."""
+
+    where_clauses = [
+        "aktifPromosyonKodu IS NOT NULL",
+        "toString(aktifPromosyonKodu) != '17'",
+        "aktifPromosyonAdi IS NOT NULL",
+        "aktifPromosyonAdi != ''",
+        "aktifPromosyonAdi != 'Tayin edilmedi'",
+    ]
+    if since is not None:
+        where_clauses.append(f"tarih >= toDate('{since.isoformat()}')")
+    if until is not None:
+        where_clauses.append(f"tarih <= toDate('{until.isoformat()}')")
+    where_sql = " AND ".join(where_clauses)
+
+    query = f"""
+    WITH daily AS (
+        SELECT
+            toDate(tarih) AS campaign_date,
+            toInt64(magazakodu) AS store_code,
+            toInt64(urunkodu) AS product_code,
+            any(lowerUTF8(cografi_bolge)) AS region_value,
+            any(toString(reyonkodu)) AS category_value,
+            toString(aktifPromosyonKodu) AS promo_code,
+            any(aktifPromosyonAdi) AS promo_name,
+            round(sum((satismiktari - roll_mean_14) * satisFiyati), 2) AS uplift_val,
+            round(sum(satistutarikdvsiz) * 0.08, 2) AS profit_val,
+            round(avg(100 - abs((satismiktari - roll_mean_14) / nullIf(roll_mean_14, 0)) * 100), 2) AS forecast_accuracy,
+            round(sum(satismiktari * satisFiyati * greatest(indirimYuzdesi, 0) / 100.0), 2) AS markdown_cost,
+            round(sum(greatest(roll_mean_14 - satismiktari, 0) * satisFiyati), 2) AS lost_sales_val,
+            round(sum(roll_mean_14 * satisFiyati), 2) AS target_revenue,
+            max(if(stok_out = 1, 1, 0)) AS stock_out_flag
+        FROM {table_name}
+        WHERE {where_sql}
+        GROUP BY campaign_date, store_code, product_code, promo_code
+    ),
+    periodized AS (
+        SELECT
+            *,
+            (
+                toInt32(toRelativeDayNum(campaign_date))
+                - toInt32(row_number() OVER (
+                    PARTITION BY store_code, product_code, promo_code
+                    ORDER BY campaign_date
+                ))
+            ) AS period_group
+        FROM daily
+    )
+    SELECT
+        toInt64(toRelativeDayNum(min(campaign_date))) AS start_day,
+        toInt64(toRelativeDayNum(max(campaign_date))) AS end_day,
+        store_code,
+        product_code,
+        any(region_value) AS region_text,
+        any(category_value) AS category_text,
+        promo_code,
+        any(promo_name) AS promo_name_text,
+        round(sum(uplift_val), 2) AS period_uplift_val,
+        round(sum(profit_val), 2) AS period_profit_val,
+        if(max(stock_out_flag) = 1, 'OOS', 'OK') AS stock_status,
+        round(avg(forecast_accuracy), 2) AS period_forecast_accuracy,
+        round(sum(markdown_cost), 2) AS period_stock_cost_increase,
+        round(sum(lost_sales_val), 2) AS period_lost_sales_val,
+        round(sum(target_revenue), 2) AS period_target_revenue
+    FROM periodized
+    GROUP BY store_code, product_code, promo_code, period_group
+    """
+
+    (
+        start_day, end_day, store_code, product_code, region, category, promo_code,
+        promo_name, uplift_val, profit_val, stock_status, forecast_accuracy,
+        stock_cost_increase, lost_sales_val, target_revenue,
+    ) = client.query(query).result_columns or [[] for _ in range(15)]
+
+    uplift_arr = np.asarray(uplift_val, dtype=np.float64)
+    target_arr = np.asarray(target_revenue, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        uplift_pct = np.where(target_arr == 0, 0.0, np.round(uplift_arr / target_arr * 100, 2))
+
+    periods = {
+        "storeCode": np.asarray(store_code, dtype=np.int64),
+        "productCode": np.asarray(product_code, dtype=np.int64),
+        # toRelativeDayNum counts days from 1970-01-01.
+        "startOrdinal": np.asarray(start_day, dtype=np.int64),
+        "endOrdinal": np.asarray(end_day, dtype=np.int64),
+        "upliftPct": uplift_pct,
+        "upliftVal": uplift_arr,
+        "profitVal": np.asarray(profit_val, dtype=np.float64),
+        # NULL accuracy (no baseline) becomes NaN and sorts last.
+        "forecastAccuracy": np.asarray(forecast_accuracy, dtype=np.float64),
+        "stockCostIncrease": np.asarray(stock_cost_increase, dtype=np.float64),
+        "lostSalesVal": np.asarray(lost_sales_val, dtype=np.float64),
+        "region": np.asarray([str(v or "") for v in region], dtype=object),
+        "category": np.asarray([str(v or "") for v in category], dtype=object),
+        "promoCode": np.asarray([str(v or "") for v in promo_code], dtype=object),
+        "promoName": np.asarray([str(v or "").strip() for v in promo_name], dtype=object),
+        "stockStatus": np.asarray([str(v or "OK") for v in stock_status], dtype=object),
+    }
+
+    start_iso = (_EPOCH_ORDINAL + periods["startOrdinal"]).astype(str)
+    end_iso = (_EPOCH_ORDINAL + periods["endOrdinal"]).astype(str)
+    periods["campaignKey"] = np.asarray(
+        [
+            f"{s}_{p}_{c}_{a}_{b}"
+            for s, p, c, a, b in zip(
+                periods["storeCode"], periods["productCode"], periods["promoCode"], start_iso, end_iso
+            )
+        ],
+        dtype=object,
+    )
+    return periods
+
+
+class CampaignPeriodStore:
+    def __init__(self, version: str, watermark, periods: dict, built_at: float, refreshed: int):
+        self.version = version
+        self.watermark = watermark
+        self.periods = periods
+        self.built_at = built_at
+        self.refreshed = refreshed
+        self.size = len(periods["storeCode"])
+
+    def reopen_range(self) -> tuple[int, int]:
+        """
+        (scan_from, boundary) in days since epoch. Periods ending on/after
+        `boundary` (watermark - 1, for a restated watermark day) can still grow
+        and are recomputed; scanning from the earliest start among them sees
+        each of those periods whole. Periods ending before it are final.
+        """
+        boundary = int((np.datetime64(self.watermark, "D") - _EPOCH_ORDINAL).astype(np.int64)) - 1
+        reopened = self.periods["endOrdinal"] >= boundary
+        scan_from = min(boundary, int(self.periods["startOrdinal"][reopened].min())) if reopened.any() else boundary
+        return scan_from, boundary
+
+
+def _merge(store: CampaignPeriodStore, boundary: int, fresh: dict) -> dict:
+    # The scan also returns already-final periods (cut short at scan_from); only its tail is new.
+    keep = store.periods["endOrdinal"] < boundary
+    tail = fresh["endOrdinal"] >= boundary
+    return {
+        name: np.concatenate([column[keep], fresh[name][tail]])
+        for name, column in store.periods.items()
+    }
+
+
+_stores: dict[str, CampaignPeriodStore] = {}
+_refresh_lock = threading.Lock()
+
+
+def get_period_store(client, table_name: str = "demoVerileri") -> CampaignPeriodStore:
+    """Return the period store for the current data version, refreshing it if needed."""
+    version = get_data_version(client, table_name)
+    store = _stores.get(table_name)
+    if store is not None and store.version == version:
+        return store
+
+    with _refresh_lock:
+        store = _stores.get(table_name)
+        if store is not None and store.version == version:
+            return store
+
+        latest_date = get_latest_date(client, table_name)
+        full = (
+            store is None
+            or latest_date < store.watermark
+            or (
+                PROMOTION_HISTORY_FULL_REFRESH_SECONDS > 0
+                and time.monotonic() - store.built_at > PROMOTION_HISTORY_FULL_REFRESH_SECONDS
+            )
+        )
+
+        if full:
+            periods = _load_periods(client, table_name)
+            store = CampaignPeriodStore(version, latest_date, periods, time.monotonic(), 0)
+        else:
+            scan_from, boundary = store.reopen_range()
+            fresh = _load_periods(client, table_name, since=(_EPOCH_ORDINAL + scan_from).astype(object))
+            store = CampaignPeriodStore(
+                version,
+                latest_date,
+                _merge(store, boundary, fresh),
+                store.built_at,
+                int(np.count_nonzero(fresh["endOrdinal"] >= boundary)),
+            )
+
+        _stores[table_name] = store
+    return store
+
+
+def _sorted_view(store: CampaignPeriodStore, table_name: str, filters: tuple, sort_by: str, descending: bool) -> dict:
+    def build():
+        periods = store.periods
+        product_ids, store_ids, region_ids, category_ids = filters
+        mask = np.ones(store.size, dtype=bool)
+        if product_ids:
+            mask &= np.isin(periods["productCode"], np.asarray(product_ids, dtype=np.int64))
+        if store_ids:
+            mask &= np.isin(periods["storeCode"], np.asarray(store_ids, dtype=np.int64))
+        if region_ids:
+            mask &= np.isin(periods["region"], np.asarray(region_ids, dtype=object))
+        if category_ids:
+            mask &= np.isin(periods["category"], np.asarray(category_ids, dtype=object))
+
+        rows = np.flatnonzero(mask)
+        values = periods[PROMOTION_HISTORY_SORT_FIELDS[sort_by]][rows].astype(np.float64)
+        sort_key = -values if descending else values
+        sort_key[np.isnan(sort_key)] = np.inf
+
+        keys = periods["campaignKey"][rows]
+        order = np.lexsort((keys, sort_key))
+        return {"rows": rows[order], "sortKey": sort_key[order], "campaignKey": keys[order]}
+
+    cache_key = (table_name, store.version, filters, sort_by, descending)
+    return _view_cache.get_or_build(cache_key, build)
+
+
+def get_promotion_history(
+    client,
+    table_name: str = "demoVerileri",
+    product_ids=None,
+    store_ids=None,
+    region_ids=None,
+    category_ids=None,
+    limit: int = 40,
+    sort_by: str = "date",
+    sort_order: str = "desc",
+    cursor=None,
+) -> dict:
+    """
+    GET /api/forecast/promotion-history
+
+    Campaign-period rows from the incremental store, filtered and sorted in
+    memory. `cursor` (from pagination.nextCursor) resumes after the last row
+    of the previous page.
+    """
+
+    limit = max(1, int(limit))
+    descending = str(sort_order).lower() != "asc"
+    if sort_by not in PROMOTION_HISTORY_SORT_FIELDS:
+        sort_by = "date"
+
+    filters = (
+        tuple(sorted({int(p) for p in product_ids or []})),
+        tuple(sorted({int(s) for s in store_ids or []})),
+        tuple(sorted({str(r).lower() for r in region_ids or []})),
+        tuple(sorted({str(c) for c in category_ids or []})),
+    )
+    view_id = hashlib.md5(repr((filters, sort_by, descending)).encode("utf-8")).hexdigest()[:12]
+
+    store = get_period_store(client, table_name)
+    view = _sorted_view(store, table_name, filters, sort_by, descending)
+    total = len(view["rows"])
+
+    start = 0
+    cursor_payload = decode_cursor(cursor)
+    if cursor_payload and cursor_payload.get("view") == view_id:
+        # Keyset: first row strictly after (sortKey, campaignKey) of the previous page.
+        last_key = float(cursor_payload.get("key", 0))
+        last_campaign_key = str(cursor_payload.get("id", ""))
+        lo = int(np.searchsorted(view["sortKey"], last_key, side="left"))
+        hi = int(np.searchsorted(view["sortKey"], last_key, side="right"))
+        start = lo + int(np.searchsorted(view["campaignKey"][lo:hi], last_campaign_key, side="right"))
+
+    end = min(start + limit, total)
+
+    next_cursor = None
+    if end < total and end > start:
+        next_cursor = encode_cursor({
+            "view": view_id,
+            "key": float(view["sortKey"][end - 1]),
+            "id": str(view["campaignKey"][end - 1]),
+        })
+
+    def safe_number(value) -> float:
+        n = float(value)
+        return n if np.isfinite(n) else 0.0
+
+    periods = store.periods
+    history = []
+    for pos in range(start, end):
+        i = int(view["rows"][pos])
+        start_date = str(_EPOCH_ORDINAL + periods["startOrdinal"][i])
+        end_date = str(_EPOCH_ORDINAL + periods["endOrdinal"][i])
+        promo_code = periods["promoCode"][i]
+        promo_name = periods["promoName"][i]
+        type_label = f"{promo_name} (Kod: {promo_code})" if promo_name else f"Kod: {promo_code}"
+        history.append({
+            "campaignKey": periods["campaignKey"][i],
+            "eventDate": end_date,
+            "campaignStartDate": start_date,
+            "campaignEndDate": end_date,
+            "storeCode": int(periods["storeCode"][i]),
+            "productCode": int(periods["productCode"][i]),
+            "region": periods["region"][i],
+            "category": periods["category"][i],
+            "promoCode": promo_code,
+            "date": end_date,
+            "name": promo_name or f"Promosyon {promo_code}",
+            "type": promo_code,
+            "typeLabel": type_label,
+            "uplift": safe_number(periods["upliftPct"][i]),
+            "upliftVal": safe_number(periods["upliftVal"][i]),
+            "profit": safe_number(periods["profitVal"][i]),
+            "stock": periods["stockStatus"][i] or "OK",
+            "forecast": safe_number(periods["forecastAccuracy"][i]),
+            "stockCostIncrease": safe_number(periods["stockCostIncrease"][i]),
+            "lostSalesVal": safe_number(periods["lostSalesVal"][i]),
+        })
+
+    return {
+        "history": history,
+        "pagination": {
+            "limit": limit,
+            "total": total,
+            "nextCursor": next_cursor,
+        },
+    }
+
+
+def check_incremental_refresh(client, table_name: str, watermark) -> dict:
+    """
+    Rebuild the store as of `watermark`, refresh it incrementally to the
+    latest data and compare with a full rebuild: same periods, same values.
+    """
+    store = CampaignPeriodStore("check", watermark, _load_periods(client, table_name, until=watermark), 0.0, 0)
+    scan_from, boundary = store.reopen_range()
+    fresh = _load_periods(client, table_name, since=(_EPOCH_ORDINAL + scan_from).astype(object))
+    merged = _merge(store, boundary, fresh)
+    full = _load_periods(client, table_name)
+
+    def rows(periods: dict) -> list:
+        order = np.argsort(periods["campaignKey"].astype(str), kind="stable")
+        return [
+            tuple(str(periods[name][i]) for name in sorted(periods))
+            for i in order
+        ]
+
+    return {
+        "equal": rows(merged) == rows(full),
+        "periods": len(full["storeCode"]),
+        "kept": int(np.count_nonzero(store.periods["endOrdinal"] < boundary)),
+        "recomputed": int(np.count_nonzero(fresh["endOrdinal"] >= boundary)),
+        "scanFrom": str((_EPOCH_ORDINAL + scan_from).astype(object)),
+    }
+
+
+if __name__ == "__main__":
+    from datetime import date
+
+    parser = argparse.ArgumentParser(description="Check the incremental promotion-history refresh")
+    parser.add_argument("--chdb", metavar="PATH", required=True, help="chdb database (e.g. from syntheticData.py)")
+    parser.add_argument("--table", default="demoVerileri")
+    parser.add_argument("--watermark", type=date.fromisoformat, required=True,
+                        help="Last loaded date of the simulated previous build")
+    args = parser.parse_args()
+
+    from chdbClient import ChdbClient
+
+    result = check_incremental_refresh(ChdbClient(args.chdb), args.table, args.watermark)
+    print(result)
+    raise SystemExit(0 if result["equal"] and result["recomputed"] < result["periods"] else 1)
@@ -0,0 +1,181 @@
+"""
+In-process registry of ClickHouse query fingerprints.
+
+A fingerprint is the SQL text with literals and IN lists replaced by `?` and
+whitespace collapsed, so the same omerApiYan query with different filters
+maps to one entry. Per fingerprint we keep call count, total and p50/p95/p99
+latency, rows/bytes read (from the query summaries) and which endpoints ran
+it.
+
+Every query is also tagged for the server side: `log_comment` carries the
+app name, endpoint, request id (possibly client-supplied) and fingerprint,
+and `query_id` is `<server id>-<n>` with a server-generated id, so it stays
+unique when clients reuse X-Request-ID. system.query_log can be grouped by
+fingerprint for CPU and memory (see `query_log_stats`).
+"""
+
+import hashlib
+import json
+import re
+import threading
+
+from upstreamResilience import LatencyHistogram
+
+APP_TAG = "forecasting-api"
+MAX_FINGERPRINTS = 2000
+SAMPLE_SQL_CHARS = 2000
+
+_COMMENTS = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_STRINGS = re.compile(r"'(?:[^'\\]|\\.)*'")
+_NUMBERS = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b")
+# One or many values collapse alike, so filter cardinality does not split fingerprints.
+_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_TUPLE_LISTS = re.compile(r"\(\s*\(\?\.\.\.\)(?:\s*,\s*\(\?\.\.\.\))*\s*\)")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_sql(sql: str) -> str:
+    text = _COMMENTS.sub(" ", str(sql or ""))
+    text = _STRINGS.sub("?", text)
+    text = _NUMBERS.sub("?", text)
+    text = _LISTS.sub("(?...)", text)
+    text = _TUPLE_LISTS.sub("(?...)", text)
+    return _SPACES.sub(" ", text).strip()
+
+
+def fingerprint(sql: str) -> tuple[str, str]:
+    """(fingerprint id, normalized SQL)."""
+    normalized = normalize_sql(sql)
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:16], normalized
+
+
+class FingerprintStats:
+    __slots__ = ("fingerprint", "sql", "count", "errors", "total_seconds", "rows_read", "bytes_read", "latency", "endpoints")
+
+    def __init__(self, fp: str, normalized_sql: str):
+        self.fingerprint = fp
+        self.sql = normalized_sql[:SAMPLE_SQL_CHARS]
+        self.count = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.rows_read = 0
+        self.bytes_read = 0
+        self.latency = LatencyHistogram()
+        self.endpoints: dict[str, int] = {}
+
+    def as_dict(self) -> dict:
+        def ms(q):
+            value = self.latency.quantile(q, recent=False)
+            return round(value * 1000, 2) if value is not None else None
+
+        return {
+            "fingerprint": self.fingerprint,
+            "count": self.count,
+            "errors": self.errors,
+            "totalMs": round(self.total_seconds * 1000, 2),
+            "meanMs": round(self.total_seconds * 1000 / self.count, 2) if self.count else None,
+            "p50Ms": ms(0.5),
+            "p95Ms": ms(0.95),
+            "p99Ms": ms(0.99),
+            "rowsRead": self.rows_read,
+            "bytesRead": self.bytes_read,
+            "endpoints": dict(sorted(self.endpoints.items(), key=lambda kv: -kv[1])),
+            "sql": self.sql,
+        }
+
+
+class QueryRegistry:
+    def __init__(self, max_fingerprints: int = MAX_FINGERPRINTS):
+        self.max_fingerprints = max_fingerprints
+        self._stats: dict[str, FingerprintStats] = {}
+        self._lock = threading.Lock()
+
+    def record(self, fp: str, normalized_sql: str, endpoint: str | None, seconds: float,
+               rows_read: int = 0, bytes_read: int = 0, failed: bool = False):
+        with self._lock:
+            stats = self._stats.get(fp)
+            if stats is None:
+                if len(self._stats) >= self.max_fingerprints:
+                    fp, normalized_sql = "overflow", "(fingerprint limit reached)"
+                    stats = self._stats.get(fp)
+                if stats is None:
+                    stats = self._stats[fp] = FingerprintStats(fp, normalized_sql)
+            stats.count += 1
+            stats.errors += int(failed)
+            stats.total_seconds += seconds
+            stats.rows_read += rows_read
+            stats.bytes_read += bytes_read
+            key = endpoint or "(background)"
+            stats.endpoints[key] = stats.endpoints.get(key, 0) + 1
+        stats.latency.observe(seconds)
+
+    def top(self, sort_by: str = "total", limit: int = 20) -> list[dict]:
+        keys = {
+            "total": lambda s: s.total_seconds,
+            "count": lambda s: s.count,
+            "mean": lambda s: s.total_seconds / max(s.count, 1),
+            "p95": lambda s: s.latency.quantile(0.95, recent=False) or 0.0,
+            "rows": lambda s: s.rows_read,
+            "bytes": lambda s: s.bytes_read,
+        }
+        if sort_by not in keys:
+            raise ValueError(f"sortBy must be one of: {', '.join(keys)}")
+        with self._lock:
+            stats = list(self._stats.values())
+        stats.sort(key=keys[sort_by], reverse=True)
+        return [s.as_dict() for s in stats[:limit]]
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+registry = QueryRegistry()
+
+
+def query_tags(endpoint: str | None, request_id: str | None, query_id: str | None, fp: str) -> dict:
+    """ClickHouse settings that tag one query for system.query_log; `query_id` must be server-generated."""
+    comment = json.dumps(
+        {"app": APP_TAG, "endpoint": endpoint, "requestId": request_id, "fp": fp},
+        separators=(",", ":"),
+    )
+    tags = {"log_comment": comment}
+    if query_id:
+        tags["query_id"] = query_id
+    return tags
+
+
+def query_log_stats(client, fingerprints: list[str], hours: int = 24) -> dict:
+    """Server-side totals per fingerprint from system.query_log (CPU, memory, reads)."""
+    fp_list = ", ".join(f"'{fp}'" for fp in fingerprints if re.fullmatch(r"[0-9a-f]+|overflow", fp))
+    if not fp_list:
+        return {}
+    query = f"""
+    SELECT
+        JSONExtractString(log_comment, 'fp') AS fp,
+        count() AS executions,
+        sum(query_duration_ms) AS duration_ms,
+        sum(ProfileEvents['OSCPUVirtualTimeMicroseconds']) AS cpu_us,
+        max(memory_usage) AS peak_memory,
+        avg(memory_usage) AS avg_memory,
+        sum(read_rows) AS server_read_rows,
+        sum(read_bytes) AS server_read_bytes
+    FROM system.query_log
+    WHERE event_time >= now() - INTERVAL {int(hours)} HOUR
+      AND type = 'QueryFinish'
+      AND JSONExtractString(log_comment, 'app') = '{APP_TAG}'
+      AND fp IN ({fp_list})
+    GROUP BY fp
+    """
+    stats = {}
+    for fp, executions, duration_ms, cpu_us, peak_memory, avg_memory, rows, nbytes in client.query(query).result_rows:
+        stats[fp] = {
+            "executions": int(executions),
+            "durationMs": int(duration_ms or 0),
+            "cpuMs": round((cpu_us or 0) / 1000, 2),
+            "peakMemoryBytes": int(peak_memory or 0),
+            "avgMemoryBytes": int(avg_memory or 0),
+            "readRows": int(rows or 0),
+            "readBytes": int(nbytes or 0),
+        }
+    return stats
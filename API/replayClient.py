@@ -0,0 +1,336 @@
+"""
+Record/replay for the ClickHouse client, for offline benchmarks and debugging.
+
+RecordingClient wraps a real client (clickhouse_connect or chdbClient) and
+writes every result into a fixture directory. ReplayClient serves the
+results from those fixtures with no database, optionally after an injected
+latency, so the Python side of the endpoints (trend forecast, alert
+transfers, inventory item formatting) runs deterministically anywhere.
+
+A fixture directory holds one Arrow IPC file per distinct query (columnar,
+zstd-compressed) plus index.json. For each query the index records the
+fingerprint (queryRegistry), the SQL, the method, the recorded latency and
+the query summary. Columns that Arrow cannot hold exactly (tuples, UInt64
+beyond Int64, NaN) are stored pickled. Fixtures are local development
+artifacts: load only ones you recorded yourself.
+
+Replay looks a query up by its exact SQL (whitespace-normalized). Queries
+whose literals differ, such as dates computed from today, fall back to the
+first recording with the same fingerprint; ReplayClient.stats counts both
+kinds of hit and the misses. A miss raises FixtureMissing.
+
+main.get_client wires it up from the environment:
+
+    CLICKHOUSE_RECORD_DIR=fixtures/tiny      record while serving normally
+    CLICKHOUSE_REPLAY_DIR=fixtures/tiny      serve from fixtures, no database
+    CLICKHOUSE_REPLAY_LATENCY=recorded|<ms>  sleep the recorded or a fixed time
+
+endpointBenchmark.py --record/--replay uses the same switches.
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import re
+import threading
+import time
+from datetime import datetime
+
+from queryRegistry import fingerprint
+
+INDEX_FILE = "index.json"
+SAMPLE_SQL_CHARS = 4000
+_SPACES = re.compile(r"\s+")
+_PICKLE = b"pickle"
+
+
+class FixtureMissing(KeyError):
+    """No recorded result for a query."""
+
+
+def fixture_key(method: str, sql) -> str:
+    return hashlib.sha1(f"{method}\n{_SPACES.sub(' ', str(sql)).strip()}".encode("utf-8")).hexdigest()[:20]
+
+
+def _column_array(values: list):
+    """Arrow array holding `values` exactly, or their pickles."""
+    import pyarrow as pa
+
+    try:
+        array = pa.array(values)
+        if array.to_pylist() == values:
+            return array, False
+    except (pa.ArrowException, OverflowError, TypeError, ValueError):
+        pass
+    return pa.array([pickle.dumps(v) for v in values], pa.binary()), True
+
+
+def _to_table(method: str, result):
+    import pyarrow as pa
+
+    if method == "query":
+        names = list(result.column_names)
+        arrays, fields = [], []
+        for name, values in zip(names, result.result_columns):
+            array, pickled = _column_array(list(values))
+            arrays.append(array)
+            fields.append(pa.field(name, array.type, metadata={b"encoding": _PICKLE} if pickled else None))
+        return pa.Table.from_arrays(arrays, schema=pa.schema(fields))
+    if method == "query_df":
+        try:
+            return pa.Table.from_pandas(result)
+        except (pa.ArrowException, TypeError, ValueError):
+            pass
+    # query_df that Arrow rejects, query_np and command: one pickled value.
+    return pa.table({"value": pa.array([pickle.dumps(result)], pa.binary())},
+                    schema=pa.schema([pa.field("value", pa.binary(), metadata={b"encoding": _PICKLE})]))
+
+
+def _columns(table) -> list:
+    columns = []
+    for field, column in zip(table.schema, table.columns):
+        values = column.to_pylist()
+        if field.metadata and field.metadata.get(b"encoding") == _PICKLE:
+            values = [pickle.loads(v) for v in values]
+        columns.append(values)
+    return columns
+
+
+def _single_pickle(table) -> bool:
+    return table.num_columns == 1 and (table.schema.field(0).metadata or {}).get(b"encoding") == _PICKLE
+
+
+class ReplayResult:
+    """The QueryResult attributes the API reads, over recorded columns."""
+
+    def __init__(self, column_names, columns: list, summary: dict):
+        self.column_names = tuple(column_names)
+        self.result_columns = columns
+        self.summary = summary
+        self.row_count = len(columns[0]) if columns else 0
+        self._rows = None
+
+    @property
+    def result_rows(self) -> list:
+        if self._rows is None:
+            self._rows = list(zip(*self.result_columns))
+        return self._rows
+
+    @property
+    def result_set(self) -> list:
+        return self.result_rows
+
+    @property
+    def first_row(self):
+        rows = self.result_rows
+        return rows[0] if rows else None
+
+    @property
+    def first_item(self):
+        row = self.first_row
+        return dict(zip(self.column_names, row)) if row is not None else None
+
+    @property
+    def named_results(self):
+        return (dict(zip(self.column_names, row)) for row in self.result_rows)
+
+
+class FixtureStore:
+    """index.json plus one Arrow file per entry; shared by every client on the same directory."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._by_fingerprint: dict[str, str] = {}
+        self._saved: set[str] = set()
+        index_path = os.path.join(path, INDEX_FILE)
+        if os.path.exists(index_path):
+            with open(index_path, encoding="utf-8") as f:
+                self.entries = json.load(f)["entries"]
+        else:
+            self.entries = {}
+        for key, entry in self.entries.items():
+            self._by_fingerprint.setdefault(f"{entry['method']}:{entry['fingerprint']}", key)
+
+    def save(self, method: str, sql, result, seconds: float):
+        import pyarrow as pa
+
+        key = fixture_key(method, sql)
+        with self._lock:
+            # Keep the first (cold) run of a query; repeats would record cache-warmed stats.
+            if key in self._saved:
+                return
+            self._saved.add(key)
+        fp, _ = fingerprint(sql)
+        table = _to_table(method, result)
+        os.makedirs(self.path, exist_ok=True)
+        file_name = f"{key}.arrow"
+        tmp = os.path.join(self.path, f".{file_name}.{threading.get_ident()}.tmp")
+        with pa.OSFile(tmp, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema, options=pa.ipc.IpcWriteOptions(compression="zstd")) as writer:
+                writer.write_table(table)
+        os.replace(tmp, os.path.join(self.path, file_name))
+
+        summary = result.attrs.get("summary") if method == "query_df" else getattr(result, "summary", None)
+        entry = {
+            "method": method,
+            "fingerprint": fp,
+            "sql": str(sql)[:SAMPLE_SQL_CHARS],
+            "file": file_name,
+            "rows": table.num_rows,
+            "seconds": round(seconds, 6),
+            "summary": {k: str(v) for k, v in summary.items()} if isinstance(summary, dict) else {},
+            "recordedAt": datetime.now().isoformat(timespec="seconds"),
+        }
+        with self._lock:
+            self.entries[key] = entry
+            self._by_fingerprint.setdefault(f"{method}:{fp}", key)
+            index_tmp = os.path.join(self.path, f".{INDEX_FILE}.tmp")
+            with open(index_tmp, "w", encoding="utf-8") as f:
+                json.dump({"version": 1, "entries": self.entries}, f, indent=1, ensure_ascii=False)
+            os.replace(index_tmp, os.path.join(self.path, INDEX_FILE))
+
+    def lookup(self, method: str, sql) -> tuple[str, dict] | None:
+        """(how, entry): how is "exact" or "fingerprint"."""
+        entry = self.entries.get(fixture_key(method, sql))
+        if entry is not None:
+            return "exact", entry
+        key = self._by_fingerprint.get(f"{method}:{fingerprint(sql)[0]}")
+        return ("fingerprint", self.entries[key]) if key else None
+
+    def load(self, entry: dict):
+        import pyarrow as pa
+
+        with pa.memory_map(os.path.join(self.path, entry["file"])) as source:
+            return pa.ipc.open_file(source).read_all()
+
+
+_stores: dict[str, FixtureStore] = {}
+_stores_lock = threading.Lock()
+
+
+def fixture_store(path: str) -> FixtureStore:
+    path = os.path.abspath(path)
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = _stores[path] = FixtureStore(path)
+        return store
+
+
+class RecordingClient:
+    """Client proxy that records every query, query_df, query_np and command result."""
+
+    def __init__(self, client, path: str):
+        self._client = client
+        self.store = fixture_store(path)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def _record(self, method: str, sql, *args, **kwargs):
+        started = time.perf_counter()
+        result = getattr(self._client, method)(sql, *args, **kwargs)
+        if method == "query":
+            # Materialize here so the recorded time includes reading all blocks.
+            result.result_columns
+        self.store.save(method, sql, result, time.perf_counter() - started)
+        return result
+
+    def query(self, query=None, *args, **kwargs):
+        return self._record("query", query, *args, **kwargs)
+
+    def query_df(self, query=None, *args, **kwargs):
+        return self._record("query_df", query, *args, **kwargs)
+
+    def query_np(self, query=None, *args, **kwargs):
+        return self._record("query_np", query, *args, **kwargs)
+
+    def command(self, cmd, *args, **kwargs):
+        return self._record("command", cmd, *args, **kwargs)
+
+
+class ReplayStats:
+    def __init__(self):
+        self.exact = 0
+        self.fingerprint = 0
+        self.misses = 0
+        self.missed: dict[str, str] = {}  # fingerprint -> SQL of the first miss
+
+    def snapshot(self) -> dict:
+        return {"exact": self.exact, "fingerprint": self.fingerprint, "misses": self.misses,
+                "missed": dict(self.missed)}
+
+
+class ReplayClient:
+    """
+    Serves recorded results. `latency` is None (no delay), "recorded" (the
+    recorded time times `latency_scale`) or fixed milliseconds.
+    """
+
+    def __init__(self, path: str, latency: str | float | None = None, latency_scale: float = 1.0):
+        self.store = fixture_store(path)
+        self.latency = latency
+        self.latency_scale = latency_scale
+        self.stats = replay_stats(path)
+
+    def _replay(self, method: str, sql):
+        found = self.store.lookup(method, sql)
+        if found is None:
+            fp, _ = fingerprint(sql)
+            self.stats.misses += 1
+            self.stats.missed.setdefault(fp, str(sql)[:SAMPLE_SQL_CHARS])
+            raise FixtureMissing(f"no recorded {method} for fingerprint {fp}")
+        how, entry = found
+        if how == "exact":
+            self.stats.exact += 1
+        else:
+            self.stats.fingerprint += 1
+
+        if self.latency == "recorded":
+            time.sleep(entry["seconds"] * self.latency_scale)
+        elif self.latency:
+            time.sleep(float(self.latency) / 1000.0)
+
+        table = self.store.load(entry)
+        summary = dict(entry["summary"])
+        if method == "query":
+            return ReplayResult(table.column_names, _columns(table), summary)
+        if method == "query_df" and not _single_pickle(table):
+            df = table.to_pandas()
+            df.attrs["summary"] = summary
+            return df
+        return pickle.loads(table.column(0)[0].as_py())
+
+    def query(self, query=None, parameters=None, settings=None, **kwargs):
+        return self._replay("query", query)
+
+    def query_df(self, query=None, parameters=None, settings=None, **kwargs):
+        return self._replay("query_df", query)
+
+    def query_np(self, query=None, parameters=None, settings=None, **kwargs):
+        return self._replay("query_np", query)
+
+    def command(self, cmd, parameters=None, settings=None, **kwargs):
+        return self._replay("command", cmd)
+
+    def close(self):
+        pass
+
+
+_replay_stats: dict[str, ReplayStats] = {}
+
+
+def replay_stats(path: str) -> ReplayStats:
+    """Hit/miss counters of one fixture directory (shared by its ReplayClients)."""
+    path = os.path.abspath(path)
+    with _stores_lock:
+        return _replay_stats.setdefault(path, ReplayStats())
+
+
+def latency_from_env(value: str) -> str | float | None:
+    value = (value or "").strip().lower()
+    if value in {"", "0", "none", "off"}:
+        return None
+    return "recorded" if value == "recorded" else float(value)
@@ -0,0 +1,408 @@
+"""
+On-demand profiling of single production requests.
+
+A request is profiled when it carries `X-Profile: sample|cprofile|memory`
+(or the query flag `_profile=...`) and a X-Debug-Token header matching
+API_DEBUG_TOKEN. Without a configured token nothing is profiled and main.py
+does not install the middleware. Other requests only pay for the header scan
+in ProfilingMiddleware and one ContextVar lookup in the endpoint wrapper
+(requestTiming._timed_endpoint); set API_PROFILING=false to drop the
+middleware entirely.
+
+Modes:
+
+    sample    a background thread samples the endpoint's thread stack every
+              PROFILE_INTERVAL_MS and counts collapsed stacks
+              ("root;caller;leaf count" lines, the input format of
+              flamegraph.pl, speedscope and inferno)
+    cprofile  deterministic cProfile of the endpoint; the stats are kept in
+              pstats format (snakeviz, flameprof) plus a top-functions table
+    memory    tracemalloc snapshots around the endpoint: allocation sites of
+              what it still holds when it returns (its result), and the
+              traced peak (process-wide while other requests overlap)
+
+Async endpoints run on the event loop thread, so their profile can include
+other requests interleaved at await points; sync endpoints (most of this API)
+run alone on a worker thread.
+
+Finished profiles are kept in memory (last PROFILE_KEEP, see /api/_debug/profiles)
+together with the request's SQL text and ClickHouse statistics, and written
+to PROFILE_DIR when that is set. The response carries X-Profile-Id.
+"""
+
+import cProfile
+import io
+import json
+import marshal
+import os
+import pstats
+import secrets
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, OrderedDict
+from contextvars import ContextVar
+from urllib.parse import parse_qs
+
+from queryRegistry import fingerprint
+from requestMemory import TRACEMALLOC_FRAMES
+
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "")
+# Profiles running at once; further profile requests run unprofiled.
+PROFILE_CONCURRENCY = 2
+TOP_FUNCTIONS = 40
+
+MODES = {"1": "sample", "true": "sample", "sample": "sample", "cprofile": "cprofile", "memory": "memory"}
+
+_active: ContextVar["RequestProfile | None"] = ContextVar("request_profile", default=None)
+_slots = threading.BoundedSemaphore(PROFILE_CONCURRENCY)
+# cProfile hooks and tracemalloc peaks are process state; one such profile at a time.
+_exclusive_lock = threading.Lock()
+
+
+def current_profile() -> "RequestProfile | None":
+    return _active.get()
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def collapse_stack(frame) -> str:
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class StackSampler:
+    """Samples the stacks of registered threads from a background thread."""
+
+    def __init__(self, interval_seconds: float):
+        self.interval = interval_seconds
+        self.threads: set[int] = set()
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.sampled_seconds = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    @property
+    def sample_ms(self) -> float:
+        """Wall time per sample actually taken (waits stretch under GIL contention)."""
+        if not self.samples:
+            return self.interval * 1000
+        return self.sampled_seconds * 1000 / self.samples
+
+    def _run(self):
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            elapsed, last = now - last, now
+            if not self.threads:
+                continue
+            frames = sys._current_frames()
+            for ident in list(self.threads):
+                frame = frames.get(ident)
+                if frame is not None:
+                    self.stacks[collapse_stack(frame)] += 1
+            self.samples += 1
+            self.sampled_seconds += elapsed
+
+
+class RequestProfile:
+    def __init__(self, profile_id: str, mode: str):
+        self.id = profile_id
+        self.mode = mode
+        self.started = time.time()
+        self.sampler = StackSampler(PROFILE_INTERVAL_MS / 1000) if mode == "sample" else None
+        self.profiler = cProfile.Profile() if mode == "cprofile" else None
+        self.busy = False
+        self.memory = None
+        self._snapshot = None
+        self._traced_start = 0
+        self._started_tracing = False
+
+    def start(self):
+        if self.sampler is not None:
+            self.sampler.start()
+
+    def stop(self):
+        if self.sampler is not None:
+            self.sampler.stop()
+
+    def _enter(self) -> bool:
+        if self.sampler is not None:
+            self.sampler.threads.add(threading.get_ident())
+            return True
+        if not _exclusive_lock.acquire(blocking=False):
+            self.busy = True
+            return False
+        if self.profiler is not None:
+            self.profiler.enable()
+        else:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+                self._started_tracing = True
+            self._snapshot = tracemalloc.take_snapshot()
+            tracemalloc.reset_peak()
+            self._traced_start = tracemalloc.get_traced_memory()[0]
+        return True
+
+    def _exit(self):
+        if self.sampler is not None:
+            self.sampler.threads.discard(threading.get_ident())
+            return
+        if self.profiler is not None:
+            self.profiler.disable()
+        else:
+            self._memory_diff()
+        _exclusive_lock.release()
+
+    def _memory_diff(self):
+        current, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+        if self._started_tracing:
+            tracemalloc.stop()
+        diff = after.compare_to(self._snapshot, "lineno")
+        self.memory = {
+            "retainedBytes": current - self._traced_start,
+            "peakBytes": peak - self._traced_start,
+            "sites": [
+                {
+                    "function": f"{os.path.basename(stat.traceback[0].filename)}:{stat.traceback[0].lineno}",
+                    "sizeDiffBytes": stat.size_diff,
+                    "countDiff": stat.count_diff,
+                    "sizeBytes": stat.size,
+                }
+                for stat in diff[:TOP_FUNCTIONS] if stat.size_diff > 0
+            ],
+        }
+        self._snapshot = None
+
+    def run(self, fn, *args, **kwargs):
+        """Call a sync endpoint under the profiler (on its worker thread)."""
+        if not self._enter():
+            return fn(*args, **kwargs)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self._exit()
+
+    async def run_async(self, fn, *args, **kwargs):
+        if not self._enter():
+            return await fn(*args, **kwargs)
+        try:
+            return await fn(*args, **kwargs)
+        finally:
+            self._exit()
+
+    def collapsed(self) -> str:
+        if self.sampler is None:
+            return ""
+        return "".join(f"{stack} {count}\n" for stack, count in self.sampler.stacks.most_common())
+
+    def pstats_bytes(self) -> bytes:
+        if self.profiler is None:
+            return b""
+        self.profiler.create_stats()
+        return marshal.dumps(self.profiler.stats)
+
+    def top_functions(self) -> list[dict]:
+        if self.mode == "memory":
+            return self.memory["sites"] if self.memory else []
+        if self.sampler is not None:
+            # Self samples per leaf frame.
+            leaves = Counter()
+            for stack, count in self.sampler.stacks.items():
+                leaves[stack.rsplit(";", 1)[-1]] += count
+            sample_ms = self.sampler.sample_ms
+            return [
+                {"function": leaf, "samples": count, "selfMs": round(count * sample_ms, 1)}
+                for leaf, count in leaves.most_common(TOP_FUNCTIONS)
+            ]
+        stats = pstats.Stats(self.profiler, stream=io.StringIO())
+        rows = []
+        for (filename, line, name), (_, calls, tottime, cumtime, _) in stats.stats.items():
+            rows.append({
+                "function": f"{name} ({os.path.basename(filename)}:{line})",
+                "calls": calls,
+                "selfMs": round(tottime * 1000, 3),
+                "cumulativeMs": round(cumtime * 1000, 3),
+            })
+        rows.sort(key=lambda r: r["cumulativeMs"], reverse=True)
+        return rows[:TOP_FUNCTIONS]
+
+
+class ProfileStore:
+    """Last `keep` finished profiles, newest last."""
+
+    def __init__(self, keep: int = PROFILE_KEEP, directory: str = PROFILE_DIR):
+        self.keep = keep
+        self.directory = directory
+        self._entries: OrderedDict[str, dict] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, entry: dict):
+        with self._lock:
+            self._entries[entry["id"]] = entry
+            self._entries.move_to_end(entry["id"])
+            while len(self._entries) > self.keep:
+                self._entries.popitem(last=False)
+        if self.directory:
+            self._write(entry)
+
+    def _write(self, entry: dict):
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, entry["id"])
+        if entry["collapsed"]:
+            with open(base + ".collapsed", "w", encoding="utf-8") as f:
+                f.write(entry["collapsed"])
+        if entry["pstats"]:
+            with open(base + ".prof", "wb") as f:
+                f.write(entry["pstats"])
+        with open(base + ".json", "w", encoding="utf-8") as f:
+            json.dump(summary(entry, detail=True), f, ensure_ascii=False, indent=2, default=str)
+
+    def get(self, profile_id: str) -> dict | None:
+        with self._lock:
+            return self._entries.get(profile_id)
+
+    def list(self) -> list[dict]:
+        with self._lock:
+            entries = list(self._entries.values())
+        return [summary(e) for e in reversed(entries)]
+
+
+def summary(entry: dict, detail: bool = False) -> dict:
+    """JSON view of a stored profile (without the raw profile data)."""
+    keys = ("id", "requestId", "mode", "method", "path", "route", "status", "startedAt", "totalMs", "samples", "chQueries", "chMs")
+    view = {k: entry.get(k) for k in keys}
+    if detail:
+        view.update({k: entry.get(k) for k in ("timing", "queries", "topFunctions", "memory", "note")})
+    return view
+
+
+profiles = ProfileStore()
+
+
+def _query_stats(timing) -> list[dict]:
+    if timing is None:
+        return []
+    rows = []
+    for seq, q in enumerate(timing.queries, start=1):
+        rows.append({
+            "queryId": f"{timing.server_id}-{seq}",
+            "fingerprint": fingerprint(q.sql)[0],
+            "ms": round(q.seconds * 1000, 2),
+            "serverMs": round(q.server_seconds * 1000, 2),
+            "rowsRead": q.rows_read,
+            "bytesRead": q.bytes_read,
+            "sql": q.sql,
+        })
+    return rows
+
+
+def requested_mode(scope, token: str) -> str | None:
+    """Profiling mode asked for by the request, if it is allowed to ask (never without a token)."""
+    if not token:
+        return None
+    mode = authorized = None
+    for name, value in scope.get("headers") or ():
+        if name == b"x-profile":
+            mode = MODES.get(value.decode("latin-1").strip().lower())
+        elif name == b"x-debug-token":
+            authorized = secrets.compare_digest(value.decode("latin-1"), token)
+    query = scope.get("query_string") or b""
+    if mode is None and b"_profile=" in query:
+        values = parse_qs(query.decode("latin-1")).get("_profile") or [""]
+        mode = MODES.get(values[-1].strip().lower())
+    if mode is None or not authorized:
+        return None
+    return mode
+
+
+class ProfilingMiddleware:
+    """
+    Pure ASGI middleware; must sit inside ServerTimingMiddleware so the
+    request's timing (SQL, ClickHouse stats) is available via `timing_of`.
+    """
+
+    def __init__(self, app, token: str = "", timing_of=None, store: ProfileStore | None = None):
+        self.app = app
+        self.token = token
+        self.timing_of = timing_of
+        self.store = store or profiles
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        mode = requested_mode(scope, self.token)
+        if mode is None:
+            return await self.app(scope, receive, send)
+
+        if not _slots.acquire(blocking=False):
+            async def send_skipped(message):
+                if message["type"] == "http.response.start":
+                    message = {**message, "headers": [*message.get("headers", []), (b"x-profile", b"skipped")]}
+                await send(message)
+
+            return await self.app(scope, receive, send_skipped)
+
+        timing = self.timing_of() if self.timing_of else None
+        # server_id, not the client's X-Request-ID: repeated ids must not overwrite each other's profiles.
+        profile = RequestProfile(timing.server_id if timing is not None else f"p{time.time_ns()}", mode)
+        status = 500
+
+        async def send_with_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = [*message.get("headers", []), (b"x-profile-id", profile.id.encode("latin-1"))]
+                message = {**message, "headers": headers}
+            await send(message)
+
+        token = _active.set(profile)
+        profile.start()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            _active.reset(token)
+            profile.stop()
+            _slots.release()
+            self._store(profile, scope, status, timing)
+
+    def _store(self, profile: RequestProfile, scope, status: int, timing):
+        record = timing.record(scope.get("method", ""), scope.get("path", ""), status, 0) if timing else {}
+        self.store.add({
+            "id": profile.id,
+            "requestId": timing.request_id if timing else None,
+            "mode": profile.mode,
+            "method": scope.get("method", ""),
+            "path": scope.get("path", ""),
+            "route": record.get("route"),
+            "status": status,
+            "startedAt": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(profile.started)),
+            "totalMs": round((time.time() - profile.started) * 1000, 2),
+            "samples": profile.sampler.samples if profile.sampler else None,
+            "chQueries": record.get("chQueries"),
+            "chMs": record.get("chMs"),
+            "timing": record,
+            "queries": _query_stats(timing),
+            "topFunctions": profile.top_functions(),
+            "memory": {k: v for k, v in profile.memory.items() if k != "sites"} if profile.memory else None,
+            "note": f"another {profile.mode} profile was running; endpoint ran unprofiled" if profile.busy else None,
+            "collapsed": profile.collapsed(),
+            "pstats": profile.pstats_bytes(),
+        })
@@ -0,0 +1,348 @@
+"""
+Per-request timing: where a request spent its time, as a Server-Timing header
+and one structured log line (sampled per route, see apiLogging).
+
+Phases recorded for every request:
+
+    ch-connect   creating the ClickHouse client (get_client)
+    ch           wall time of ClickHouse calls until the first block arrives
+    ch-server    server-side elapsed time from the query summaries
+    ch-decode    materializing result rows/columns (the remaining blocks are
+                 read and deserialized lazily by clickhouse_connect)
+    handler      the endpoint function itself (includes the phases above)
+    serialize    from the endpoint returning to the response being ready
+                 (jsonable_encoder and JSON rendering)
+    dispatch     the rest of the route: parameter parsing/validation and the
+                 threadpool hop for sync endpoints
+    total        whole request inside the app
+
+rows_read / bytes_read from the query summaries go into the description of
+the `ch` entry. Each request has an id (X-Request-ID, reused from the client
+when present) that is also used to tag its ClickHouse queries. The state lives in a ContextVar, which anyio copies into the
+threadpool that runs sync endpoints, so module code needs no changes: the
+client returned by get_client is wrapped in TimedClient.
+"""
+
+import functools
+import inspect
+import itertools
+import logging
+import re
+import time
+import uuid
+from contextvars import ContextVar
+
+from fastapi.routing import APIRoute
+
+from apiLogging import log_control
+from apiMetrics import ch_bytes_read, ch_connect, ch_errors, ch_in_flight, ch_queries, ch_rows_read
+from queryRegistry import fingerprint, query_tags, registry
+from requestProfiler import current_profile
+
+timing_logger = logging.getLogger("api.timing")
+
+
+class QueryStat:
+    __slots__ = ("sql", "seconds", "server_seconds", "rows_read", "bytes_read", "result_rows")
+
+    def __init__(self, sql: str, seconds: float, summary: dict | None):
+        summary = summary or {}
+        self.sql = sql
+        self.seconds = seconds
+        self.server_seconds = int(summary.get("elapsed_ns") or 0) / 1e9
+        self.rows_read = int(summary.get("read_rows") or 0)
+        self.bytes_read = int(summary.get("read_bytes") or 0)
+        self.result_rows = int(summary.get("result_rows") or 0)
+
+
+class RequestTiming:
+    def __init__(self, request_id: str | None = None):
+        # server_id prefixes ClickHouse query_ids; request_id may come from the client and repeat.
+        self.server_id = uuid.uuid4().hex[:16]
+        self.request_id = request_id or self.server_id
+        self.query_seq = itertools.count(1)
+        self.started = time.perf_counter()
+        self.connect_seconds = 0.0
+        self.decode_seconds = 0.0
+        self.handler_seconds = 0.0
+        self.route_seconds = 0.0
+        self.serialize_seconds = 0.0
+        self.handler_returned = None
+        self.queries: list[QueryStat] = []
+        self.route = None
+
+    def add_query(self, stat: QueryStat):
+        self.queries.append(stat)
+
+    @property
+    def ch_seconds(self) -> float:
+        return sum(q.seconds for q in self.queries)
+
+    @property
+    def ch_server_seconds(self) -> float:
+        return sum(q.server_seconds for q in self.queries)
+
+    @property
+    def rows_read(self) -> int:
+        return sum(q.rows_read for q in self.queries)
+
+    @property
+    def bytes_read(self) -> int:
+        return sum(q.bytes_read for q in self.queries)
+
+    @property
+    def dispatch_seconds(self) -> float:
+        return max(0.0, self.route_seconds - self.handler_seconds - self.serialize_seconds)
+
+    def header(self) -> str:
+        total = time.perf_counter() - self.started
+        parts = []
+        if self.connect_seconds:
+            parts.append(f"ch-connect;dur={self.connect_seconds * 1000:.2f}")
+        if self.queries:
+            parts.append(
+                f'ch;dur={self.ch_seconds * 1000:.2f};desc="{len(self.queries)} queries, '
+                f'rows_read={self.rows_read}, bytes_read={self.bytes_read}"'
+            )
+            parts.append(f"ch-server;dur={self.ch_server_seconds * 1000:.2f}")
+        if self.decode_seconds:
+            parts.append(f"ch-decode;dur={self.decode_seconds * 1000:.2f}")
+        if self.route_seconds:
+            parts.append(f"handler;dur={self.handler_seconds * 1000:.2f}")
+            parts.append(f"serialize;dur={self.serialize_seconds * 1000:.2f}")
+            parts.append(f"dispatch;dur={self.dispatch_seconds * 1000:.2f}")
+        parts.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(parts)
+
+    def record(self, method: str, path: str, status: int, response_bytes: int) -> dict:
+        return {
+            "requestId": self.request_id,
+            "serverId": self.server_id,
+            "method": method,
+            "path": path,
+            "route": self.route or path,
+            "status": status,
+            "totalMs": round((time.perf_counter() - self.started) * 1000, 2),
+            "chConnectMs": round(self.connect_seconds * 1000, 2),
+            "chQueries": len(self.queries),
+            "chMs": round(self.ch_seconds * 1000, 2),
+            "chServerMs": round(self.ch_server_seconds * 1000, 2),
+            "chDecodeMs": round(self.decode_seconds * 1000, 2),
+            "rowsRead": self.rows_read,
+            "bytesRead": self.bytes_read,
+            "handlerMs": round(self.handler_seconds * 1000, 2),
+            "serializeMs": round(self.serialize_seconds * 1000, 2),
+            "dispatchMs": round(self.dispatch_seconds * 1000, 2),
+            "responseBytes": response_bytes,
+        }
+
+
+_current: ContextVar[RequestTiming | None] = ContextVar("request_timing", default=None)
+
+
+def current_timing() -> RequestTiming | None:
+    return _current.get()
+
+
+def current_route() -> str | None:
+    timing = _current.get()
+    return timing.route if timing is not None else None
+
+
+# QueryResult attributes that read and deserialize the remaining blocks.
+_MATERIALIZING = frozenset({"result_rows", "result_columns", "result_set", "first_row", "first_item", "named_results"})
+
+
+class TimedResult:
+    """QueryResult proxy charging lazy block decoding to the request's ch-decode."""
+
+    __slots__ = ("_result", "_timing")
+
+    def __init__(self, result, timing: RequestTiming):
+        self._result = result
+        self._timing = timing
+
+    def __getattr__(self, name):
+        if name not in _MATERIALIZING:
+            return getattr(self._result, name)
+        started = time.perf_counter()
+        value = getattr(self._result, name)
+        if name == "named_results":
+            value = list(value)
+        self._timing.decode_seconds += time.perf_counter() - started
+        return value
+
+
+class TimedClient:
+    """
+    clickhouse_connect client proxy: records every query into the current
+    request and the fingerprint registry, and tags it for system.query_log.
+    """
+
+    def __init__(self, client):
+        self._client = client
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def _timed(self, method, sql, *args, **kwargs):
+        timing = _current.get()
+        fp, normalized = fingerprint(sql)
+        endpoint = timing.route if timing is not None else None
+        request_id = timing.request_id if timing is not None else None
+        query_id = f"{timing.server_id}-{next(timing.query_seq)}" if timing is not None else None
+        # Caller settings win over the tags.
+        kwargs["settings"] = {**query_tags(endpoint, request_id, query_id, fp), **(kwargs.get("settings") or {})}
+
+        labels = (endpoint or "(background)",)
+        ch_in_flight.enter()
+        started = time.perf_counter()
+        try:
+            result = method(sql, *args, **kwargs)
+        except Exception:
+            registry.record(fp, normalized, endpoint, time.perf_counter() - started, failed=True)
+            ch_errors.inc(labels)
+            raise
+        finally:
+            ch_in_flight.exit()
+        summary = getattr(result, "summary", None)
+        if summary is None:
+            # DataFrames from chdbClient carry the summary in attrs.
+            summary = (getattr(result, "attrs", None) or {}).get("summary")
+        stat = QueryStat(str(sql), time.perf_counter() - started, summary if isinstance(summary, dict) else None)
+        registry.record(fp, normalized, endpoint, stat.seconds, stat.rows_read, stat.bytes_read)
+        ch_queries.observe(stat.seconds, labels)
+        ch_rows_read.inc(labels, stat.rows_read)
+        ch_bytes_read.inc(labels, stat.bytes_read)
+        if timing is not None:
+            timing.add_query(stat)
+        return result
+
+    def query(self, sql=None, *args, **kwargs):
+        result = self._timed(self._client.query, sql, *args, **kwargs)
+        timing = _current.get()
+        return TimedResult(result, timing) if timing is not None else result
+
+    def query_df(self, sql=None, *args, **kwargs):
+        return self._timed(self._client.query_df, sql, *args, **kwargs)
+
+    def query_np(self, sql=None, *args, **kwargs):
+        return self._timed(self._client.query_np, sql, *args, **kwargs)
+
+    def command(self, sql, *args, **kwargs):
+        return self._timed(self._client.command, sql, *args, **kwargs)
+
+
+def record_connect(seconds: float):
+    ch_connect.observe(seconds)
+    timing = _current.get()
+    if timing is not None:
+        timing.connect_seconds += seconds
+
+
+def _timed_endpoint(endpoint):
+    """Wrap an endpoint so its own run time is charged to `handler` (and profiled on request)."""
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            profile = current_profile()
+            try:
+                if profile is not None:
+                    return await profile.run_async(endpoint, *args, **kwargs)
+                return await endpoint(*args, **kwargs)
+            finally:
+                timing = _current.get()
+                if timing is not None:
+                    timing.handler_returned = time.perf_counter()
+                    timing.handler_seconds += timing.handler_returned - started
+    else:
+        @functools.wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            profile = current_profile()
+            try:
+                if profile is not None:
+                    return profile.run(endpoint, *args, **kwargs)
+                return endpoint(*args, **kwargs)
+            finally:
+                timing = _current.get()
+                if timing is not None:
+                    timing.handler_returned = time.perf_counter()
+                    timing.handler_seconds += timing.handler_returned - started
+    return wrapper
+
+
+class TimedRoute(APIRoute):
+    """APIRoute that times the endpoint and the whole route handler (endpoint + serialization)."""
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, _timed_endpoint(endpoint), **kwargs)
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        route_path = self.path
+
+        async def timed_handler(request):
+            timing = _current.get()
+            if timing is None:
+                return await handler(request)
+            timing.route = route_path
+            started = time.perf_counter()
+            try:
+                return await handler(request)
+            finally:
+                finished = time.perf_counter()
+                timing.route_seconds += finished - started
+                if timing.handler_returned is not None:
+                    timing.serialize_seconds += finished - timing.handler_returned
+
+        return timed_handler
+
+
+# Client-supplied X-Request-ID values are echoed and logged when they look like ids.
+_REQUEST_ID = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+
+class ServerTimingMiddleware:
+    """Pure ASGI middleware: starts the request timing, adds Server-Timing, logs one line."""
+
+    def __init__(self, app, log: bool = True, logger: logging.Logger | None = None):
+        self.app = app
+        self.log = log
+        self.logger = logger or timing_logger
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        request_id = None
+        for name, value in scope.get("headers") or ():
+            if name == b"x-request-id":
+                candidate = value.decode("latin-1")
+                request_id = candidate if _REQUEST_ID.fullmatch(candidate) else None
+                break
+        timing = RequestTiming(request_id)
+        token = _current.set(timing)
+        status = 500
+        response_bytes = 0
+
+        async def send_with_timing(message):
+            nonlocal status, response_bytes
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers") or [])
+                headers.append((b"server-timing", timing.header().encode("latin-1")))
+                headers.append((b"x-request-id", timing.request_id.encode("latin-1")))
+                message = {**message, "headers": headers}
+            elif message["type"] == "http.response.body":
+                response_bytes += len(message.get("body") or b"")
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            if self.log and self.logger.isEnabledFor(logging.INFO) and log_control.sampled(timing.route):
+                record = timing.record(scope.get("method", ""), scope.get("path", ""), status, response_bytes)
+                self.logger.info("request_timing", extra={"fields": record})
@@ -0,0 +1,65 @@
+"""
+Result-size guardrails for list-heavy endpoints.
+
+A dict returned from an endpoint is deep-copied by jsonable_encoder and then
+rendered into one body before the first byte goes out, so a 20,000-row
+alerts response is held about three times over. Above RESULT_STREAM_ROWS
+rows the list is streamed instead: the JSON document is written in chunks of
+STREAM_CHUNK_ROWS items, each encoded on its own, and a generator (the
+/api/hierarchy regions) is never materialized as a whole.
+
+/api/products also takes an opt-in `limit` (at most RESULT_MAX_ROWS) and
+hands out a cursor for the rest; without it the full list is streamed, as
+existing callers expect.
+"""
+
+import json
+import os
+from typing import Iterable, Iterator
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+
+from apiMetrics import Counter, metrics
+
+RESULT_STREAM_ROWS = int(os.getenv("RESULT_STREAM_ROWS", "5000"))
+RESULT_MAX_ROWS = int(os.getenv("RESULT_MAX_ROWS", "20000"))
+STREAM_CHUNK_ROWS = 500
+
+result_guard = metrics.add(Counter(
+    "api_result_guard_total", "Oversize responses streamed or paginated, by route.", ("route", "action"),
+))
+
+
+def _dumps(value) -> str:
+    # Same rendering as JSONResponse.
+    return json.dumps(jsonable_encoder(value), ensure_ascii=False, allow_nan=False, separators=(",", ":"))
+
+
+def json_chunks(head: dict, list_key: str, items: Iterable, chunk_rows: int = STREAM_CHUNK_ROWS) -> Iterator[bytes]:
+    """`{**head, list_key: [*items]}` as JSON, encoding `chunk_rows` items at a time."""
+    opening = _dumps(head)[:-1] + ("," if head else "") + json.dumps(list_key) + ":["
+    yield opening.encode("utf-8")
+    chunk, first = [], True
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= chunk_rows:
+            yield (("" if first else ",") + _dumps(chunk)[1:-1]).encode("utf-8")
+            chunk, first = [], False
+    if chunk:
+        yield (("" if first else ",") + _dumps(chunk)[1:-1]).encode("utf-8")
+    yield b"]}"
+
+
+def stream_json(route: str, head: dict, list_key: str, items: Iterable, chunk_rows: int = STREAM_CHUNK_ROWS):
+    result_guard.inc((route, "stream"))
+    return StreamingResponse(json_chunks(head, list_key, items, chunk_rows), media_type="application/json")
+
+
+def guard_result(route: str, result, list_key: str):
+    """`result` unchanged, or streamed when its `list_key` list exceeds RESULT_STREAM_ROWS."""
+    rows = result.get(list_key) if isinstance(result, dict) else None
+    if not isinstance(rows, list) or len(rows) <= RESULT_STREAM_ROWS:
+        return result
+    head = {k: v for k, v in result.items() if k != list_key}
+    return stream_json(route, head, list_key, rows)
@@ -0,0 +1,353 @@
+"""
+Dashboard-session load generator.
+
+Simulates N users working in the dashboard at the same time. Each user opens
+the app (hierarchy, reyonlar and the filter lists), then moves between
+the Overview, Demand, Inventory and Promotions pages. Opening a page fires
+that page's requests concurrently, as the frontend does. Between page loads
+the user pauses for a think time, then does one of three things:
+
+    filter   drill into a region, store or category (or clear the filters);
+             the filter lists are refetched and the page reloads
+    period   change the period (7/30/90 days) and reload the page
+    page     open another page
+
+Each user has its own connection pool of 6 connections, like a browser
+talking HTTP/1.1 to one host. Users start spread over --ramp seconds, and the
+run lasts --duration seconds.
+
+Reported: throughput, and per route the count, error rate and p50/p95/p99/max
+latency. Page latency is also reported: the time until a page's whole
+fan-out has returned, which is what a user waits for.
+
+    python sessionLoad.py --url http://127.0.0.1:8000 --users 20 --duration 120
+    python sessionLoad.py --serve --scale small --users 10 --duration 60 --out load.json
+
+--serve starts a local uvicorn on the synthetic benchmark data (see
+endpointBenchmark); chdb databases are single-process, so it runs one worker.
+To size workers, start `uvicorn main:app --workers N` against ClickHouse and
+use --url.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from datetime import date
+
+import httpx
+
+from endpointBenchmark import DATA_DIR, SCALES, ensure_dataset, percentile
+
+R = ("regionIds",)
+RS = ("regionIds", "storeIds")
+RSC = ("regionIds", "storeIds", "categoryIds")
+SC = ("storeIds", "categoryIds")
+
+# page -> [(path, filter keys, params)]; "{days}", "{month}" and "{year}" come from the session.
+PAGES = {
+    "shell": [
+        ("/api/hierarchy", (), {}),
+        ("/api/reyonlar", (), {}),
+    ],
+    "filters": [
+        ("/api/stores", R, {}),
+        ("/api/categories", RS, {}),
+        ("/api/products", RSC, {}),
+    ],
+    "overview": [
+        ("/api/dashboard/metrics", RSC, {}),
+        ("/api/dashboard/revenue-chart", RSC, {}),
+        ("/api/chart/historical", RSC, {}),
+        ("/api/alerts/summary", RSC, {}),
+        ("/api/dashboard/promotions", RSC, {}),
+    ],
+    "demand": [
+        ("/api/demand/kpis", RSC, {"periodValue": "{days}", "periodUnit": "gun"}),
+        ("/api/demand/growth-products", SC, {"days": 30, "type": "all"}),
+        ("/api/demand/forecast-errors", SC, {"days": 30}),
+        ("/api/demand/trend-forecast", SC, {"period": "daily", "daysPast": "{days}", "daysFuture": "{days}"}),
+        ("/api/demand/monthly-bias", SC, {}),
+        ("/api/demand/year-comparison", SC, {}),
+    ],
+    "inventory": [
+        ("/api/inventory/kpis", RSC, {"days": "{days}"}),
+        ("/api/inventory/items", RSC, {"limit": 100, "days": "{days}"}),
+        ("/api/inventory/stock-trends", RSC, {"days": "{days}"}),
+        ("/api/inventory/store-performance", RSC, {"days": "{days}"}),
+        ("/api/alerts/inventory", RSC, {"limit": 5000, "days": "{days}"}),
+    ],
+    "promotions": [
+        ("/api/forecast/promotion-history", RSC, {"limit": 40}),
+        ("/api/forecast/similar-campaigns", RSC, {"limit": 5}),
+        ("/api/forecast/calendar", RSC, {"month": "{month}", "year": "{year}"}),
+        ("/api/inventory/stock-trends", RSC, {"days": "{days}"}),
+    ],
+}
+PAGE_WEIGHTS = {"overview": 0.35, "demand": 0.25, "inventory": 0.25, "promotions": 0.15}
+ACTION_WEIGHTS = {"filter": 0.4, "period": 0.2, "page": 0.4}
+PERIODS = (7, 30, 90)
+BROWSER_CONNECTIONS = 6
+
+
+class LoadStats:
+    def __init__(self):
+        self.requests: dict[str, list] = {}   # route -> [(ms, status)]
+        self.pages: dict[str, list] = {}      # page -> [ms]
+        self.started = time.perf_counter()
+        self.finished = None
+
+    def request(self, route: str, ms: float, status: int):
+        self.requests.setdefault(route, []).append((ms, status))
+
+    def page(self, page: str, ms: float):
+        self.pages.setdefault(page, []).append(ms)
+
+    def report(self) -> dict:
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        total = sum(len(v) for v in self.requests.values())
+        errors = sum(1 for v in self.requests.values() for _, status in v if not 200 <= status < 400)
+
+        def latency(samples):
+            return {
+                "p50Ms": round(percentile(samples, 0.50), 1),
+                "p95Ms": round(percentile(samples, 0.95), 1),
+                "p99Ms": round(percentile(samples, 0.99), 1),
+                "maxMs": round(max(samples, default=0.0), 1),
+            }
+
+        routes = {}
+        for route, samples in sorted(self.requests.items()):
+            failed = sum(1 for _, status in samples if not 200 <= status < 400)
+            statuses = {}
+            for _, status in samples:
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+            routes[route] = {
+                "count": len(samples),
+                "errorRate": round(failed / len(samples), 4),
+                "statuses": statuses,
+                **latency([ms for ms, _ in samples]),
+            }
+        return {
+            "elapsedSeconds": round(elapsed, 1),
+            "requests": total,
+            "requestsPerSecond": round(total / elapsed, 2) if elapsed else 0.0,
+            "pageLoads": sum(len(v) for v in self.pages.values()),
+            "errorRate": round(errors / total, 4) if total else 0.0,
+            "pages": {page: {"count": len(v), **latency(v)} for page, v in sorted(self.pages.items())},
+            "routes": routes,
+        }
+
+
+def discover_filters(url: str) -> dict:
+    """Regions, stores per region and categories per store to drill into."""
+    with httpx.Client(base_url=url, timeout=600) as http:
+        def get(path, **params):
+            response = http.get(path, params=params)
+            response.raise_for_status()
+            return response.json()
+
+        regions = [r["value"] for r in get("/api/hierarchy/regions")["regions"]]
+        stores: dict[str, list] = {}
+        for store in get("/api/stores")["stores"]:
+            stores.setdefault(store.get("regionValue"), []).append(store["value"])
+        categories: dict[str, list] = {}
+        for category in get("/api/categories")["categories"]:
+            # Bare category code, as use-filter-options.ts sends it (values are "store_category").
+            categories.setdefault(category["storeValue"], []).append(category["value"].split("_")[-1])
+    return {"regions": regions, "stores": stores, "categories": categories}
+
+
+class Session:
+    """One simulated user: filter state, period and current page."""
+
+    def __init__(self, user: int, http: httpx.AsyncClient, stats: LoadStats, pools: dict,
+                 think_seconds: float, seed: int):
+        self.user = user
+        self.http = http
+        self.stats = stats
+        self.pools = pools
+        self.think_seconds = think_seconds
+        self.rng = random.Random(seed * 100003 + user)
+        self.filters: dict[str, list] = {}
+        self.days = 30
+        today = date.today()
+        self.month, self.year = today.month, today.year
+        self.page = self._choose(PAGE_WEIGHTS)
+
+    def _choose(self, weights: dict) -> str:
+        return self.rng.choices(list(weights), list(weights.values()))[0]
+
+    def _params(self, keys: tuple, params: dict) -> dict:
+        values = {"days": self.days, "month": self.month, "year": self.year}
+        out = {k: self.filters[k] for k in keys if self.filters.get(k)}
+        for name, value in params.items():
+            out[name] = value.format_map(values) if isinstance(value, str) else value
+        return out
+
+    async def _get(self, path: str, params: dict):
+        started = time.perf_counter()
+        status = 0
+        try:
+            response = await self.http.get(path, params=params)
+            await response.aread()
+            status = response.status_code
+        except httpx.HTTPError:
+            pass
+        self.stats.request(path, (time.perf_counter() - started) * 1000, status)
+
+    async def load(self, page: str):
+        started = time.perf_counter()
+        await asyncio.gather(*(self._get(path, self._params(keys, params)) for path, keys, params in PAGES[page]))
+        self.stats.page(page, (time.perf_counter() - started) * 1000)
+
+    def _change_filter(self):
+        region = (self.filters.get("regionIds") or [None])[0]
+        store = (self.filters.get("storeIds") or [None])[0]
+        stores = self.pools["stores"].get(region) or []
+        categories = self.pools["categories"].get(store) or []
+        if self.rng.random() < 0.2 or (region and store and self.filters.get("categoryIds")):
+            self.filters = {}
+        elif region is None and self.pools["regions"]:
+            self.filters = {"regionIds": [self.rng.choice(self.pools["regions"])]}
+        elif store is None and stores:
+            self.filters = {"regionIds": [region], "storeIds": [self.rng.choice(stores)]}
+        elif categories:
+            self.filters = {**self.filters, "categoryIds": [self.rng.choice(categories)]}
+        else:
+            self.filters = {}
+
+    async def think(self):
+        if self.think_seconds > 0:
+            await asyncio.sleep(self.rng.expovariate(1 / self.think_seconds))
+
+    async def run(self, deadline: float):
+        await asyncio.gather(self.load("shell"), self.load("filters"))
+        while time.perf_counter() < deadline:
+            await self.load(self.page)
+            await self.think()
+            action = self._choose(ACTION_WEIGHTS)
+            if action == "filter":
+                self._change_filter()
+                await self.load("filters")
+            elif action == "period":
+                self.days = self.rng.choice([d for d in PERIODS if d != self.days])
+            else:
+                self.page = self._choose({p: w for p, w in PAGE_WEIGHTS.items() if p != self.page})
+
+
+async def run_load(url: str, users: int, duration: float, ramp: float = 10.0, think_seconds: float = 5.0,
+                   timeout: float = 60.0, seed: int = 7, progress_every: float = 10.0) -> dict:
+    pools = await asyncio.to_thread(discover_filters, url)
+    stats = LoadStats()
+    deadline = stats.started + ramp + duration
+
+    async def user(i: int):
+        await asyncio.sleep(ramp * i / max(users, 1))
+        limits = httpx.Limits(max_connections=BROWSER_CONNECTIONS, max_keepalive_connections=BROWSER_CONNECTIONS)
+        async with httpx.AsyncClient(base_url=url, timeout=timeout, limits=limits) as http:
+            await Session(i, http, stats, pools, think_seconds, seed).run(deadline)
+
+    async def progress():
+        while True:
+            await asyncio.sleep(progress_every)
+            snapshot = stats.report()
+            print(f"  {snapshot['elapsedSeconds']:>6.0f}s  {snapshot['requests']:>7,} requests  "
+                  f"{snapshot['requestsPerSecond']:>7.1f} req/s  errors {snapshot['errorRate'] * 100:.1f}%", flush=True)
+
+    reporter = asyncio.create_task(progress()) if progress_every else None
+    try:
+        await asyncio.gather(*(user(i) for i in range(users)))
+    finally:
+        if reporter:
+            reporter.cancel()
+    stats.finished = time.perf_counter()
+    return {"url": url, "users": users, "durationSeconds": duration, "rampSeconds": ramp,
+            "thinkSeconds": think_seconds, **stats.report()}
+
+
+def serve(scale: str, data_dir: str = DATA_DIR, port: int = 0):
+    """uvicorn on the synthetic `scale` data, upstreams on upstreamStub; (process, url, stub server)."""
+    from upstreamStub import start_stub_server
+
+    path, rows = ensure_dataset(scale, data_dir)
+    stub, _ = start_stub_server(0, delay_ms=50.0, jitter_ms=50.0)
+    if not port:
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+    env = {
+        **os.environ,
+        "CLICKHOUSE_CHDB_PATH": path,
+        "PREDICTION_API_URL": f"http://127.0.0.1:{stub.server_port}/predict",
+        "MARKET_SEARCH_API_URL": f"http://127.0.0.1:{stub.server_port}/search",
+        "LOG_LEVEL": os.getenv("LOG_LEVEL", "WARNING"),
+    }
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning", "--no-access-log"],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+    )
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(600):
+        if process.poll() is not None:
+            raise RuntimeError(f"uvicorn exited with {process.returncode}")
+        try:
+            if httpx.get(f"{url}/healthz", timeout=1).status_code == 200:
+                print(f"serving {scale} ({rows:,} rows) at {url}")
+                return process, url, stub
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("uvicorn did not start within 60s")
+
+
+def print_report(report: dict):
+    print(f"\n{report['users']} users, {report['elapsedSeconds']}s: {report['requests']:,} requests, "
+          f"{report['requestsPerSecond']} req/s, {report['pageLoads']:,} page loads, "
+          f"errors {report['errorRate'] * 100:.2f}%")
+    print(f"\n  {'page':<14}{'count':>8}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}  ms")
+    for page, s in report["pages"].items():
+        print(f"  {page:<14}{s['count']:>8}{s['p50Ms']:>10.1f}{s['p95Ms']:>10.1f}{s['p99Ms']:>10.1f}{s['maxMs']:>10.1f}")
+    print(f"\n  {'route':<40}{'count':>8}{'err%':>7}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}  ms")
+    for route, s in report["routes"].items():
+        print(f"  {route:<40}{s['count']:>8}{s['errorRate'] * 100:>7.1f}{s['p50Ms']:>10.1f}"
+              f"{s['p95Ms']:>10.1f}{s['p99Ms']:>10.1f}{s['maxMs']:>10.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay concurrent dashboard sessions against the API")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--serve", action="store_true", help="Start a local server on synthetic data (see --scale)")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="tiny")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=60.0, help="Seconds after the ramp-up")
+    parser.add_argument("--ramp", type=float, default=10.0, help="Seconds over which users start")
+    parser.add_argument("--think", type=float, default=5.0, help="Mean think time between actions (s)")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--out", metavar="PATH", help="Write the report as JSON")
+    args = parser.parse_args()
+
+    server = None
+    url = args.url
+    if args.serve:
+        server, url, _ = serve(args.scale, args.data_dir)
+    try:
+        result = asyncio.run(run_load(url, args.users, args.duration, args.ramp, args.think, args.timeout, args.seed))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+    print_report(result)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=1, ensure_ascii=False)
+        print(f"\nwrote {args.out}")
@@ -0,0 +1,95 @@
+"""
+Vectorized stock projection for store x SKU series.
+
+Each series is simulated independently with its own current stock, daily
+demand and daily replenishment:
+
+    stock[t] = max(0, stock[t-1] + replenishment - demand)
+
+With constant demand/replenishment per series this has the closed form
+stock[t] = max(0, stock[0] + t * net): a series with negative net flow drains
+to zero on day ceil(stock[0] / -net) and stays there. Aggregates per day are
+built with difference arrays, so the cost is O(series + horizon) instead of
+materializing a series x horizon matrix.
+"""
+
+import numpy as np
+
+MAX_HORIZON_DAYS = 180
+
+
+def project_stock(
+    current_stock,
+    daily_demand,
+    daily_replenishment=0.0,
+    horizon: int = 30,
+) -> dict:
+    """
+    Project every series `horizon` days ahead and aggregate per day.
+
+    Args:
+        current_stock: stock per series (array-like, negatives and NaN/None clipped to 0)
+        daily_demand: expected daily demand per series (e.g. roll_mean_7; NaN/None as 0)
+        daily_replenishment: scalar or per-series daily inbound quantity
+        horizon: number of future days (1..MAX_HORIZON_DAYS)
+
+    Returns:
+        {
+            "stock": total projected stock per day,
+            "demand": total daily demand per day,
+            "stockoutCount": series with zero projected stock per day,
+            "stockoutDay": per-series first day (1-based) at zero stock,
+                           0 when the series never stocks out in the horizon,
+        }
+    """
+    horizon = max(1, min(int(horizon), MAX_HORIZON_DAYS))
+
+    stock0 = np.clip(np.nan_to_num(np.asarray(current_stock, dtype=np.float64)), 0, None)
+    demand = np.clip(np.nan_to_num(np.asarray(daily_demand, dtype=np.float64)), 0, None)
+    replenishment = np.clip(
+        np.broadcast_to(np.nan_to_num(np.asarray(daily_replenishment, dtype=np.float64)), stock0.shape),
+        0,
+        None,
+    )
+    net = replenishment - demand
+    days = np.arange(1, horizon + 1, dtype=np.float64)
+
+    # First day with stock <= 0; horizon + 1 means "not within the horizon".
+    out_day = np.full(stock0.shape, horizon + 1, dtype=np.int64)
+    draining = net < 0
+    out_day[draining] = np.maximum(
+        1, np.ceil(stock0[draining] / -net[draining] - 1e-9)
+    ).clip(max=horizon + 1).astype(np.int64)
+    out_day[(net == 0) & (stock0 <= 0)] = 1
+
+    # Series still in stock on day t contribute stock0 + t * net.
+    # Remove each series' (stock0, net) from the running totals on its out day.
+    removed_stock = np.bincount(out_day, weights=stock0, minlength=horizon + 2)[1:horizon + 1]
+    removed_net = np.bincount(out_day, weights=net, minlength=horizon + 2)[1:horizon + 1]
+    removed_count = np.bincount(out_day, minlength=horizon + 2)[1:horizon + 1]
+
+    active_stock = stock0.sum() - np.cumsum(removed_stock)
+    active_net = net.sum() - np.cumsum(removed_net)
+    total_stock = np.clip(active_stock + days * active_net, 0, None)
+
+    return {
+        "stock": total_stock,
+        "demand": np.full(horizon, demand.sum()),
+        "stockoutCount": np.cumsum(removed_count),
+        "stockoutDay": np.where(out_day <= horizon, out_day, 0),
+    }
+
+
+def allocate_replenishment(total_daily: float, daily_demand) -> np.ndarray:
+    """
+    Split a flat daily replenishment budget across series by demand share.
+    Series without demand get nothing; with no demand at all the budget is
+    spread evenly.
+    """
+    demand = np.clip(np.nan_to_num(np.asarray(daily_demand, dtype=np.float64)), 0, None)
+    if total_daily <= 0 or demand.size == 0:
+        return np.zeros(demand.shape)
+    demand_total = demand.sum()
+    if demand_total <= 0:
+        return np.full(demand.shape, float(total_daily) / demand.size)
+    return float(total_daily) * demand / demand_total
@@ -0,0 +1,576 @@
+"""
+Synthetic master_egitim / demoVerileri data at configurable scale.
+
+Columns follow the CREATE TABLE kept in sunucuDB.ipynb, plus urunismi and
+bulundugusehir, which the API reads from demoVerileri. Rows come out in the
+table's ORDER BY (magazakodu, urunkodu, tarih). Expected daily demand of a
+store x product is
+
+    base[product] * size[store] * weekday[reyon, dow] * season[product, doy]
+        * holiday[day] * trend[day] * exp(beta[product] * discount + gamma[type])
+
+and the daily counts are drawn gamma-Poisson (overdispersed). Stock is
+simulated day by day: order-up-to replenishment with a lead time and
+occasional missed deliveries. Stockouts therefore censor sales, mostly
+during promotions. Promotions are chain-wide campaigns per product, typed by
+the promo flag columns (aktifPromosyonKodu = column position, 17 = none).
+lag_* and roll_* are computed from the previous days' sales and are NULL
+while the history is too short.
+
+Generation works on chunks of whole (store, product) series with numpy
+arrays shaped (series, days). The only Python loop is over days in the stock
+simulation, vectorized across the chunk. Output is Parquet (pyarrow), a
+ClickHouse table (insert_arrow), or an embedded chdb database.
+
+    python syntheticData.py --stores 50 --products 2000 --years 3 --parquet data/master_egitim.parquet
+    python syntheticData.py --stores 50 --products 2000 --years 3 --clickhouse demoVerileri   # CLICKHOUSE_* env
+    python syntheticData.py --stores 10 --products 500 --years 2 --chdb data/chdb
+"""
+
+import argparse
+import os
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+# (name, ClickHouse type) in CREATE TABLE order.
+PROMO_COLUMNS = [
+    "50 TL OPERASYON", "500 TL OPERASYON", "Açılış Katalogları", "Alkollü Ürünler", "Decot",
+    "GAZETE ILANI", "HYBR", "Hybris % Kampanya", "Kapanış Mağazaları", "KATALOG", "LEAFLET",
+    "Mağ.İçi Akt-FMCG", "Mağ.İçi Akt-GıdaDışı", "Mağ.İçi Akt-TazeGıda", "VKA0", "ZKAE", "Tayin edilmedi",
+]
+NO_PROMO_CODE = 17
+LAGS = (1, 2, 3, 4, 7, 10, 14, 21, 28)
+WINDOWS = (7, 14, 21)
+
+COLUMNS = [
+    ("tarih", "Date"), ("hafta_gunu", "UInt8"), ("ay", "UInt8"), ("yil", "UInt16"), ("yil_gunu", "UInt16"),
+    ("season_code", "UInt8"), ("month_position_code", "UInt8"), ("promotion_day", "UInt16"),
+    ("satismiktari", "UInt32"), ("satistutarikdvsiz", "Float32"), ("stok", "UInt32"),
+    ("degerlenmisstok", "Float32"), ("satisFiyati", "Float32"), ("indirimYuzdesi", "Float32"),
+    ("enflasyon", "Float32"), ("stok_out", "UInt8"), ("stok_out_gun_sayisi", "UInt16"),
+    ("magazakodu", "UInt16"), ("urunkodu", "UInt32"), ("ailekodu", "UInt16"), ("altailekodu", "UInt32"),
+    ("malgrubukodu", "UInt32"), ("reyonkodu", "UInt8"), ("sektorkodu", "UInt8"),
+    ("bulundugusehirkodu", "UInt8"), ("magaza_metrekare", "UInt32"),
+    *[(name, "UInt8") for name in PROMO_COLUMNS],
+    ("promosyonVar", "UInt8"), ("ozelgun", "UInt8"),
+    ("formatstore", "LowCardinality(String)"), ("ilce", "LowCardinality(String)"),
+    ("avmcadde", "LowCardinality(String)"), ("cluster", "LowCardinality(String)"),
+    ("cografi_bolge", "LowCardinality(String)"), ("sezon", "LowCardinality(String)"),
+    ("aktifPromosyonAdi", "LowCardinality(String)"), ("aktifPromosyonKodu", "UInt8"),
+    ("iconkod", "UInt8"), ("temp", "Float32"),
+    *[(f"lag_{k}", "Nullable(UInt32)") for k in LAGS],
+    *[(f"roll_{stat}_{w}", "Nullable(Float32)") for stat in ("mean", "std", "median", "min", "max") for w in WINDOWS],
+    # Read by the API from demoVerileri; not in the sunucuDB.ipynb DDL.
+    ("urunismi", "LowCardinality(String)"), ("bulundugusehir", "LowCardinality(String)"),
+]
+
+REGIONS = {
+    "MARMARA": [("İstanbul", 34), ("Bursa", 16), ("Kocaeli", 41), ("Tekirdağ", 59)],
+    "EGE": [("İzmir", 35), ("Manisa", 45), ("Aydın", 9), ("Denizli", 20)],
+    "AKDENIZ": [("Antalya", 7), ("Adana", 1), ("Mersin", 33)],
+    "IC ANADOLU": [("Ankara", 6), ("Konya", 42), ("Kayseri", 38), ("Eskişehir", 26)],
+    "KARADENIZ": [("Samsun", 55), ("Trabzon", 61)],
+    "DOGU ANADOLU": [("Erzurum", 25), ("Malatya", 44)],
+    "GUNEYDOGU ANADOLU": [("Gaziantep", 27), ("Diyarbakır", 21)],
+}
+# Share of stores per region.
+REGION_WEIGHTS = [0.34, 0.18, 0.14, 0.16, 0.07, 0.05, 0.06]
+DISTRICTS = ["Merkez", "Çarşı", "Sahil", "Yenimahalle", "Cumhuriyet", "Atatürk", "Bahçelievler", "Kültür", "Fatih", "Esentepe"]
+FORMATS = [("M", 900), ("MM", 1800), ("MMM", 4500), ("5M", 9000)]
+CLUSTERS = ["A", "B", "C", "D", "E"]
+
+# Food reyons (category_map codes that fit the UInt8 column): weekday profile
+# Mon..Sun and the day of year of the seasonal peak.
+REYONS = {
+    100: ("LIKITLER", (0.9, 0.9, 0.95, 1.0, 1.15, 1.35, 1.1), 200),
+    101: ("TEMIZLIK", (0.95, 0.95, 1.0, 1.0, 1.1, 1.25, 0.9), 90),
+    102: ("PARFÜMERI VE HIJYEN", (0.95, 0.95, 1.0, 1.0, 1.1, 1.25, 0.9), 150),
+    104: ("KURU GIDALAR", (0.9, 0.9, 0.95, 1.0, 1.1, 1.35, 1.1), 20),
+    105: ("SELF SERVIS", (0.9, 0.9, 0.95, 1.0, 1.15, 1.3, 1.1), 350),
+    109: ("PARAPHARMACIE", (1.0, 1.0, 1.0, 1.0, 1.05, 1.1, 0.85), 30),
+    200: ("SARKÜTERI", (0.85, 0.9, 0.95, 1.0, 1.2, 1.4, 1.2), 120),
+    201: ("BALIK", (0.8, 0.85, 0.9, 1.0, 1.4, 1.4, 1.0), 15),
+    202: ("MEYVE VE SEBZE", (0.95, 0.95, 1.0, 1.0, 1.1, 1.3, 1.0), 190),
+    203: ("PASTA-EKMEK", (1.0, 1.0, 1.0, 1.0, 1.05, 1.2, 1.25), 355),
+    204: ("KASAP", (0.85, 0.85, 0.9, 1.0, 1.2, 1.45, 1.2), 160),
+    206: ("LEZZET ARASI", (1.05, 1.05, 1.05, 1.05, 1.1, 1.05, 0.85), 180),
+    207: ("L.A MUTFAK", (1.05, 1.05, 1.05, 1.05, 1.1, 1.0, 0.8), 180),
+}
+# Base discount (percent) and log uplift of each promo type (aktifPromosyonKodu 1..16).
+PROMO_TYPES = {
+    1: (10, 0.10), 2: (15, 0.12), 3: (20, 0.18), 4: (10, 0.05), 5: (25, 0.15), 6: (15, 0.25),
+    7: (12, 0.12), 8: (18, 0.14), 9: (35, 0.20), 10: (8, 0.22), 11: (12, 0.18), 12: (10, 0.10),
+    13: (10, 0.08), 14: (12, 0.12), 15: (10, 0.06), 16: (6, 0.05),
+}
+PROMO_TYPE_WEIGHTS = [0.02, 0.02, 0.02, 0.02, 0.04, 0.14, 0.08, 0.06, 0.01, 0.18, 0.14, 0.12, 0.04, 0.05, 0.02, 0.04]
+# Fixed public holidays (month, day); moving feasts are drawn per year.
+HOLIDAYS = [(1, 1), (4, 23), (5, 1), (5, 19), (7, 15), (8, 30), (10, 29)]
+SEASONS = {12: (1, "Kış"), 1: (1, "Kış"), 2: (1, "Kış"), 3: (2, "İlkbahar"), 4: (2, "İlkbahar"), 5: (2, "İlkbahar"),
+           6: (3, "Yaz"), 7: (3, "Yaz"), 8: (3, "Yaz"), 9: (4, "Sonbahar"), 10: (4, "Sonbahar"), 11: (4, "Sonbahar")}
+KDV_RATE = 0.10
+LEAD_TIME_DAYS = 2
+DEMAND_DISPERSION = 3.0  # gamma shape; lower = burstier
+MISSED_DELIVERY_RATE = 0.03
+CHUNK_ROWS = 1_000_000
+
+
+class Labels:
+    """Dictionary-encoded string column: int32 codes into `labels`."""
+
+    __slots__ = ("codes", "labels")
+
+    def __init__(self, codes: np.ndarray, labels):
+        self.codes = codes
+        self.labels = labels
+
+    def __len__(self):
+        return len(self.codes)
+
+
+def create_table_sql(table_name: str) -> str:
+    columns = ",\n".join(f"    `{name}` {ch_type}" for name, ch_type in COLUMNS)
+    return (
+        f"CREATE TABLE IF NOT EXISTS {table_name}\n(\n{columns}\n)\n"
+        "ENGINE = MergeTree\nPARTITION BY toYYYYMM(tarih)\nORDER BY (magazakodu, urunkodu, tarih)"
+    )
+
+
+class SyntheticDataset:
+    """Dimensions, calendar and promotion plan; `chunks()` yields the fact rows."""
+
+    def __init__(self, stores: int = 20, products: int = 1000, years: float = 2.0,
+                 start: date = date(2023, 1, 1), seed: int = 7):
+        self.rng = np.random.default_rng(seed)
+        self.seed = seed
+        self.n_stores = int(stores)
+        self.n_products = int(products)
+        self.start = start
+        self.n_days = int(round(365.25 * years))
+        self._stores()
+        self._products()
+        self._calendar()
+        self._promotions()
+
+    @property
+    def rows(self) -> int:
+        return self.n_stores * self.n_products * self.n_days
+
+    def _stores(self):
+        rng, n = self.rng, self.n_stores
+        regions = list(REGIONS)
+        region_idx = rng.choice(len(regions), size=n, p=REGION_WEIGHTS)
+        self.store_code = (1001 + np.arange(n)).astype(np.uint16)
+        self.store_region = np.array(regions)[region_idx]
+        cities, plates, districts, seen = [], [], [], {}
+        for r in region_idx:
+            city, plate = REGIONS[regions[r]][int(rng.integers(len(REGIONS[regions[r]])))]
+            k = seen.get(city, 0)
+            seen[city] = k + 1
+            # Store keys in the API are city_district, so districts are unique per city.
+            district = DISTRICTS[k % len(DISTRICTS)] + ("" if k < len(DISTRICTS) else f" {k // len(DISTRICTS) + 1}")
+            cities.append(city)
+            plates.append(plate)
+            districts.append(district)
+        self.store_city = np.array(cities)
+        self.store_plate = np.array(plates, dtype=np.uint8)
+        self.store_district = np.array(districts)
+        fmt = rng.choice(len(FORMATS), size=n, p=[0.35, 0.35, 0.22, 0.08])
+        self.store_format = np.array([FORMATS[i][0] for i in fmt])
+        self.store_sqm = (np.array([FORMATS[i][1] for i in fmt]) * rng.uniform(0.7, 1.3, n)).astype(np.uint32)
+        self.store_mall = np.where(rng.random(n) < 0.4, "AVM", "CADDE")
+        self.store_cluster = np.array(CLUSTERS)[rng.integers(len(CLUSTERS), size=n)]
+        self.store_size = (self.store_sqm / 1800.0) ** 0.6 * rng.lognormal(0.0, 0.2, n)
+        # Regional temperature offset (°C) for the weather columns.
+        self.store_temp_offset = {"MARMARA": 0, "EGE": 3, "AKDENIZ": 5, "IC ANADOLU": -3, "KARADENIZ": -1,
+                                  "DOGU ANADOLU": -8, "GUNEYDOGU ANADOLU": 4}
+
+    def _products(self):
+        rng, n = self.rng, self.n_products
+        reyon_codes = np.array(list(REYONS), dtype=np.uint8)
+        reyon_idx = rng.integers(len(reyon_codes), size=n)
+        self.product_reyon_idx = reyon_idx
+        self.product_code = (100000 + rng.choice(900000, size=n, replace=False)).astype(np.uint32)
+        self.product_code.sort()
+        self.product_reyon = reyon_codes[reyon_idx]
+        self.product_sector = (self.product_reyon // 100).astype(np.uint8)
+        family = rng.integers(1, 40, size=n)
+        self.product_family = (self.product_reyon.astype(np.uint16) * 100 + family).astype(np.uint16)
+        self.product_subfamily = (self.product_family.astype(np.uint32) * 100 + rng.integers(1, 20, size=n)).astype(np.uint32)
+        self.product_group = (self.product_subfamily * 10 + rng.integers(0, 10, size=n)).astype(np.uint32)
+        self.product_name = np.array([
+            f"{REYONS[int(c)][0].title()} Ürün {int(code)}" for c, code in zip(self.product_reyon, self.product_code)
+        ])
+        self.product_price = rng.lognormal(3.3, 0.8, n).astype(np.float32)
+        self.product_base = rng.lognormal(0.3, 1.0, n)  # units/day in a reference store
+        self.product_season_amp = rng.uniform(0.05, 0.45, n)
+        peaks = np.array([REYONS[int(c)][2] for c in self.product_reyon], dtype=np.float64)
+        self.product_season_peak = peaks + rng.normal(0, 20, n)
+        self.product_beta = rng.lognormal(np.log(0.025), 0.4, n)  # log uplift per discount point
+        self.weekday = np.array([REYONS[int(c)][1] for c in reyon_codes], dtype=np.float64)
+
+    def _calendar(self):
+        rng, n = self.rng, self.n_days
+        days = np.array([self.start + timedelta(days=i) for i in range(n)])
+        self.epoch_day = (np.datetime64(self.start) - np.datetime64("1970-01-01")).astype(int) + np.arange(n)
+        self.weekday_idx = np.array([d.weekday() for d in days])
+        self.month = np.array([d.month for d in days], dtype=np.uint8)
+        self.year = np.array([d.year for d in days], dtype=np.uint16)
+        self.doy = np.array([d.timetuple().tm_yday for d in days], dtype=np.uint16)
+        dom = np.array([d.day for d in days])
+        self.month_position = np.where(dom <= 10, 1, np.where(dom <= 20, 2, 3)).astype(np.uint8)
+        self.season_code = np.array([SEASONS[int(m)][0] for m in self.month], dtype=np.uint8)
+        self.season_name = np.array([SEASONS[int(m)][1] for m in self.month])
+
+        holiday = np.zeros(n, dtype=bool)
+        for i, d in enumerate(days):
+            holiday[i] = (d.month, d.day) in HOLIDAYS
+        for year in sorted(set(int(y) for y in self.year)):
+            # Two multi-day feasts per year, moving about 11 days earlier each year.
+            for base, length in ((100, 3), (170, 4)):
+                first = date(year, 1, 1) + timedelta(days=int(base - 11 * (year - 2023)) % 365)
+                for k in range(length):
+                    i = (first + timedelta(days=k) - self.start).days
+                    if 0 <= i < n:
+                        holiday[i] = True
+        self.holiday = holiday
+        # Shopping spike before holidays, dip on the day itself.
+        before = np.zeros(n, dtype=bool)
+        before[:-1] = holiday[1:] & ~holiday[:-1]
+        self.holiday_factor = np.where(before, 1.35, np.where(holiday, 0.8, 1.0))
+
+        # Monthly inflation (%) drifting around 3, and the cumulative price index.
+        month_index = (self.year.astype(int) - self.year[0]) * 12 + self.month - self.month[0]
+        monthly = np.clip(3.0 + np.cumsum(rng.normal(0, 0.25, month_index.max() + 1)), 0.5, 8.0)
+        self.inflation = monthly[month_index].astype(np.float32)
+        self.price_index = np.cumprod(1 + monthly / 100)[month_index] / (1 + monthly[0] / 100)
+        self.trend = 1.0 + 0.04 * np.arange(n) / 365.25
+
+        self.temp = (14 - 11 * np.cos(2 * np.pi * (self.doy - 20) / 365.25) + rng.normal(0, 2.5, n)).astype(np.float32)
+        rain = rng.random(n) < 0.25 + 0.15 * np.cos(2 * np.pi * (self.doy - 20) / 365.25)
+        self.icon = np.where(rain, np.where(self.temp < 2, 4, 3), np.where(self.temp > 25, 1, 2)).astype(np.uint8)
+
+    def _promotions(self):
+        """Chain-wide campaigns per product: (products, days) promo code, discount and promo day."""
+        rng, P, D = self.rng, self.n_products, self.n_days
+        max_events = D // 10 + 2
+        gaps = rng.geometric(1 / 40, size=(P, max_events))
+        lengths = rng.integers(3, 15, size=(P, max_events))
+        starts = np.cumsum(gaps + lengths, axis=1) - lengths
+        valid = starts < D
+        lengths = np.minimum(lengths, D - starts)
+        product_idx = np.broadcast_to(np.arange(P)[:, None], starts.shape)[valid]
+        starts, lengths = starts[valid], lengths[valid]
+
+        codes = rng.choice(np.arange(1, 17), size=len(starts), p=PROMO_TYPE_WEIGHTS).astype(np.uint8)
+        base_discount = np.array([PROMO_TYPES[c][0] for c in range(1, 17)], dtype=np.float32)
+        discounts = np.clip(np.round(base_discount[codes - 1] * rng.uniform(0.6, 1.6, len(codes))), 0, 70)
+
+        total = int(lengths.sum())
+        event = np.repeat(np.arange(len(starts)), lengths)
+        offset = np.arange(total) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        flat = product_idx[event] * D + starts[event] + offset
+
+        self.promo_code = np.full(P * D, NO_PROMO_CODE, dtype=np.uint8)
+        self.promo_code[flat] = codes[event]
+        self.promo_discount = np.zeros(P * D, dtype=np.float32)
+        self.promo_discount[flat] = discounts[event]
+        self.promo_day = np.zeros(P * D, dtype=np.uint16)
+        self.promo_day[flat] = offset + 1
+        self.promo_code = self.promo_code.reshape(P, D)
+        self.promo_discount = self.promo_discount.reshape(P, D)
+        self.promo_day = self.promo_day.reshape(P, D)
+
+        gamma = np.zeros(NO_PROMO_CODE + 1)
+        for code, (_, lift) in PROMO_TYPES.items():
+            gamma[code] = lift
+        self.promo_uplift = np.exp(
+            self.product_beta[:, None] * self.promo_discount + gamma[self.promo_code]
+        ).astype(np.float32)
+
+    def chunks(self, chunk_rows: int = CHUNK_ROWS):
+        """Yield dicts of column -> (values, null mask or None), whole series per chunk."""
+        series_per_chunk = max(1, chunk_rows // self.n_days)
+        total = self.n_stores * self.n_products
+        for first in range(0, total, series_per_chunk):
+            yield self._chunk(np.arange(first, min(first + series_per_chunk, total)))
+
+    def _chunk(self, series: np.ndarray) -> dict:
+        rng = np.random.default_rng((self.seed, int(series[0])))
+        D = self.n_days
+        s, p = series // self.n_products, series % self.n_products
+        n = len(series)
+
+        # Expected demand (series, days).
+        season = 1 + self.product_season_amp[p][:, None] * np.cos(
+            2 * np.pi * (self.doy[None, :] - self.product_season_peak[p][:, None]) / 365.25
+        )
+        lam = (
+            (self.product_base[p] * self.store_size[s])[:, None]
+            * self.weekday[self.product_reyon_idx[p]][:, self.weekday_idx]
+            * season
+            * (self.holiday_factor * self.trend)[None, :]
+            * self.promo_uplift[p]
+        )
+        demand = rng.poisson(lam * rng.gamma(DEMAND_DISPERSION, 1 / DEMAND_DISPERSION, lam.shape))
+
+        # Stock: order up to (lead time + review) cover of the average demand.
+        mean_daily = lam.mean(axis=1)
+        target = np.ceil(mean_daily * (LEAD_TIME_DAYS + 5) * rng.uniform(1.0, 1.6, n) + 2).astype(np.int64)
+        reorder_point = np.ceil(mean_daily * (LEAD_TIME_DAYS + 1)).astype(np.int64) + 1
+        stock_level = target.copy()
+        pipeline = np.zeros((LEAD_TIME_DAYS + 1, n), dtype=np.int64)
+        sales = np.empty((n, D), dtype=np.int64)
+        stock = np.empty((n, D), dtype=np.int64)
+        out_run = np.empty((n, D), dtype=np.uint16)
+        run = np.zeros(n, dtype=np.uint16)
+        missed = rng.random((D, n)) < MISSED_DELIVERY_RATE
+        for d in range(D):
+            slot = d % (LEAD_TIME_DAYS + 1)
+            stock_level += pipeline[slot]
+            pipeline[slot] = 0
+            sold = np.minimum(demand[:, d], stock_level)
+            stock_level -= sold
+            sales[:, d] = sold
+            stock[:, d] = stock_level
+            out = stock_level == 0
+            run = np.where(out, run + 1, 0).astype(np.uint16)
+            out_run[:, d] = run
+            on_order = pipeline.sum(axis=0)
+            order = np.where((stock_level + on_order <= reorder_point) & ~missed[d], target - stock_level - on_order, 0)
+            pipeline[(d + LEAD_TIME_DAYS) % (LEAD_TIME_DAYS + 1)] += np.maximum(order, 0)
+
+        price = (self.product_price[p][:, None] * self.price_index[None, :]).astype(np.float32)
+        discount = self.promo_discount[p]
+        code = self.promo_code[p]
+
+        cols: dict = {}
+
+        def day_col(values):
+            return np.broadcast_to(values[None, :], (n, D)).ravel()
+
+        def series_col(values):
+            return np.repeat(values, D)
+
+        def series_labels(entity_values, index):
+            labels, codes = np.unique(entity_values, return_inverse=True)
+            return Labels(np.repeat(codes.astype(np.int32)[index], D), labels.tolist())
+
+        cols["tarih"] = day_col(self.epoch_day.astype(np.int32))
+        cols["hafta_gunu"] = day_col((self.weekday_idx + 1).astype(np.uint8))
+        cols["ay"] = day_col(self.month)
+        cols["yil"] = day_col(self.year)
+        cols["yil_gunu"] = day_col(self.doy)
+        cols["season_code"] = day_col(self.season_code)
+        cols["month_position_code"] = day_col(self.month_position)
+        cols["promotion_day"] = self.promo_day[p].ravel()
+        cols["satismiktari"] = sales.astype(np.uint32).ravel()
+        cols["satistutarikdvsiz"] = (sales * price * (1 - discount / 100) / (1 + KDV_RATE)).astype(np.float32).ravel()
+        cols["stok"] = stock.astype(np.uint32).ravel()
+        cols["degerlenmisstok"] = (stock * price * 0.7).astype(np.float32).ravel()
+        cols["satisFiyati"] = price.ravel()
+        cols["indirimYuzdesi"] = discount.ravel()
+        cols["enflasyon"] = day_col(self.inflation)
+        cols["stok_out"] = (stock == 0).astype(np.uint8).ravel()
+        cols["stok_out_gun_sayisi"] = out_run.ravel()
+        cols["magazakodu"] = series_col(self.store_code[s])
+        cols["urunkodu"] = series_col(self.product_code[p])
+        cols["ailekodu"] = series_col(self.product_family[p])
+        cols["altailekodu"] = series_col(self.product_subfamily[p])
+        cols["malgrubukodu"] = series_col(self.product_group[p])
+        cols["reyonkodu"] = series_col(self.product_reyon[p])
+        cols["sektorkodu"] = series_col(self.product_sector[p])
+        cols["bulundugusehirkodu"] = series_col(self.store_plate[s])
+        cols["magaza_metrekare"] = series_col(self.store_sqm[s])
+        flat_code = code.ravel()
+        for i, name in enumerate(PROMO_COLUMNS, start=1):
+            cols[name] = (flat_code == i).astype(np.uint8)
+        cols["promosyonVar"] = (flat_code != NO_PROMO_CODE).astype(np.uint8)
+        cols["ozelgun"] = day_col(self.holiday.astype(np.uint8))
+        cols["formatstore"] = series_labels(self.store_format, s)
+        cols["ilce"] = series_labels(self.store_district, s)
+        cols["avmcadde"] = series_labels(self.store_mall, s)
+        cols["cluster"] = series_labels(self.store_cluster, s)
+        cols["cografi_bolge"] = series_labels(self.store_region, s)
+        season_labels, season_codes = np.unique(self.season_name, return_inverse=True)
+        cols["sezon"] = Labels(day_col(season_codes.astype(np.int32)), season_labels.tolist())
+        cols["aktifPromosyonAdi"] = Labels((flat_code - 1).astype(np.int32), PROMO_COLUMNS)
+        cols["aktifPromosyonKodu"] = flat_code
+        cols["iconkod"] = day_col(self.icon)
+        offsets = np.array([self.store_temp_offset[r] for r in self.store_region[s]], dtype=np.float32)
+        cols["temp"] = (self.temp[None, :] + offsets[:, None]).ravel()
+
+        cols = {name: (values, None) for name, values in cols.items()}
+        cols.update(_lag_features(sales))
+        cols["urunismi"] = (series_labels(self.product_name, p), None)
+        cols["bulundugusehir"] = (series_labels(self.store_city, s), None)
+        return cols
+
+
+def _lag_features(sales: np.ndarray) -> dict:
+    """lag_* and roll_* over the previous days, with masks for the missing history."""
+    n, D = sales.shape
+    day = np.arange(D)
+    out = {}
+    for k in LAGS:
+        lag = np.zeros((n, D), dtype=np.uint32)
+        lag[:, k:] = sales[:, :D - k]
+        out[f"lag_{k}"] = (lag.ravel(), np.tile(day < k, n))
+
+    values = sales.astype(np.float64)
+    csum = np.zeros((n, D + 1))
+    csum[:, 1:] = np.cumsum(values, axis=1)
+    csq = np.zeros((n, D + 1))
+    csq[:, 1:] = np.cumsum(values * values, axis=1)
+    as_int = sales.astype(np.int32)
+    for w in WINDOWS:
+        mask = np.tile(day < w, n)
+        stats = {name: np.zeros((n, D), dtype=np.float32) for name in ("mean", "std", "median", "min", "max")}
+        if w < D:
+            total = csum[:, w:D] - csum[:, :D - w]
+            total_sq = csq[:, w:D] - csq[:, :D - w]
+            stats["mean"][:, w:] = total / w
+            stats["std"][:, w:] = np.sqrt(np.maximum(total_sq - total * total / w, 0) / (w - 1))
+            # view[:, i] is days i .. i+w-1, the window before day i+w. One integer
+            # sort gives min, max and median (several times faster than np.median).
+            view = np.lib.stride_tricks.sliding_window_view(as_int, w, axis=1)[:, :D - w]
+            ordered = np.sort(view, axis=-1)
+            stats["min"][:, w:] = ordered[..., 0]
+            stats["max"][:, w:] = ordered[..., -1]
+            if w % 2:
+                stats["median"][:, w:] = ordered[..., w // 2]
+            else:
+                stats["median"][:, w:] = (ordered[..., w // 2 - 1] + ordered[..., w // 2]) / 2
+            del ordered
+        for name, values_2d in stats.items():
+            out[f"roll_{name}_{w}"] = (values_2d.ravel(), mask)
+    return out
+
+
+def _arrow_type(ch_type: str):
+    import pyarrow as pa
+
+    inner = ch_type.removeprefix("Nullable(").removesuffix(")")
+    if inner.startswith("LowCardinality"):
+        return pa.dictionary(pa.int32(), pa.string())
+    return {
+        "Date": pa.date32(), "UInt8": pa.uint8(), "UInt16": pa.uint16(), "UInt32": pa.uint32(),
+        "Float32": pa.float32(),
+    }[inner]
+
+
+def to_arrow(chunk: dict):
+    """pyarrow Table of a chunk (dictionary-encoded strings, masked nullables)."""
+    try:
+        import pyarrow as pa
+    except ImportError as e:
+        raise RuntimeError("Parquet and ClickHouse output need pyarrow (pip install pyarrow)") from e
+
+    arrays, fields = [], []
+    for name, ch_type in COLUMNS:
+        values, mask = chunk[name]
+        arrow_type = _arrow_type(ch_type)
+        if isinstance(values, Labels):
+            array = pa.DictionaryArray.from_arrays(pa.array(values.codes), pa.array(values.labels, pa.string()))
+        elif arrow_type == pa.date32():
+            array = pa.array(values, type=pa.int32()).cast(pa.date32())
+        else:
+            array = pa.array(values, type=arrow_type, mask=mask)
+        arrays.append(array)
+        fields.append(pa.field(name, arrow_type, nullable=ch_type.startswith("Nullable")))
+    return pa.Table.from_arrays(arrays, schema=pa.schema(fields))
+
+
+def write_parquet(dataset: SyntheticDataset, path: str, chunk_rows: int = CHUNK_ROWS, progress=None) -> int:
+    """One Parquet file, one row group per chunk (zstd)."""
+    import pyarrow.parquet as pq
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    writer, rows = None, 0
+    try:
+        for chunk in dataset.chunks(chunk_rows):
+            table = to_arrow(chunk)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema, compression="zstd")
+            writer.write_table(table)
+            rows += table.num_rows
+            if progress:
+                progress(rows)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def load_clickhouse(dataset: SyntheticDataset, client, table_name: str, chunk_rows: int = CHUNK_ROWS,
+                    progress=None) -> int:
+    """Create the table if needed and bulk insert every chunk as Arrow."""
+    client.command(create_table_sql(table_name))
+    rows = 0
+    for chunk in dataset.chunks(chunk_rows):
+        table = to_arrow(chunk)
+        client.insert_arrow(table_name, table)
+        rows += table.num_rows
+        if progress:
+            progress(rows)
+    return rows
+
+
+def load_chdb(dataset: SyntheticDataset, path: str, table_name: str, chunk_rows: int = CHUNK_ROWS,
+              progress=None) -> int:
+    """load_clickhouse into an embedded chdb database at `path` (see chdbClient)."""
+    from chdbClient import ChdbClient
+
+    return load_clickhouse(dataset, ChdbClient(path), table_name, chunk_rows, progress)
+
+
+def _client_from_env():
+    import clickhouse_connect
+
+    return clickhouse_connect.get_client(
+        host=os.getenv("CLICKHOUSE_HOST", "localhost"),
+        port=int(os.getenv("CLICKHOUSE_PORT", "8123")),
+        username=os.getenv("CLICKHOUSE_USER", "default"),
+        password=os.getenv("CLICKHOUSE_PASSWORD", ""),
+        secure=os.getenv("CLICKHOUSE_SECURE", "false").strip().lower() in {"1", "true", "yes", "on"},
+        send_receive_timeout=600,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic master_egitim rows")
+    parser.add_argument("--stores", type=int, default=20)
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--years", type=float, default=2.0)
+    parser.add_argument("--start", type=date.fromisoformat, default=date(2023, 1, 1))
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--parquet", help="Write one Parquet file to this path")
+    parser.add_argument("--clickhouse", metavar="TABLE", help="Bulk-load into this table (CLICKHOUSE_* env)")
+    parser.add_argument("--chdb", metavar="PATH", help="Bulk-load into an embedded chdb database at PATH")
+    parser.add_argument("--table", default="demoVerileri", help="Table name for --chdb")
+    parser.add_argument("--ddl", action="store_true", help="Print the CREATE TABLE and exit")
+    args = parser.parse_args()
+
+    if args.ddl:
+        print(create_table_sql(args.clickhouse or args.table))
+        raise SystemExit(0)
+
+    started = time.perf_counter()
+    dataset = SyntheticDataset(args.stores, args.products, args.years, args.start, args.seed)
+    print(f"{dataset.rows:,} rows ({args.stores} stores x {args.products} products x {dataset.n_days} days)")
+
+    def progress(rows):
+        elapsed = time.perf_counter() - started
+        print(f"  {rows:,} rows  {elapsed:.1f}s  {rows / max(elapsed, 1e-9):,.0f} rows/s", flush=True)
+
+    if args.parquet:
+        write_parquet(dataset, args.parquet, args.chunk_rows, progress)
+    if args.clickhouse:
+        load_clickhouse(dataset, _client_from_env(), args.clickhouse, args.chunk_rows, progress)
+    if args.chdb:
+        load_chdb(dataset, args.chdb, args.table, args.chunk_rows, progress)
+    if not (args.parquet or args.clickhouse or args.chdb):
+        rows = sum(len(chunk["tarih"][0]) for chunk in dataset.chunks(args.chunk_rows))  # generation only
+        progress(rows)
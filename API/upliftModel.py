@@ -0,0 +1,252 @@
+"""
+In-process promotion uplift estimator (fast path next to the remote predictor).
+
+Daily lift is measured as y = log((satismiktari + 1) / (roll_mean_14 + 1)) and
+modelled as
+
+    y = alpha[group] + beta[group] * discount + gamma[promo_code]
+
+where discount is indirimYuzdesi in percentage points and gamma is the average
+effect of a promotion type. History is pre-aggregated in ClickHouse to
+(product, category, promo code, rounded discount) buckets with counts, and all
+per-group least-squares fits are solved at once from bincount sums (weighted
+simple regression), so a refit over years of history is a handful of array
+passes.
+
+Products with little history or no discount variation are shrunk toward their
+category, categories toward the global fit. The model is rebuilt once per
+data version; estimates are a few dictionary and array lookups.
+"""
+
+import math
+import os
+import threading
+from datetime import timedelta
+
+import numpy as np
+
+from apiCache import get_data_version, get_latest_date
+
+UPLIFT_HISTORY_DAYS = int(os.getenv("UPLIFT_HISTORY_DAYS", "730"))
+# Pseudo-observations of the parent fit mixed into every group fit.
+UPLIFT_SHRINKAGE = float(os.getenv("UPLIFT_SHRINKAGE", "200"))
+UPLIFT_BACKFIT_ROUNDS = 10
+# Non-promotion rows carry this aktifPromosyonKodu.
+NO_PROMO_CODE = "17"
+
+
+def _weighted_fit(groups: np.ndarray, n_groups: int, x: np.ndarray, y: np.ndarray, w: np.ndarray):
+    """
+    Weighted least squares y ~ a + b*x per group, from bincount sums.
+    Returns (alpha, beta, weight, identified, mean_x, mean_y) arrays;
+    `identified` is False where x has no variance (beta undetermined).
+    """
+    sw = np.bincount(groups, weights=w, minlength=n_groups)
+    sx = np.bincount(groups, weights=w * x, minlength=n_groups)
+    sy = np.bincount(groups, weights=w * y, minlength=n_groups)
+    sxx = np.bincount(groups, weights=w * x * x, minlength=n_groups)
+    sxy = np.bincount(groups, weights=w * x * y, minlength=n_groups)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean_x = np.where(sw > 0, sx / sw, 0.0)
+        mean_y = np.where(sw > 0, sy / sw, 0.0)
+        var_x = sxx - sw * mean_x * mean_x
+        cov_xy = sxy - sw * mean_x * mean_y
+        identified = var_x > 1e-9 * np.maximum(sw, 1.0)
+        beta = np.where(identified, cov_xy / np.where(identified, var_x, 1.0), 0.0)
+    return mean_y - beta * mean_x, beta, sw, identified, mean_x, mean_y
+
+
+def _shrink(alpha, beta, weight, identified, mean_x, mean_y, parent_beta):
+    """Blend group slopes with their parent's, then re-centre the intercepts."""
+    own = np.where(identified, weight, 0.0)
+    mixed = (own * beta + UPLIFT_SHRINKAGE * parent_beta) / (own + UPLIFT_SHRINKAGE)
+    mixed = np.maximum(mixed, 0.0)  # deeper discounts never lower demand
+    return mean_y - mixed * mean_x, mixed
+
+
+class UpliftModel:
+    def __init__(self, version: str, history: dict, baselines: dict):
+        self.version = version
+
+        product = np.asarray(history["product"], dtype=np.int64)
+        category = np.asarray(history["category"], dtype=np.int64)
+        promo = np.asarray(history["promo_code"], dtype=str)
+        x = np.asarray(history["discount"], dtype=np.float64)
+        y = np.asarray(history["log_lift"], dtype=np.float64)
+        w = np.asarray(history["n"], dtype=np.float64)
+        self.samples = int(w.sum())
+
+        self.products, product_idx = np.unique(product, return_inverse=True)
+        self.categories, category_idx = np.unique(category, return_inverse=True)
+        self.promo_codes, promo_idx = np.unique(promo, return_inverse=True)
+        n_products, n_categories, n_promos = len(self.products), len(self.categories), len(self.promo_codes)
+
+        # Stage 1: promotion-type effects, alternating with per-product fits
+        # (backfitting) so they are not absorbed into the discount slopes.
+        promo_w = np.bincount(promo_idx, weights=w, minlength=n_promos)
+        gamma = np.zeros(n_promos)
+        for _ in range(UPLIFT_BACKFIT_ROUNDS):
+            a_p, b_p, *_ = _weighted_fit(product_idx, n_products, x, y - gamma[promo_idx], w)
+            residual = y - a_p[product_idx] - b_p[product_idx] * x
+            gamma = np.bincount(promo_idx, weights=w * residual, minlength=n_promos) / np.maximum(promo_w, 1.0)
+        no_promo = np.flatnonzero(self.promo_codes == NO_PROMO_CODE)
+        if len(no_promo):
+            gamma = gamma - gamma[no_promo[0]]
+        self.gamma = gamma
+        promo_mask = self.promo_codes != NO_PROMO_CODE
+        self.gamma_default = (
+            float(np.average(gamma[promo_mask], weights=promo_w[promo_mask]))
+            if promo_w[promo_mask].sum() > 0 else 0.0
+        )
+        self.promo_index = {code: i for i, code in enumerate(self.promo_codes.tolist())}
+
+        # Stage 2: discount slopes on promotion-adjusted lift, global -> category -> product.
+        y_adj = y - gamma[promo_idx]
+        zeros = np.zeros(len(y), dtype=np.int64)
+        a_g, b_g, *_ = _weighted_fit(zeros, 1, x, y_adj, w)
+        self.global_alpha, self.global_beta = float(a_g[0]), max(float(b_g[0]), 0.0)
+
+        fit_c = _weighted_fit(category_idx, n_categories, x, y_adj, w)
+        self.category_alpha, self.category_beta = _shrink(*fit_c, self.global_beta)
+        self.category_weight = fit_c[2]
+
+        # Each product's category: the one with most history for it.
+        product_category = np.zeros(n_products, dtype=np.int64)
+        top = np.lexsort((-w, product_idx))
+        first = np.ones(len(top), dtype=bool)
+        first[1:] = product_idx[top][1:] != product_idx[top][:-1]
+        product_category[product_idx[top][first]] = category_idx[top][first]
+        self.product_category = product_category
+
+        fit_p = _weighted_fit(product_idx, n_products, x, y_adj, w)
+        self.product_alpha, self.product_beta = _shrink(*fit_p, self.category_beta[product_category])
+        self.product_weight = fit_p[2]
+        self.product_index = {int(p): i for i, p in enumerate(self.products.tolist())}
+        self.category_index = {int(c): i for i, c in enumerate(self.categories.tolist())}
+
+        # Baseline daily demand (latest roll_mean_14) per store x product and per product.
+        keys = (np.asarray(baselines["store"], dtype=np.int64) << 32) | np.asarray(baselines["product"], dtype=np.int64)
+        order = np.argsort(keys, kind="stable")
+        self.baseline_keys = keys[order]
+        self.baseline_values = np.asarray(baselines["baseline"], dtype=np.float64)[order]
+        codes, inverse = np.unique(np.asarray(baselines["product"], dtype=np.int64), return_inverse=True)
+        sums = np.bincount(inverse, weights=np.asarray(baselines["baseline"], dtype=np.float64), minlength=len(codes))
+        self.product_baseline = dict(zip(codes.tolist(), (sums / np.bincount(inverse, minlength=len(codes))).tolist()))
+
+    def baseline(self, product_code: int, store_code: int | None = None) -> float | None:
+        if store_code is not None:
+            key = (int(store_code) << 32) | int(product_code)
+            pos = int(np.searchsorted(self.baseline_keys, key))
+            if pos < len(self.baseline_keys) and self.baseline_keys[pos] == key:
+                return float(self.baseline_values[pos])
+        return self.product_baseline.get(int(product_code))
+
+    def coefficients(self, product_code: int, category_code: int | None = None) -> tuple[float, float, str, float]:
+        """(alpha, beta, source, samples) for the most specific fitted group."""
+        i = self.product_index.get(int(product_code))
+        if i is not None:
+            return float(self.product_alpha[i]), float(self.product_beta[i]), "product", float(self.product_weight[i])
+        c = self.category_index.get(int(category_code)) if category_code is not None else None
+        if c is not None:
+            return float(self.category_alpha[c]), float(self.category_beta[c]), "category", float(self.category_weight[c])
+        return self.global_alpha, self.global_beta, "global", float(self.samples)
+
+    def estimate(
+        self,
+        product_code: int,
+        discount: float,
+        store_code: int | None = None,
+        promo_code: str | None = None,
+        category_code: int | None = None,
+        days: int = 7,
+    ) -> dict:
+        alpha, beta, source, samples = self.coefficients(product_code, category_code)
+        if promo_code is None:
+            gamma = self.gamma_default
+        elif str(promo_code) == NO_PROMO_CODE:
+            gamma, discount = 0.0, 0.0
+        else:
+            idx = self.promo_index.get(str(promo_code))
+            gamma = float(self.gamma[idx]) if idx is not None else self.gamma_default
+
+        discount = max(0.0, float(discount))
+        uplift = math.exp(beta * discount + gamma)
+        baseline = self.baseline(product_code, store_code)
+        # Model-implied demand without a promotion (alpha corrects roll_mean_14 bias).
+        base_daily = (baseline + 1.0) * math.exp(alpha) - 1.0 if baseline is not None else None
+        base_daily = max(base_daily, 0.0) if base_daily is not None else None
+        expected_daily = (base_daily + 1.0) * uplift - 1.0 if base_daily is not None else None
+
+        return {
+            "productCode": int(product_code),
+            "storeCode": int(store_code) if store_code is not None else None,
+            "promoCode": str(promo_code) if promo_code is not None else None,
+            "discount": discount,
+            "days": int(days),
+            "upliftPct": round((uplift - 1.0) * 100.0, 2),
+            "elasticityPerPoint": round(beta * 100.0, 4),
+            "baselineDaily": round(base_daily, 3) if base_daily is not None else None,
+            "expectedDaily": round(max(expected_daily, 0.0), 3) if expected_daily is not None else None,
+            "expectedUnits": round(max(expected_daily, 0.0) * days, 1) if expected_daily is not None else None,
+            "source": source,
+            "samples": int(samples),
+            "dataVersion": self.version,
+        }
+
+
+def load_uplift_history(client, table_name: str, since) -> dict:
+    query = f"""
+    SELECT
+        toInt64(urunkodu) AS product,
+        toInt64(reyonkodu) AS category,
+        toString(aktifPromosyonKodu) AS promo_code,
+        round(greatest(indirimYuzdesi, 0)) AS discount,
+        count() AS n,
+        avg(log((satismiktari + 1) / (roll_mean_14 + 1))) AS log_lift
+    FROM {table_name}
+    WHERE tarih >= toDate('{since.isoformat()}')
+      AND roll_mean_14 IS NOT NULL
+      AND stok_out = 0
+    GROUP BY product, category, promo_code, discount
+    """
+    names = ("product", "category", "promo_code", "discount", "n", "log_lift")
+    columns = client.query(query).result_columns or [[] for _ in names]
+    return dict(zip(names, columns))
+
+
+def load_baselines(client, table_name: str, as_of) -> dict:
+    query = f"""
+    SELECT
+        toInt64(magazakodu) AS store,
+        toInt64(urunkodu) AS product,
+        greatest(anyLast(ifNull(roll_mean_14, 0)), 0) AS baseline
+    FROM {table_name}
+    WHERE tarih = toDate('{as_of.isoformat()}')
+    GROUP BY store, product
+    """
+    names = ("store", "product", "baseline")
+    columns = client.query(query).result_columns or [[] for _ in names]
+    return dict(zip(names, columns))
+
+
+_models: dict[str, UpliftModel] = {}
+_build_lock = threading.Lock()
+
+
+def get_uplift_model(client, table_name: str) -> UpliftModel:
+    """Return the model for the current data version, refitting it once per change."""
+    version = get_data_version(client, table_name)
+    model = _models.get(table_name)
+    if model is not None and model.version == version:
+        return model
+
+    with _build_lock:
+        model = _models.get(table_name)
+        if model is None or model.version != version:
+            as_of = get_latest_date(client, table_name)
+            history = load_uplift_history(client, table_name, as_of - timedelta(days=UPLIFT_HISTORY_DAYS))
+            baselines = load_baselines(client, table_name, as_of)
+            model = UpliftModel(version, history, baselines)
+            _models[table_name] = model
+    return model
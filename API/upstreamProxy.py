@@ -0,0 +1,317 @@
+"""
+Pooled async HTTP client for the external services proxied by main.py.
+
+Each upstream gets one keep-alive httpx.AsyncClient with connect/read
+timeouts, a concurrency cap (requests beyond it queue for a bounded time and
+then fail with 503), and a TTL/LRU result cache keyed on the normalized JSON
+payload, so identical what-if scenarios are answered without a round trip.
+Concurrent identical requests are coalesced into one upstream call, and
+callers can schedule background prefetches (e.g. the next result page).
+
+Resilience: when a call is still running after the upstream's recent p95
+latency, a hedged second request is sent (if a connection slot is free) and
+the first good answer wins. A circuit breaker opens on error or slow-call
+spikes; while it is open, requests are answered from cache (stale entries
+included) or fail fast with 503 instead of waiting for the socket timeout.
+"""
+
+import asyncio
+import hashlib
+import json
+import math
+import os
+import time
+
+import httpx
+
+from apiCache import SnapshotCache
+from upstreamResilience import CircuitBreaker, LatencyHistogram
+
+
+class UpstreamError(Exception):
+    """Upstream failure mapped to an HTTP status for the proxy response."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def _normalize(value):
+    if isinstance(value, float):
+        if not math.isfinite(value):
+            return None
+        # 0.1 + 0.2 and 0.3 should share a cache entry.
+        return round(value, 6) if value != int(value) else int(value)
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, dict):
+        return {str(k): _normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def payload_key(payload: dict) -> str:
+    """Stable cache key for a JSON payload (key order and float noise ignored)."""
+    canonical = json.dumps(_normalize(payload), sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+class UpstreamClient:
+    def __init__(
+        self,
+        name: str,
+        url: str,
+        max_concurrency: int = 8,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 30.0,
+        queue_timeout: float = 10.0,
+        cache_mb: int = 16,
+        cache_ttl_seconds: float = 3600,
+        hedge_quantile: float = 0.95,
+        hedge_min_samples: int = 20,
+        hedge_min_delay: float = 0.05,
+        breaker: CircuitBreaker | None = None,
+    ):
+        self.name = name
+        self.url = url
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.queue_timeout = float(queue_timeout)
+        self.cache = SnapshotCache(
+            max_bytes=int(cache_mb) * 1024 * 1024,
+            ttl_seconds=cache_ttl_seconds,
+            name=f"upstream_{name.lower()}",
+        )
+        self._client: httpx.AsyncClient | None = None
+        self._retired: list[httpx.AsyncClient] = []
+        self._semaphore: asyncio.Semaphore | None = None
+        self._loop = None
+        self._inflight: dict = {}
+        self._background: set = set()
+
+        self.hedge_quantile = float(hedge_quantile)  # 0 disables hedging
+        self.hedge_min_samples = int(hedge_min_samples)
+        self.hedge_min_delay = float(hedge_min_delay)
+        self.latency = LatencyHistogram()
+        self.breaker = breaker or CircuitBreaker(slow_call_seconds=read_timeout / 2)
+        self.hedges_sent = 0
+        self.hedges_won = 0
+        self.fast_failures = 0
+        self.stale_served = 0
+
+    def _bind_loop(self):
+        # The pool and semaphore belong to one event loop; rebuild them if the
+        # running loop changed (e.g. test clients that start a loop per call).
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._client is None or self._client.is_closed:
+            self._retire(self._client, self._loop)
+            self._loop = loop
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency,
+                ),
+                headers={"Content-Type": "application/json"},
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._inflight = {}
+            self._background = set()
+        return self._client, self._semaphore
+
+    def _retire(self, client: httpx.AsyncClient | None, loop):
+        """Close the pool of a previous event loop instead of leaking it."""
+        if client is None or client.is_closed:
+            return
+        if loop is not None and loop.is_running() and loop is not asyncio.get_running_loop():
+            # Still alive on another thread: close it there.
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+        elif loop is not None and not loop.is_closed():
+            # Stopped but reusable: close it with the others in aclose().
+            self._retired.append(client)
+        # A closed loop cannot run aclose(); its sockets are released when the client is collected.
+
+    async def _attempt(self, http: httpx.AsyncClient, slots: asyncio.Semaphore, body: bytes):
+        """One upstream POST, holding a connection slot for its duration."""
+        try:
+            await asyncio.wait_for(slots.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise UpstreamError(503, f"{self.name} service is busy, try again")
+
+        started = time.perf_counter()
+        try:
+            response = await http.post(self.url, content=body)
+        except httpx.TimeoutException as e:
+            raise UpstreamError(504, f"{self.name} service timed out: {type(e).__name__}")
+        except httpx.HTTPError as e:
+            raise UpstreamError(502, f"{self.name} service connection failed: {e}")
+        finally:
+            slots.release()
+        self.latency.observe(time.perf_counter() - started)
+
+        if response.status_code >= 400:
+            raise UpstreamError(response.status_code or 502, response.text or response.reason_phrase)
+        if not response.content:
+            return {"status": "ok"}
+        try:
+            return response.json()
+        except ValueError as e:
+            raise UpstreamError(502, f"{self.name} service returned invalid JSON: {e}")
+
+    def hedge_delay(self) -> float | None:
+        """Seconds to wait before hedging, or None while hedging is off or unwarmed."""
+        if self.hedge_quantile <= 0 or self.latency.recent_count < self.hedge_min_samples:
+            return None
+        p = self.latency.quantile(self.hedge_quantile)
+        return None if p is None else max(self.hedge_min_delay, p)
+
+    async def _send(self, payload: dict):
+        if not self.breaker.allow():
+            self.fast_failures += 1
+            raise UpstreamError(503, f"{self.name} service is temporarily unavailable, try again shortly")
+
+        started = time.perf_counter()
+        failed = False
+        try:
+            return await self._send_hedged(payload)
+        except UpstreamError as e:
+            # Client errors say nothing about upstream health.
+            failed = e.status_code >= 500 or e.status_code == 429
+            raise
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self.breaker.record(failed, time.perf_counter() - started)
+
+    async def _send_hedged(self, payload: dict):
+        http, slots = self._bind_loop()
+        body = json.dumps(payload).encode("utf-8")
+        delay = self.hedge_delay()
+        if delay is None:
+            return await self._attempt(http, slots, body)
+
+        primary = asyncio.ensure_future(self._attempt(http, slots, body))
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            # Hedge only with a free slot, so hedges never queue behind real traffic.
+            if done or slots.locked():
+                return await primary
+
+            self.hedges_sent += 1
+            tasks.append(asyncio.ensure_future(self._attempt(http, slots, body)))
+            pending, error = set(tasks), None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        self.hedges_won += task is not primary
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def _fetch(self, key: str, payload: dict):
+        return self.cache.put(key, await self._send(payload))
+
+    async def post_json(self, payload: dict, use_cache: bool = True, key_payload: dict | None = None):
+        """
+        POST `payload`; successful responses are cached on the normalized payload.
+        Callers asking for a payload that is already in flight share its result.
+        `key_payload`, when given, replaces `payload` for the cache/coalescing key
+        only (e.g. a case-folded search), while `payload` is sent unchanged.
+        """
+        if not use_cache:
+            return await self._send(payload)
+
+        key = payload_key(payload if key_payload is None else key_payload)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        if self.breaker.state != CircuitBreaker.CLOSED:
+            stale = self.cache.get(key, stale_ok=True)
+            if stale is not None:
+                self.stale_served += 1
+                return stale
+
+        self._bind_loop()
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._fetch(key, payload))
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # shield: a cancelled caller must not cancel the shared upstream call.
+        return await asyncio.shield(future)
+
+    def prefetch(self, payload: dict, key_payload: dict | None = None):
+        """Warm the cache for `payload` in the background; errors are ignored."""
+        key = payload_key(payload if key_payload is None else key_payload)
+        self._bind_loop()
+        if key in self._inflight or self.cache.get(key) is not None:
+            return
+        task = asyncio.ensure_future(self.post_json(payload, key_payload=key_payload))
+        self._background.add(task)
+
+        def done(t):
+            self._background.discard(t)
+            if not t.cancelled():
+                t.exception()
+
+        task.add_done_callback(done)
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "latency": self.latency.snapshot(),
+            "hedgeDelayMs": round(1000 * d, 2) if (d := self.hedge_delay()) is not None else None,
+            "hedgesSent": self.hedges_sent,
+            "hedgesWon": self.hedges_won,
+            "breaker": self.breaker.snapshot(),
+            "fastFailures": self.fast_failures,
+            "staleServed": self.stale_served,
+            "cache": self.cache.stats(),
+        }
+
+    async def aclose(self):
+        retired, self._retired = self._retired, []
+        for client in retired:
+            try:
+                await client.aclose()
+            except RuntimeError:
+                # Its connections are bound to a loop that has since gone away.
+                pass
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+def upstream_from_env(name: str, url: str, prefix: str, **defaults) -> UpstreamClient:
+    """Build an UpstreamClient with `{prefix}_*` environment overrides."""
+
+    def env(key: str, default):
+        return type(default)(os.getenv(f"{prefix}_{key}", str(default)))
+
+    read_timeout = env("READ_TIMEOUT", defaults.get("read_timeout", 30.0))
+
+    return UpstreamClient(
+        name,
+        url,
+        max_concurrency=env("MAX_CONCURRENCY", defaults.get("max_concurrency", 8)),
+        connect_timeout=env("CONNECT_TIMEOUT", defaults.get("connect_timeout", 5.0)),
+        read_timeout=read_timeout,
+        queue_timeout=env("QUEUE_TIMEOUT", defaults.get("queue_timeout", 10.0)),
+        cache_mb=env("CACHE_MB", defaults.get("cache_mb", 16)),
+        cache_ttl_seconds=env("CACHE_TTL_SECONDS", defaults.get("cache_ttl_seconds", 3600.0)),
+        hedge_quantile=env("HEDGE_QUANTILE", defaults.get("hedge_quantile", 0.95)),
+        breaker=CircuitBreaker(
+            failure_ratio=env("BREAKER_FAILURE_RATIO", defaults.get("breaker_failure_ratio", 0.5)),
+            slow_call_seconds=env("BREAKER_SLOW_SECONDS", defaults.get("breaker_slow_seconds", read_timeout / 2)),
+            cooldown_seconds=env("BREAKER_COOLDOWN_SECONDS", defaults.get("breaker_cooldown_seconds", 15.0)),
+        ),
+    )
@@ -0,0 +1,153 @@
+"""
+Latency histograms and circuit breakers for the proxied upstream services.
+
+LatencyHistogram keeps log-spaced buckets (about 19% wide, 1 ms to 60 s) with
+two sets of counts: lifetime totals for reporting, and a recent view that is
+halved every `decay_every` observations so quantiles follow the upstream's
+current behaviour. The recent p95 is what UpstreamClient uses as its hedge
+delay.
+
+CircuitBreaker looks at the last `window` calls and opens when too many of
+them failed or were slow. While open, calls fail fast (or are answered from
+cache by the caller); after `cooldown_seconds` one probe call is let through,
+and its outcome closes or re-opens the breaker.
+"""
+
+import bisect
+import threading
+import time
+from collections import deque
+
+# Upper bounds in seconds: 1 ms * 2^(k/4), up to ~65 s.
+LATENCY_BUCKETS = tuple(0.001 * 2 ** (k / 4) for k in range(65))
+
+
+class LatencyHistogram:
+    def __init__(self, decay_every: int = 1000):
+        self.decay_every = max(1, int(decay_every))
+        self.totals = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.recent = [0.0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._recent_count = 0.0
+        self._since_decay = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        bucket = bisect.bisect_left(LATENCY_BUCKETS, seconds)
+        with self._lock:
+            self.totals[bucket] += 1
+            self.recent[bucket] += 1
+            self.count += 1
+            self.sum += seconds
+            self._recent_count += 1
+            self._since_decay += 1
+            if self._since_decay >= self.decay_every:
+                self.recent = [c / 2 for c in self.recent]
+                self._recent_count /= 2
+                self._since_decay = 0
+
+    @property
+    def recent_count(self) -> float:
+        return self._recent_count
+
+    def quantile(self, q: float, recent: bool = True) -> float | None:
+        """Quantile in seconds, interpolated inside its bucket; None without data."""
+        with self._lock:
+            counts = list(self.recent if recent else self.totals)
+        total = sum(counts)
+        if total <= 0:
+            return None
+        target = q * total
+        seen = 0.0
+        for i, c in enumerate(counts):
+            if c and seen + c >= target:
+                lower = LATENCY_BUCKETS[i - 1] if i > 0 else 0.0
+                upper = LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else LATENCY_BUCKETS[-1]
+                return lower + (upper - lower) * (target - seen) / c
+            seen += c
+        return LATENCY_BUCKETS[-1]
+
+    def snapshot(self) -> dict:
+        quantiles = {f"p{int(q * 100)}": self.quantile(q) for q in (0.5, 0.95, 0.99)}
+        return {
+            "count": self.count,
+            "meanMs": round(1000 * self.sum / self.count, 2) if self.count else None,
+            **{k: round(1000 * v, 2) if v is not None else None for k, v in quantiles.items()},
+        }
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        window: int = 20,
+        min_calls: int = 10,
+        failure_ratio: float = 0.5,
+        slow_call_seconds: float = 10.0,
+        slow_ratio: float = 0.5,
+        cooldown_seconds: float = 15.0,
+    ):
+        self.window = max(1, int(window))
+        self.min_calls = max(1, int(min_calls))
+        self.failure_ratio = float(failure_ratio)
+        self.slow_call_seconds = float(slow_call_seconds)
+        self.slow_ratio = float(slow_ratio)
+        self.cooldown_seconds = float(cooldown_seconds)
+
+        self.state = self.CLOSED
+        self.opened_at = 0.0
+        self.trips = 0
+        self._outcomes: deque = deque(maxlen=self.window)  # (failed, slow)
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a call may go upstream now; claims the probe slot when half-open."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.cooldown_seconds:
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record(self, failed: bool, seconds: float):
+        slow = seconds >= self.slow_call_seconds
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._probe_in_flight = False
+                if failed or slow:
+                    self._open()
+                else:
+                    self.state = self.CLOSED
+                    self._outcomes.clear()
+                return
+
+            self._outcomes.append((failed, slow))
+            if self.state != self.CLOSED or len(self._outcomes) < self.min_calls:
+                return
+            n = len(self._outcomes)
+            failures = sum(1 for f, _ in self._outcomes if f)
+            slow_calls = sum(1 for _, s in self._outcomes if s)
+            if failures / n >= self.failure_ratio or slow_calls / n >= self.slow_ratio:
+                self._open()
+
+    def _open(self):
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+        self.trips += 1
+        self._outcomes.clear()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            retry_in = None
+            if self.state == self.OPEN:
+                retry_in = round(max(0.0, self.cooldown_seconds - (time.monotonic() - self.opened_at)), 2)
+            return {"state": self.state, "trips": self.trips, "retryInSeconds": retry_in}
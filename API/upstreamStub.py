@@ -0,0 +1,169 @@
+"""
+Local stand-in for the prediction and market search services.
+
+Used for smoke tests and benchmarks of the proxies in main.py without the real
+upstreams. Point the app at it with
+
+    PREDICTION_API_URL=http://127.0.0.1:8765/predict
+    MARKET_SEARCH_API_URL=http://127.0.0.1:8765/search
+
+and run `python upstreamStub.py --port 8765 --delay-ms 200`. Delay, jitter,
+tail latency (a share of requests that take `slow_ms`) and error rate are
+adjustable per server, also while it runs (they are plain attributes of the
+returned StubState), and every request is counted so benchmarks can check how
+many calls actually reached the upstream.
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubState:
+    def __init__(
+        self,
+        delay_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        slow_rate: float = 0.0,
+        slow_ms: float = 0.0,
+        error_rate: float = 0.0,
+        total_found: int = 95,
+    ):
+        self.delay_ms = delay_ms
+        self.jitter_ms = jitter_ms
+        self.slow_rate = slow_rate
+        self.slow_ms = slow_ms
+        self.error_rate = error_rate
+        self.total_found = total_found
+        self.calls: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, path: str):
+        with self._lock:
+            self.calls[path] = self.calls.get(path, 0) + 1
+
+
+STUB_BASE_PRICE = 10.0
+STUB_UNIT_COST = 7.0
+
+
+def _predict_response(body: dict) -> dict:
+    """Daily `forecast` rows for a PredictDemandRequest, from a constant-elasticity demand curve."""
+    if body.get("istenenFiyat") is not None:
+        price = float(body["istenenFiyat"])
+    elif body.get("istenenMarj") is not None:
+        price = STUB_UNIT_COST * (1.0 + float(body["istenenMarj"]) / 100.0)
+    else:
+        price = STUB_BASE_PRICE * (1.0 - float(body.get("istenenIndirim") or 0.0) / 100.0)
+    price = max(price, 0.01)
+    demand = 20.0 * (STUB_BASE_PRICE / price) ** 2.5
+    try:
+        start = date.fromisoformat(str(body.get("tarihBaslangic")))
+        end = date.fromisoformat(str(body.get("tarihBitis")))
+    except ValueError:
+        start = end = date.today()
+    days = max(1, min((end - start).days + 1, 366))
+    return {
+        "forecast": [
+            {
+                "tarih": (start + timedelta(days=d)).isoformat(),
+                "tahmin": round(demand, 2),
+                "satisFiyati": round(price, 2),
+                "ciro": round(demand * price, 2),
+                "gunluk_kar": round(demand * (price - STUB_UNIT_COST), 2),
+            }
+            for d in range(days)
+        ]
+    }
+
+
+def _search_response(body: dict, total_found: int) -> dict:
+    page = int(body.get("page") or 0)
+    size = int(body.get("size") or 10)
+    start = page * size
+    results = [
+        {"name": f"{body.get('query', '')} #{i + 1}", "market": "stub", "price": round(10 + i * 0.5, 2)}
+        for i in range(start, min(start + size, total_found))
+    ]
+    return {"total_found": total_found, "analysis": {"page": page}, "results": results}
+
+
+def _handler(state: StubState):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            try:
+                body = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError:
+                body = {}
+            state.record(self.path)
+
+            delay = state.delay_ms + random.uniform(0, state.jitter_ms)
+            if random.random() < state.slow_rate:
+                delay += state.slow_ms
+            if delay > 0:
+                time.sleep(delay / 1000.0)
+
+            if random.random() < state.error_rate:
+                self._send(500, {"error": "injected failure"})
+            elif self.path.startswith("/predict"):
+                self._send(200, _predict_response(body))
+            elif self.path.startswith("/search"):
+                self._send(200, _search_response(body, state.total_found))
+            else:
+                self._send(404, {"error": f"unknown path {self.path}"})
+
+        def _send(self, status: int, payload: dict):
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            try:
+                self.end_headers()
+                self.wfile.write(data)
+            except (BrokenPipeError, ConnectionResetError):
+                # Losing hedged requests are cancelled by the client mid-flight.
+                pass
+
+    return Handler
+
+
+def start_stub_server(port: int = 0, **settings) -> tuple[ThreadingHTTPServer, StubState]:
+    """Serve the stub on a daemon thread; port 0 picks a free port (see server.server_port)."""
+    state = StubState(**settings)
+    server = ThreadingHTTPServer(("127.0.0.1", port), _handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stub prediction/market search upstream")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--delay-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--slow-rate", type=float, default=0.0)
+    parser.add_argument("--slow-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server, _ = start_stub_server(
+        args.port,
+        delay_ms=args.delay_ms,
+        jitter_ms=args.jitter_ms,
+        slow_rate=args.slow_rate,
+        slow_ms=args.slow_ms,
+        error_rate=args.error_rate,
+    )
+    print(f"Stub upstream listening on http://127.0.0.1:{server.server_port} (/predict, /search)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
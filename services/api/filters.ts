@@ -5,9 +5,15 @@
 import { apiClient } from './client';
 import type {
   RegionsHierarchyResponse,
+  HierarchyRegionsResponse,
+  HierarchyStoresResponse,
+  HierarchyCategoriesResponse,
+  HierarchyProductsResponse,
   StoreFlat,
   CategoryFlat,
   ProductFlat,
+  ProductSearchResult,
+  FilterOptionsResponse,
   Reyon,
 } from '../types/api';
 
@@ -17,6 +23,41 @@ export const filtersApi = {
    */
   getHierarchy: () => apiClient.get<RegionsHierarchyResponse>('/api/hierarchy'),
 
+  /**
+   * Lazy hierarchy: regions with counts
+   */
+  getHierarchyRegions: () =>
+    apiClient.get<HierarchyRegionsResponse>('/api/hierarchy/regions'),
+
+  /**
+   * Lazy hierarchy: stores of a region
+   */
+  getHierarchyStores: (region: string) =>
+    apiClient.get<HierarchyStoresResponse>(
+      `/api/hierarchy/regions/${encodeURIComponent(region)}/stores`,
+    ),
+
+  /**
+   * Lazy hierarchy: categories of a store
+   */
+  getHierarchyCategories: (storeKey: string) =>
+    apiClient.get<HierarchyCategoriesResponse>(
+      `/api/hierarchy/stores/${encodeURIComponent(storeKey)}/categories`,
+    ),
+
+  /**
+   * Lazy hierarchy: a page of products of a store category
+   */
+  getHierarchyProducts: (
+    storeKey: string,
+    categoryCode: string,
+    params?: { offset?: number; limit?: number },
+  ) =>
+    apiClient.get<HierarchyProductsResponse>(
+      `/api/hierarchy/stores/${encodeURIComponent(storeKey)}/categories/${encodeURIComponent(categoryCode)}/products`,
+      params,
+    ),
+
   /**
    * Get flat list of stores, optionally filtered by regions
    */
@@ -30,13 +71,41 @@ export const filtersApi = {
     apiClient.get<{ categories: CategoryFlat[] }>('/api/categories', params),
 
   /**
-   * Get flat list of products, optionally filtered by regions/stores/categories
+   * Get flat list of products, optionally filtered by regions/stores/categories.
+   * Large lists are paginated: pass nextCursor back as cursor for the next page.
    */
   getProducts: (params?: {
     regionIds?: string[];
     storeIds?: string[];
     categoryIds?: string[];
-  }) => apiClient.get<{ products: ProductFlat[] }>('/api/products', params),
+    search?: string;
+    limit?: number;
+    cursor?: string;
+  }) =>
+    apiClient.get<{ products: ProductFlat[]; nextCursor: string | null }>(
+      '/api/products',
+      params,
+    ),
+
+  /**
+   * Typeahead product search (Turkish-aware, ranked)
+   */
+  searchProducts: (q: string, limit?: number) =>
+    apiClient.get<{ products: ProductSearchResult[] }>('/api/products/search', {
+      q,
+      limit,
+    }),
+
+  /**
+   * Get valid options and counts for every filter level for a partial selection
+   */
+  getFilterOptions: (params?: {
+    regionIds?: string[];
+    storeIds?: string[];
+    categoryIds?: string[];
+    productIds?: string[];
+    productLimit?: number;
+  }) => apiClient.get<FilterOptionsResponse>('/api/filters/options', params),
 
   /**
    * Get list of reyonlar (departments)
@@ -9,7 +9,12 @@ import type {
   PromotionCalendarEvent,
   ProductPromotionOption,
   PredictDemandRequest,
+  PredictSweepRequest,
+  PredictSweepResponse,
+  QuickEstimateResponse,
   CampaignDetailSeriesResponse,
+  CampaignDetailSeriesBatchRequest,
+  CampaignDetailSeriesBatchResponse,
 } from '../types/api';
 
 export const forecastingApi = {
@@ -22,8 +27,14 @@ export const forecastingApi = {
     regionIds?: string[];
     categoryIds?: string[];
     limit?: number;
+    sortBy?: 'date' | 'uplift' | 'accuracy';
+    sortOrder?: 'asc' | 'desc';
+    cursor?: string;
   }) =>
-    apiClient.get<{ history: PromotionHistory[] }>(
+    apiClient.get<{
+      history: PromotionHistory[];
+      pagination: { limit: number; total: number; nextCursor: string | null };
+    }>(
       '/api/forecast/promotion-history',
       params,
     ),
@@ -38,6 +49,10 @@ export const forecastingApi = {
     regionIds?: string[];
     categoryIds?: string[];
     limit?: number;
+    campaignId?: string;
+    discount?: number;
+    durationDays?: number;
+    startDate?: string;
   }) =>
     apiClient.get<{ campaigns: SimilarCampaign[] }>(
       '/api/forecast/similar-campaigns',
@@ -61,6 +76,22 @@ export const forecastingApi = {
       params,
     ),
 
+  /**
+   * Get promotion calendar for a range of months (YYYY-MM), grouped per month
+   */
+  getPromotionCalendarRange: (params: {
+    fromMonth: string;
+    toMonth: string;
+    storeIds?: string[];
+    regionIds?: string[];
+    categoryIds?: string[];
+    includeFuture?: boolean;
+    futureCount?: number;
+  }) =>
+    apiClient.get<{
+      months: { year: number; month: number; events: PromotionCalendarEvent[] }[];
+    }>('/api/forecast/calendar-range', params),
+
   /**
    * Get only previously used promotions for selected store + product
    */
@@ -80,6 +111,25 @@ export const forecastingApi = {
   predictDemand: (payload: PredictDemandRequest) =>
     apiClient.post<Record<string, unknown>>('/api/forecast/predict-demand', payload),
 
+  /**
+   * Demand/revenue curve over a grid of discounts, margins or prices
+   */
+  predictSweep: (payload: PredictSweepRequest) =>
+    apiClient.post<PredictSweepResponse>('/api/forecast/predict-sweep', payload),
+
+  /**
+   * Local uplift estimate for interactive discount controls (no remote model call)
+   */
+  getQuickEstimate: (params: {
+    productCode: number;
+    discount: number;
+    storeCode?: number;
+    promoCode?: string;
+    categoryCode?: number;
+    days?: number;
+  }) =>
+    apiClient.get<QuickEstimateResponse>('/api/forecast/quick-estimate', params),
+
   /**
    * Get real daily series for selected campaign row popup
    */
@@ -97,4 +147,13 @@ export const forecastingApi = {
       '/api/forecast/campaign-detail-series',
       params,
     ),
+
+  /**
+   * Get daily series and KPI summaries for many campaigns in one request
+   */
+  getCampaignDetailSeriesBatch: (payload: CampaignDetailSeriesBatchRequest) =>
+    apiClient.post<CampaignDetailSeriesBatchResponse>(
+      '/api/forecast/campaign-detail-series/batch',
+      payload,
+    ),
 };
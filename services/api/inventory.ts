@@ -30,6 +30,7 @@ export const inventoryApi = {
       PaginationParams & {
         status?: 'In Stock' | 'Low Stock' | 'Out of Stock' | 'Overstock';
         days?: number;
+        search?: string;
       },
   ) =>
     apiClient.get<PaginatedResponse<InventoryItem>>(
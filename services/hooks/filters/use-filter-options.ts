@@ -1,7 +1,8 @@
-import { useRegionsHierarchy } from './use-regions-hierarchy';
-import { useStores } from './use-stores';
-import { useCategories } from './use-categories';
-import { useProducts } from './use-products';
+'use client';
+
+import { useQuery } from '@tanstack/react-query';
+import { filtersApi } from '../../api/filters';
+import type { FilterOptionLevel } from '../../types/api';
 import { useMemo } from 'react';
 
 interface UseFilterOptionsParams {
@@ -15,6 +16,23 @@ interface FilterOption {
   label: string;
 }
 
+// Upper bound of /api/filters/options productLimit; the dropdown lists every product.
+const PRODUCT_OPTION_LIMIT = 50000;
+
+function toOptions(level?: FilterOptionLevel): FilterOption[] {
+  return (level?.options ?? [])
+    .filter((option) => option?.value && option?.label) // Filter out invalid entries
+    .map((option) => ({
+      value: option.value,
+      label: option.label,
+    }));
+}
+
+/**
+ * Options for every filter level in one `/api/filters/options` call.
+ * Each level is narrowed by the selections on the other levels; values are
+ * bare codes (region, store, category and product codes).
+ */
 export function useFilterOptions(params: UseFilterOptionsParams = {}) {
   const {
     selectedRegions = [],
@@ -22,110 +40,23 @@ export function useFilterOptions(params: UseFilterOptionsParams = {}) {
     selectedCategories = [],
   } = params;
 
-  // Fetch regions (always available)
-  const { data: regionsData, isLoading: regionsLoading } =
-    useRegionsHierarchy();
-
-  // Fetch stores based on selected regions
-  const { data: storesData, isLoading: storesLoading } = useStores({
-    regionIds: selectedRegions.length > 0 ? selectedRegions : undefined,
-  });
-
-  // Fetch categories based on selected regions/stores
-  const { data: categoriesData, isLoading: categoriesLoading } = useCategories({
-    regionIds: selectedRegions.length > 0 ? selectedRegions : undefined,
-    storeIds: selectedStores.length > 0 ? selectedStores : undefined,
-  });
-
-  // Fetch products based on all filters
-  const { data: productsData, isLoading: productsLoading } = useProducts({
+  const requestParams = {
     regionIds: selectedRegions.length > 0 ? selectedRegions : undefined,
     storeIds: selectedStores.length > 0 ? selectedStores : undefined,
     categoryIds: selectedCategories.length > 0 ? selectedCategories : undefined,
-  });
-
-  // Transform API data to filter options format with safety checks
-  const regionOptions: FilterOption[] = useMemo(() => {
-    return (regionsData?.regions ?? [])
-      .filter((region) => region?.value && region?.label) // Filter out invalid entries
-      .map((region) => ({
-        value: region.value,
-        label: region.label,
-      }));
-  }, [regionsData]);
-
-  const storeOptions: FilterOption[] = useMemo(() => {
-    return (storesData?.stores ?? [])
-      .filter((store) => {
-        const isValid = store?.value && store?.label;
-        if (!isValid) {
-          console.warn('⚠️ Invalid store entry:', store);
-        }
-        return isValid;
-      })
-      .map((store) => ({
-        value: store.value,
-        label: store.label,
-      }));
-  }, [storesData]);
-
-  const categoryOptions: FilterOption[] = useMemo(() => {
-    const categories = (categoriesData?.categories ?? []).filter(
-      (category) => category?.value && category?.label,
-    ); // Filter out invalid entries
-
-    // Deduplicate by extracting unique category codes
-    // Format is "storeId_categoryId", we want unique categoryIds
-    const uniqueCategories = new Map<string, FilterOption>();
-
-    categories.forEach((category) => {
-      // Extract category code from "storeId_categoryId" format
-      const categoryCode = category.value.includes('_')
-        ? category.value.split('_')[1]
-        : category.value;
-
-      // Only add if we haven't seen this category code before
-      if (!uniqueCategories.has(categoryCode)) {
-        uniqueCategories.set(categoryCode, {
-          value: categoryCode,
-          label: category.label,
-        });
-      }
-    });
-
-    return Array.from(uniqueCategories.values());
-  }, [categoriesData]);
-
-  const productOptions: FilterOption[] = useMemo(() => {
-    const products = (productsData?.products ?? []).filter(
-      (product) => product?.value && product?.label,
-    ); // Filter out invalid entries
-
-    // Deduplicate by extracting unique product codes
-    // Format is "storeId_categoryId_productId", we want unique productIds
-    const uniqueProducts = new Map<string, FilterOption>();
-
-    products.forEach((product) => {
-      // Extract product code (last part after underscore)
-      // e.g., "1055_101_3001" -> "3001"
-      const productCode = product.value.includes('_')
-        ? product.value.split('_').pop()!
-        : product.value;
-
-      // Only add if we haven't seen this product code before
-      if (!uniqueProducts.has(productCode)) {
-        uniqueProducts.set(productCode, {
-          value: productCode,
-          label: product.label,
-        });
-      }
-    });
+    productLimit: PRODUCT_OPTION_LIMIT,
+  };
 
-    return Array.from(uniqueProducts.values());
-  }, [productsData]);
+  const { data, isLoading } = useQuery({
+    queryKey: ['filter-options', requestParams],
+    queryFn: () => filtersApi.getFilterOptions(requestParams),
+    staleTime: 1000 * 60 * 5, // 5 minutes
+  });
 
-  const isLoading =
-    regionsLoading || storesLoading || categoriesLoading || productsLoading;
+  const regionOptions = useMemo(() => toOptions(data?.regions), [data]);
+  const storeOptions = useMemo(() => toOptions(data?.stores), [data]);
+  const categoryOptions = useMemo(() => toOptions(data?.categories), [data]);
+  const productOptions = useMemo(() => toOptions(data?.products), [data]);
 
   return {
     regionOptions,
@@ -9,6 +9,9 @@ interface UsePromotionHistoryParams {
   regionIds?: string[];
   categoryIds?: string[];
   limit?: number;
+  sortBy?: 'date' | 'uplift' | 'accuracy';
+  sortOrder?: 'asc' | 'desc';
+  cursor?: string;
   enabled?: boolean;
 }
 
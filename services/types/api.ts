@@ -40,6 +40,80 @@ export interface RegionsHierarchyResponse {
   regions: Region[];
 }
 
+// Lazy hierarchy (one level per request)
+export interface RegionNode {
+  value: string;
+  label: string;
+  storeCount: number;
+  categoryCount: number;
+  productCount: number;
+}
+
+export interface StoreNode {
+  value: string;
+  label: string;
+  categoryCount: number;
+  productCount: number;
+}
+
+export interface CategoryNode {
+  value: string;
+  label: string;
+  code: string;
+  productCount: number;
+}
+
+export interface HierarchyRegionsResponse {
+  version: string;
+  asOf: string;
+  regions: RegionNode[];
+}
+
+export interface HierarchyStoresResponse {
+  version: string;
+  region: string;
+  stores: StoreNode[];
+}
+
+export interface HierarchyCategoriesResponse {
+  version: string;
+  store: string;
+  categories: CategoryNode[];
+}
+
+export interface HierarchyProductsResponse {
+  version: string;
+  store: string;
+  category: string;
+  products: Product[];
+  pagination: { offset: number; limit: number; total: number };
+}
+
+export interface FilterOption {
+  value: string;
+  label: string;
+  count: number;
+}
+
+export interface FilterOptionLevel {
+  total: number;
+  options: FilterOption[];
+}
+
+export interface FilterOptionsResponse {
+  version: string;
+  regions: FilterOptionLevel;
+  stores: FilterOptionLevel;
+  categories: FilterOptionLevel;
+  products: FilterOptionLevel;
+}
+
+export interface ProductSearchResult {
+  value: string;
+  label: string;
+  score: number;
+}
+
 // Flat list types
 export interface StoreFlat {
   value: string;
@@ -108,6 +182,7 @@ export interface StockTrend {
   actualStock: number;
   forecastDemand: number;
   safetyStock: number;
+  stockoutSkus?: number;
   isProjected?: boolean;
 }
 
@@ -261,6 +336,34 @@ export interface CampaignDetailSeriesResponse {
   summary: CampaignDetailSeriesSummary;
 }
 
+export interface CampaignDetailSeriesKey {
+  storeCode: number;
+  productCode: number;
+  promoCode: string;
+  eventDate: string;
+  campaignStartDate?: string;
+  campaignEndDate?: string;
+  windowDaysBefore?: number;
+  windowDaysAfter?: number;
+}
+
+export interface CampaignDetailSeriesBatchRequest {
+  campaigns: CampaignDetailSeriesKey[];
+}
+
+export interface CampaignDetailSeriesBatchItem extends CampaignDetailSeriesResponse {
+  storeCode: number;
+  productCode: number;
+  promoCode: string;
+  eventDate: string;
+  startDate: string;
+  endDate: string;
+}
+
+export interface CampaignDetailSeriesBatchResponse {
+  campaigns: CampaignDetailSeriesBatchItem[];
+}
+
 export interface SimilarCampaign {
   id: string;
   name: string;
@@ -275,6 +378,10 @@ export interface SimilarCampaign {
   sellThrough: number;
   markdownCost: number;
   similarityScore: number;
+  startDate?: string;
+  endDate?: string;
+  storeCode?: number;
+  promoCode?: string;
 }
 
 export interface PromotionCalendarEvent {
@@ -309,6 +416,47 @@ export interface PredictDemandRequest {
   istenenFiyat: number | null;
 }
 
+export interface PredictSweepRequest {
+  base: PredictDemandRequest;
+  discounts?: number[];
+  margins?: number[];
+  prices?: number[];
+  objective?: 'revenue' | 'profit' | 'demand';
+}
+
+export interface PredictSweepPoint {
+  value: number;
+  demand?: number;
+  revenue?: number;
+  profit?: number;
+  prediction?: Record<string, unknown>;
+  error?: string;
+  status?: number;
+}
+
+export interface PredictSweepResponse {
+  field: 'istenenIndirim' | 'istenenMarj' | 'istenenFiyat';
+  objective: 'revenue' | 'profit' | 'demand';
+  points: PredictSweepPoint[];
+  best: PredictSweepPoint;
+}
+
+export interface QuickEstimateResponse {
+  productCode: number;
+  storeCode: number | null;
+  promoCode: string | null;
+  discount: number;
+  days: number;
+  upliftPct: number;
+  elasticityPerPoint: number;
+  baselineDaily: number | null;
+  expectedDaily: number | null;
+  expectedUnits: number | null;
+  source: 'product' | 'category' | 'global';
+  samples: number;
+  dataVersion: string;
+}
+
 export interface MarketSearchRequest {
   query: string;
   storeId: string;
@@ -433,6 +581,7 @@ export interface PaginationParams {
   limit?: number;
   sortBy?: string;
   sortOrder?: 'asc' | 'desc';
+  cursor?: string;
 }
 
 export interface PaginatedResponse<T> {
@@ -442,5 +591,6 @@ export interface PaginatedResponse<T> {
     page: number;
     limit: number;
     totalPages: number;
+    nextCursor?: string | null;
   };
 }